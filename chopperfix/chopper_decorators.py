@@ -1,137 +1,474 @@
+import atexit
+import inspect
+import threading
 from functools import wraps  # Importa el decorador 'wraps' para mantener la metadata de la función original
 from learning.pattern_storage import PatternStorage  # Importa la clase 'PatternStorage' para almacenar patrones
-from llm_integration.langchain_manager import LangChainManager, fix_xpath
-from bs4 import BeautifulSoup  # Necesario para extraer el contexto del HTML
+from learning.pattern_cache import PatternCache
+from learning.sharded_storage import ShardedPatternStorage, open_pattern_storage
+from learning.snapshot_store import SnapshotStore
+from llm_integration.backend import create_llm_manager
+from llm_integration.model_router import ModelRouter
+from chopperfix.dom_tracking import serialize_tree
+from chopperfix.drivers import SelectorNotFoundError, get_driver_adapter
+from chopperfix.element_context import extract_element_context, is_xpath_selector
+from chopperfix.replay import fallback_probe, known_failure, record_step
+from self_healing.candidates import is_unique_match, parse_html
+from self_healing.coordination import HealCoordinator
+from self_healing.fallbacks import FallbackPrecomputer, first_matching_fallback
+from utils.config import Config
 
-# Inicializa las instancias de LangChainManager y PatternStorage
-pattern_storage = PatternStorage()
-adalFlow_Manger = LangChainManager()
 
-from lxml import etree
 
-def extract_element_context(html_content, selector, is_xpath=True):
-    if is_xpath:
-        tree = etree.HTML(html_content)
-        try:
-            target_element = tree.xpath(selector)
-            if not target_element:
-                return None, None, None, None
-            target_element = target_element[0]
-            parent_element = target_element.getparent()
-            child_elements = [etree.tostring(child, pretty_print=True).decode() for child in target_element]
-            sibling_elements = [etree.tostring(sibling, pretty_print=True).decode() for sibling in target_element.itersiblings()]
-            return (
-                etree.tostring(target_element, pretty_print=True).decode(),
-                etree.tostring(parent_element, pretty_print=True).decode(),
-                child_elements,
-                sibling_elements,
-            )
-        except Exception:
-            return None, None, None, None
+def _build_pattern_storage(db_url):
+    storage = open_pattern_storage(
+        db_url,
+        shards=Config.PATTERN_SHARDS,
+        shard_by=Config.PATTERN_SHARD_BY,
+        half_life_seconds=Config.SCORE_HALF_LIFE_DAYS * 24 * 3600,
+        llm_manager=adalFlow_Manger if Config.LLM_ROUTING else None,
+    )
+    if Config.SCORE_RECOMPUTE_SECONDS > 0:
+        storage.start_score_scheduler(Config.SCORE_RECOMPUTE_SECONDS)
+    if Config.PATTERN_CACHE:
+        # Las búsquedas frecuentes se resuelven en memoria
+        storage = PatternCache(
+            storage,
+            max_entries=Config.PATTERN_CACHE_SIZE,
+            write_behind=Config.PATTERN_CACHE == 'write-behind',
+        )
+    return storage
+
+
+def _build_snapshot_store():
+    # Archivo opcional de instantáneas HTML (escritura asíncrona)
+    if not Config.SNAPSHOT_DIR:
+        return None
+    return SnapshotStore(
+        Config.SNAPSHOT_DIR,
+        max_bytes=Config.SNAPSHOT_MAX_MB * 1024 * 1024,
+        max_age_seconds=Config.SNAPSHOT_MAX_AGE_DAYS * 24 * 3600,
+        max_pending=Config.SNAPSHOT_QUEUE_SIZE,
+    )
+
+
+def _build_fallback_precomputer(storage):
+    # Cálculo en segundo plano de las cadenas de selectores de respaldo y de la deriva
+    if not (Config.FALLBACK_CHAINS or Config.DRIFT_DETECTION):
+        return None
+    return FallbackPrecomputer(
+        storage,
+        chain_length=Config.FALLBACK_CHAIN_LENGTH,
+        chains=Config.FALLBACK_CHAINS,
+        drift_threshold=Config.DRIFT_THRESHOLD if Config.DRIFT_DETECTION else None,
+    )
+
+
+# Inicializa el gestor LLM del backend configurado y PatternStorage
+# Con enrutado, cada tarea va al modelo más barato que la resuelve
+adalFlow_Manger = ModelRouter.from_config(Config) if Config.LLM_ROUTING else create_llm_manager()
+pattern_storage = _build_pattern_storage(Config.PATTERN_DB_URL)
+snapshot_store = _build_snapshot_store()
+fallback_precomputer = _build_fallback_precomputer(pattern_storage)
+# Con varios workers, sólo uno repara cada selector roto y el resto reutiliza su reemplazo
+heal_coordinator = HealCoordinator(Config.HEAL_COORDINATION_DB) if Config.HEAL_COORDINATION_DB else None
+# Pasos y reparaciones del hilo actual (para las métricas del ejecutor en paralelo)
+_counters = threading.local()
+
+
+def _shutdown():
+    if isinstance(pattern_storage, PatternCache):
+        pattern_storage.flush()
+    if fallback_precomputer is not None:
+        fallback_precomputer.close()
+    if snapshot_store is not None:
+        # Escribe las instantáneas que sigan en la cola antes de salir
+        snapshot_store.close()
+
+
+atexit.register(_shutdown)
+
+
+def configure(db_url=None, heal_coordinator_db=None):
+    """
+    Con `db_url`, vuelve a crear el almacenamiento de patrones (y sus hilos de
+    fondo) sobre esa base de datos; con `heal_coordinator_db`, activa la
+    coordinación de reparaciones. Lo usa `chopperfix.runner` en cada proceso
+    worker: las conexiones heredadas del proceso padre no se pueden reutilizar
+    tras un fork.
+    """
+    global pattern_storage, fallback_precomputer, heal_coordinator, snapshot_store
+    if db_url:
+        inherited = getattr(pattern_storage, 'storage', pattern_storage)
+        if isinstance(inherited, ShardedPatternStorage):
+            for shard in inherited.shards:
+                shard.engine.dispose(close=False)
+        elif isinstance(inherited, PatternStorage):
+            inherited.engine.dispose(close=False)
+        pattern_storage = _build_pattern_storage(db_url)
+        fallback_precomputer = _build_fallback_precomputer(pattern_storage)
+        # El hilo escritor y el bloqueo del archivo heredado son del proceso padre
+        snapshot_store = _build_snapshot_store()
+    if heal_coordinator_db:
+        heal_coordinator = HealCoordinator(heal_coordinator_db)
+    return pattern_storage
+
+
+def thread_counters():
+    """{'steps', 'heals'} ejecutados por `chopperdoc` en el hilo actual."""
+    return {'steps': getattr(_counters, 'steps', 0), 'heals': getattr(_counters, 'heals', 0)}
+
+
+def _count(name):
+    setattr(_counters, name, getattr(_counters, name, 0) + 1)
+
+
+def _step_target(func, args, kwargs):
+    """Obtiene el nombre de la acción y el selector del paso."""
+    action_name = args[0] if args else kwargs.get('action', func.__name__)  # Obtiene el nombre de la acción
+    selector = kwargs.get('xpath')  # Obtiene el selector de los argumentos
+    if action_name == 'navigate':  # Si la acción es 'navigate'
+        selector = 'URL'  # Establece el selector como 'URL'
+    return action_name, selector
+
+
+class _StepPage:
+    """
+    HTML de la página en un paso. Sólo se descarga la primera vez que hace
+    falta (archivo, descripción sin elemento o reparación); con seguimiento
+    incremental del DOM ya viene con el árbol lxml y el HTML se serializa desde
+    él, sin volver a descargar la página. En adaptadores asíncronos hay que
+    cargarlo antes con `await load_async()`.
+    """
+
+    def __init__(self, adapter, html=None, tree=None):
+        self.adapter = adapter
+        self.tree = tree
+        self._html = html
+
+    @property
+    def html(self):
+        if self._html is None:
+            self._html = serialize_tree(self.tree) if self.tree is not None else self.adapter.content()
+        return self._html
+
+    async def load_async(self):
+        if self._html is None:
+            self._html = serialize_tree(self.tree) if self.tree is not None else await self.adapter.content()
+        return self._html
+
+
+def _archive(url, page):
+    if snapshot_store is not None and page.html:
+        snapshot_store.put(url, page.html)
+
+
+def _context_selector(selector):
+    return selector if selector != 'URL' else None
+
+
+def _step_page(adapter, selector):
+    """(página del paso, contexto del elemento) antes de ejecutar la acción."""
+    if Config.DOM_TRACKING:
+        # Con seguimiento incremental, (html, árbol) se actualizan sólo con los subárboles cambiados
+        html_content, tree = adapter.tracked_snapshot()
+        return _StepPage(adapter, html_content, tree), _extract_context(html_content, selector, tree)
+    page = _StepPage(adapter)
+    if adapter.can_run_scripts():
+        # Sólo los fragmentos del elemento; la página completa se pide si hace falta
+        return page, adapter.element_context(_context_selector(selector))
+    return page, _extract_context(page.html, selector)
+
+
+async def _step_page_async(adapter, selector):
+    if Config.DOM_TRACKING:
+        html_content, tree = await adapter.tracked_snapshot()
+        return _StepPage(adapter, html_content, tree), _extract_context(html_content, selector, tree)
+    page = _StepPage(adapter)
+    if adapter.can_run_scripts():
+        return page, await adapter.element_context(_context_selector(selector))
+    return page, _extract_context(await page.load_async(), selector)
+
+
+def _extract_context(html_content, selector, tree=None):
+    # Extraer el contexto del elemento HTML antes de ejecutar la acción
+    return extract_element_context(html_content, selector, is_xpath=is_xpath_selector(selector), tree=tree)
+
+
+def _success_needs_html(context):
+    # La descripción usa la ventana del padre si se encontró el elemento
+    return context[0] is None or fallback_precomputer is not None
+
+
+def _description_html(page, context):
+    if context[0] is not None:
+        return context[1] or context[0]
+    return page.html
+
+
+def _should_probe(selector, context):
+    # Sólo se sondea si el elemento ya falta en la instantánea del paso
+    return (Config.PROBE_ENABLED or fallback_probe()) and selector and selector != 'URL' and context[0] is None
+
+
+def _probe(adapter, selector, context):
+    """Lanza SelectorNotFoundError si el selector está definitivamente ausente."""
+    failure = known_failure(selector)
+    if failure is not None:
+        raise failure  # La vía rápida de replay ya lo ha intentado
+    if not _should_probe(selector, context):
+        return
+    if adapter.exists(selector, timeout=Config.PROBE_GRACE_MS) is False:
+        print(f"[INFO] Sonda previa: '{selector}' no existe, se omite el timeout del driver")
+        raise SelectorNotFoundError(selector, Config.PROBE_GRACE_MS)
+
+
+async def _probe_async(adapter, selector, context):
+    failure = known_failure(selector)
+    if failure is not None:
+        raise failure
+    if not _should_probe(selector, context):
+        return
+    if await adapter.exists(selector, timeout=Config.PROBE_GRACE_MS) is False:
+        print(f"[INFO] Sonda previa: '{selector}' no existe, se omite el timeout del driver")
+        raise SelectorNotFoundError(selector, Config.PROBE_GRACE_MS)
+
+
+def _record_success(action_name, selector, url, page, context):
+    full_element_html, parent_element, child_elements, sibling_elements = context
+    # Llamar a generate_description con el contexto completo
+    description = adalFlow_Manger.generate_description(
+        action_name, selector, url, _description_html(page, context),
+        full_element_html=full_element_html,
+        parent_element=parent_element,
+        child_elements=child_elements,
+        sibling_elements=sibling_elements
+    )  # Genera una descripción de la acción
+
+    # Guardar el patrón exitoso junto con el contexto HTML
+    pattern_storage.save_pattern(
+        action_name, selector, url, description, success=True,
+        full_element_html=full_element_html,
+        parent_element=parent_element,
+        child_elements=child_elements,
+        sibling_elements=sibling_elements
+    )
+    if fallback_precomputer is not None:
+        fallback_precomputer.submit(action_name, selector, url, page.html, element_html=full_element_html)
+
+
+def _precomputed_replacement(action_name, selector, url, html_content, tree=None):
+    """Primer selector de respaldo calculado al grabar que coincide con el DOM actual."""
+    fallbacks = pattern_storage.get_fallback_selectors(action_name, selector, url)
+    replacement = first_matching_fallback(html_content, fallbacks, tree=tree)
+    if replacement:
+        print(f"[INFO] Selector de respaldo precalculado: '{replacement}'")
+    return replacement
+
+
+def _batch_replacement(action_name, selector, url, html_content, context, tree=None):
+    """Reutiliza un reemplazo ya curado en lote o cura toda la página de una vez."""
+    stored = pattern_storage.get_stored_replacement(action_name, selector, url)
+    if stored and is_unique_match(tree if tree is not None else parse_html(html_content), stored):
+        print(f"[INFO] Reemplazo curado en lote encontrado: '{stored}'")
+        return stored
+    healed = pattern_storage.heal_url(
+        url, html_content, adalFlow_Manger,
+        extra_failures=[{'action': action_name, 'selector': selector, 'full_element_html': context[0]}],
+    )
+    return healed.get(selector) or healed.get(pattern_storage.normalize_selector(selector))
+
+
+def _heal_key(action_name, selector, url):
+    return f"{action_name}|{pattern_storage.normalize_selector(selector)}|{pattern_storage.url_template(url)}"
+
+
+def _await_shared_heal(action_name, selector, url):
+    """
+    Reserva la reparación del selector. Si otro worker ya la tiene, espera a
+    que guarde el reemplazo y lo reutiliza; si termina sin él, repara este.
+    """
+    key = _heal_key(action_name, selector, url)
+    if heal_coordinator.acquire(key):
+        return None
+    print(f"[INFO] Otro worker está reparando '{selector}'; se espera su reemplazo")
+    replacement_selector = heal_coordinator.wait_for(
+        key, lambda: pattern_storage.get_stored_replacement(action_name, selector, url)
+    )
+    if replacement_selector:
+        print(f"[INFO] Reemplazo reutilizado de otro worker: '{replacement_selector}'")
     else:
-        soup = BeautifulSoup(html_content, 'html.parser')
-        target_element = soup.select_one(selector)
-        if not target_element:
-            return None, None, None, None
-        parent_element = target_element.parent
-        child_elements = [str(child) for child in target_element.children if child.name]
-        sibling_elements = [str(sibling) for sibling in target_element.find_next_siblings()]
-        return str(target_element), str(parent_element), child_elements, sibling_elements
+        heal_coordinator.acquire(key)
+    return replacement_selector
+
+
+def _release_heal(action_name, selector, url):
+    if heal_coordinator is not None:
+        heal_coordinator.release(_heal_key(action_name, selector, url))
+
+
+def _find_replacement(action_name, selector, url, page, context):
+    full_element_html, parent_element, child_elements, sibling_elements = context
+    # El HTML se serializa (o descarga) sólo si algún paso de la reparación lo necesita
+    tree = page.tree
+    print(f"[INFO] Iniciando self-healing para el selector fallido: '{selector}'")  # Inicia el proceso de auto-reparación
+
+    if Config.FALLBACK_CHAINS or Config.DRIFT_DETECTION:
+        replacement_selector = _precomputed_replacement(
+            action_name, selector, url, page.html if tree is None else None, tree
+        )
+        if replacement_selector:
+            return replacement_selector
+
+    if heal_coordinator is not None:
+        replacement_selector = _await_shared_heal(action_name, selector, url)
+        if replacement_selector:
+            return replacement_selector
+
+    if Config.BATCH_HEALING:
+        replacement_selector = _batch_replacement(action_name, selector, url, page.html, context, tree)
+        if replacement_selector:
+            return replacement_selector
+
+    replacement_selector = pattern_storage.get_replacement_selector(selector, url, action_name)  # Intenta obtener un selector alternativo
+    if not replacement_selector:  # Si no se encontró un selector alternativo
+        print("[INFO] Solicitando selector alternativo al LLM")  # Solicita un selector alternativo al LLM
+
+        # Llamar a suggest_alternative_selector con el contexto completo
+        replacement_selector = adalFlow_Manger.suggest_alternative_selector(
+            page.html, selector, action_name,
+            full_element_html=full_element_html,
+            parent_element=parent_element,
+            child_elements=child_elements,
+            sibling_elements=sibling_elements
+        )  # Sugiere un selector alternativo
+    return replacement_selector
+
+
+def _record_heal(action_name, selector, replacement_selector, url, page, context):
+    full_element_html, parent_element, child_elements, sibling_elements = context
+    # Llamar a generate_description con el contexto completo para el intento exitoso
+    successful_description = adalFlow_Manger.generate_description(
+        action_name, replacement_selector, url, page.html,
+        full_element_html=full_element_html,
+        parent_element=parent_element,
+        child_elements=child_elements,
+        sibling_elements=sibling_elements
+    )  # Genera descripción del intento exitoso
+    pattern_storage.save_pattern(action_name, selector, url, successful_description, success=False, replacement_selector=replacement_selector)  # Guarda el patrón del intento fallido
+    pattern_storage.save_pattern(action_name, replacement_selector, url, successful_description, success=True)  # Guarda el patrón exitoso con el nuevo selector
+    _count('heals')
+
+
+def _record_failure(action_name, selector, url, error, context):
+    full_element_html, parent_element, child_elements, sibling_elements = context
+    # Guardar el patrón fallido con el contexto del elemento HTML
+    pattern_storage.save_pattern(
+        action_name, selector, url, str(error), success=False,
+        full_element_html=full_element_html,
+        parent_element=parent_element,
+        child_elements=child_elements,
+        sibling_elements=sibling_elements
+    )
+
 
 def chopperdoc(func):  # Define un decorador llamado 'chopperdoc' que toma una función como argumento
+    if inspect.iscoroutinefunction(func):
+        return _chopperdoc_async(func)
+
     @wraps(func)  # Mantiene la metadata de la función original
     def wrapper(driver, *args, **kwargs):  # Define la función envoltura que recibe un controlador y argumentos
-        action_name = args[0] if args else kwargs.get('action', func.__name__)  # Obtiene el nombre de la acción
-        url = driver.page.url  # Obtiene la URL actual de la página
-        selector = kwargs.get('xpath')  # Obtiene el selector de los argumentos
-
-        if action_name == 'navigate':  # Si la acción es 'navigate'
-            selector = 'URL'  # Establece el selector como 'URL'
-            url = kwargs.get('url', '')  # Obtiene la URL de los argumentos
+        adapter = get_driver_adapter(driver)  # Adaptador para Playwright o Selenium
+        action_name, selector = _step_target(func, args, kwargs)
+        _count('steps')
+        url = kwargs.get('url', '') if action_name == 'navigate' else adapter.url()  # Obtiene la URL actual de la página
+        record_step(wrapper, action_name, selector, url, args, kwargs)  # Graba el paso si hay un Recorder activo
 
-        html_content = driver.page.content()  # Obtiene el contenido HTML de la página
-
-        # Extraer el contexto del elemento HTML antes de ejecutar la acción
-        full_element_html, parent_element, child_elements, sibling_elements = extract_element_context(html_content, selector)
+        page, context = _step_page(adapter, selector)  # Contexto del elemento; el HTML completo sólo si hace falta
+        _archive(url, page)
 
         try:
+            _probe(adapter, selector, context)  # Falla rápido si el elemento no existe
             print(f"[INFO] Ejecutando acción: {action_name} con argumentos {args} {kwargs}")  # Imprime información sobre la acción
             result = func(driver, *args, **kwargs)  # Llama a la función original con los argumentos
             print(f"[SUCCESS] Acción '{action_name}' completada con éxito.")  # Imprime mensaje de éxito
-
-            # Llamar a generate_description con el contexto completo
-            description = adalFlow_Manger.generate_description(
-                action_name, selector, url, html_content,
-                full_element_html=full_element_html,
-                parent_element=parent_element,
-                child_elements=child_elements,
-                sibling_elements=sibling_elements
-            )  # Genera una descripción de la acción
-
-            # Guardar el patrón exitoso junto con el contexto HTML
-            pattern_storage.save_pattern(
-                action_name, selector, url, description, success=True,
-                full_element_html=full_element_html,
-                parent_element=parent_element,
-                child_elements=child_elements,
-                sibling_elements=sibling_elements
-            )
+            _record_success(action_name, selector, url, page, context)
             return result  # Devuelve el resultado de la función original
 
         except Exception as e:  # Captura cualquier excepción que ocurra
             print(f"[ERROR] Error al ejecutar la acción '{action_name}': {e}")  # Imprime el error
             if selector and selector != 'URL':  # Si hay un selector y no es 'URL'
-                print(f"[INFO] Iniciando self-healing para el selector fallido: '{selector}'")  # Inicia el proceso de auto-reparación
-
-                replacement_selector = pattern_storage.get_replacement_selector(selector, url,action_name)  # Intenta obtener un selector alternativo
-                #replacement_selector=fix_xpath(replacement_selector)
-                if not replacement_selector:  # Si no se encontró un selector alternativo
-                    print("[INFO] Solicitando selector alternativo al LLM")  # Solicita un selector alternativo al LLM
-
-                    # Llamar a suggest_alternative_selector con el contexto completo
-                    replacement_selector = adalFlow_Manger.suggest_alternative_selector(
-                        html_content, selector, action_name,
-                        full_element_html=full_element_html,
-                        parent_element=parent_element,
-                        child_elements=child_elements,
-                        sibling_elements=sibling_elements
-                    )  # Sugiere un selector alternativo
-                print(replacement_selector)
-                if replacement_selector:  # Si se encontró un selector alternativo
-                    print(f"[INFO] Reintentando acción con selector alternativo '{replacement_selector}'")  # Imprime información sobre el reintento
-                    kwargs['xpath'] = replacement_selector  # Actualiza el selector en los argumentos
-                    print(kwargs)
-                    print(action_name)
-                    try:
-
-                        result = func(driver, action_name, **kwargs)  # Reintenta la acción con el nuevo selector
-
-                        # Llamar a generate_description con el contexto completo para el intento exitoso
-                        successful_description = adalFlow_Manger.generate_description(
-                            action_name, replacement_selector, url, html_content,
-                            full_element_html=full_element_html,
-                            parent_element=parent_element,
-                            child_elements=child_elements,
-                            sibling_elements=sibling_elements
-                        )  # Genera descripción del intento exitoso
-                        pattern_storage.save_pattern(action_name, selector, url, successful_description, success=False, replacement_selector=replacement_selector)  # Guarda el patrón del intento fallido
-                        pattern_storage.save_pattern(action_name, replacement_selector, url, successful_description, success=True)  # Guarda el patrón exitoso con el nuevo selector
-                        return result  # Devuelve el resultado del reintento
-                    except Exception as retry_exception:  # Captura cualquier excepción en el reintento
-                        print(f"[ERROR] Error al reintentar la acción con el selector alternativo '{replacement_selector}': {retry_exception}")  # Imprime el error del reintento
-                        pattern_storage.save_pattern(action_name, replacement_selector, url, str(retry_exception), success=False)  # Guarda el patrón del reintento fallido
-                else:  # Si no se pudo encontrar un selector alternativo
-                    print(f"[WARN] No se pudo encontrar un selector alternativo para '{selector}'")  # Imprime advertencia
-
-                # Guardar el patrón fallido con el contexto del elemento HTML
-                pattern_storage.save_pattern(
-                    action_name, selector, url, str(e), success=False,
-                    full_element_html=full_element_html,
-                    parent_element=parent_element,
-                    child_elements=child_elements,
-                    sibling_elements=sibling_elements
-                )
+                try:
+                    replacement_selector = _find_replacement(action_name, selector, url, page, context)
+                    if replacement_selector:  # Si se encontró un selector alternativo
+                        print(f"[INFO] Reintentando acción con selector alternativo '{replacement_selector}'")  # Imprime información sobre el reintento
+                        kwargs['xpath'] = replacement_selector  # Actualiza el selector en los argumentos
+                        try:
+                            result = func(driver, action_name, **kwargs)  # Reintenta la acción con el nuevo selector
+                            _record_heal(action_name, selector, replacement_selector, url, page, context)
+                            return result  # Devuelve el resultado del reintento
+                        except Exception as retry_exception:  # Captura cualquier excepción en el reintento
+                            print(f"[ERROR] Error al reintentar la acción con el selector alternativo '{replacement_selector}': {retry_exception}")  # Imprime el error del reintento
+                            pattern_storage.save_pattern(action_name, replacement_selector, url, str(retry_exception), success=False)  # Guarda el patrón del reintento fallido
+                    else:  # Si no se pudo encontrar un selector alternativo
+                        print(f"[WARN] No se pudo encontrar un selector alternativo para '{selector}'")  # Imprime advertencia
+
+                    _record_failure(action_name, selector, url, e, context)
+                finally:
+                    _release_heal(action_name, selector, url)  # Libera la reserva aunque la reparación falle
 
             raise e  # Vuelve a lanzar la excepción
 
     return wrapper  # Devuelve la función envoltura
+
+
+def _chopperdoc_async(func):
+    """Variante de `chopperdoc` para acciones `async def` (playwright.async_api)."""
+    @wraps(func)
+    async def wrapper(driver, *args, **kwargs):
+        adapter = get_driver_adapter(driver)
+        action_name, selector = _step_target(func, args, kwargs)
+        _count('steps')
+        url = kwargs.get('url', '') if action_name == 'navigate' else await adapter.url()
+        record_step(wrapper, action_name, selector, url, args, kwargs)
+
+        page, context = await _step_page_async(adapter, selector)
+        if snapshot_store is not None:
+            await page.load_async()
+        _archive(url, page)
+
+        try:
+            await _probe_async(adapter, selector, context)
+            print(f"[INFO] Ejecutando acción: {action_name} con argumentos {args} {kwargs}")
+            result = await func(driver, *args, **kwargs)
+            print(f"[SUCCESS] Acción '{action_name}' completada con éxito.")
+            if _success_needs_html(context):
+                await page.load_async()
+            _record_success(action_name, selector, url, page, context)
+            return result
+
+        except Exception as e:
+            print(f"[ERROR] Error al ejecutar la acción '{action_name}': {e}")
+            if selector and selector != 'URL':
+                try:
+                    await page.load_async()
+                    replacement_selector = _find_replacement(action_name, selector, url, page, context)
+                    if replacement_selector:
+                        print(f"[INFO] Reintentando acción con selector alternativo '{replacement_selector}'")
+                        kwargs['xpath'] = replacement_selector
+                        try:
+                            result = await func(driver, action_name, **kwargs)
+                            _record_heal(action_name, selector, replacement_selector, url, page, context)
+                            return result
+                        except Exception as retry_exception:
+                            print(f"[ERROR] Error al reintentar la acción con el selector alternativo '{replacement_selector}': {retry_exception}")
+                            pattern_storage.save_pattern(action_name, replacement_selector, url, str(retry_exception), success=False)
+                    else:
+                        print(f"[WARN] No se pudo encontrar un selector alternativo para '{selector}'")
+
+                    _record_failure(action_name, selector, url, e, context)
+                finally:
+                    _release_heal(action_name, selector, url)  # Libera la reserva aunque la reparación falle
+
+            raise e
+
+    return wrapper
@@ -0,0 +1,214 @@
+"""Punto de entrada de la línea de comandos `chopperfix`."""
+import argparse
+import json
+import sys
+
+from learning.sharded_storage import SHARD_BY, open_pattern_storage
+from utils.config import Config
+
+
+def _open_storage(args):
+    return open_pattern_storage(args.db, shards=args.shards, shard_by=args.shard_by)
+
+
+def _add_shard_arguments(parser):
+    parser.add_argument('--shards', type=int, default=Config.PATTERN_SHARDS,
+                        help='Particiones de la base de datos de patrones (CHOPPERFIX_SHARDS).')
+    parser.add_argument('--shard-by', choices=SHARD_BY, default=Config.PATTERN_SHARD_BY,
+                        help='Clave de reparto entre particiones (CHOPPERFIX_SHARD_BY).')
+
+
+def _heal(args):
+    from self_healing.offline import heal_inventory
+
+    if not args.snapshots and not args.archive:
+        print("[ERROR] Indica un directorio de instantáneas o --archive")
+        return 2
+    storage = _open_storage(args)
+    llm_manager = None
+    if not args.no_llm:
+        from llm_integration.backend import create_llm_manager
+        llm_manager = create_llm_manager()
+    try:
+        report = heal_inventory(
+            storage, args.snapshots,
+            workers=args.workers,
+            llm_manager=llm_manager,
+            llm_concurrency=args.llm_concurrency,
+            dry_run=args.dry_run,
+            archive_dir=args.archive,
+        )
+    finally:
+        storage.close()
+
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    summary = report['summary']
+    print(
+        f"[INFO] {summary['patterns']} selectores en {summary['snapshots']} instantáneas: "
+        f"{summary['ok']} ok, {summary['healed']} reparados ({summary['llm_healed']} por LLM), "
+        f"{summary['unresolved']} sin resolver, {summary['rejected']} rechazados "
+        f"en {summary['elapsed_seconds']} s"
+    )
+    return 0 if not summary['unresolved'] and not summary['rejected'] else 1
+
+
+def _export(args):
+    storage = _open_storage(args)
+    try:
+        count = storage.export_patterns(args.path, chunk_size=args.chunk_size)
+    finally:
+        storage.close()
+    print(f"[INFO] {count} patrones exportados a {args.path}")
+    return 0
+
+
+def _import(args):
+    storage = _open_storage(args)
+    try:
+        storage.import_patterns(args.path, chunk_size=args.chunk_size)
+    finally:
+        storage.close()
+    return 0
+
+
+def _compile(args):
+    from chopperfix.replay import ReplayPlan
+
+    plan = ReplayPlan.load(args.plan)
+    storage = _open_storage(args)
+    try:
+        plan.recompile(storage)
+    finally:
+        storage.close()
+    plan.save(args.output or args.plan)
+    replaced = sum(step.source == 'replacement' for step in plan.steps)
+    print(f"[INFO] Plan de {len(plan)} pasos compilado ({replaced} con reemplazo guardado)")
+    return 0
+
+
+def _llm_standin(args):
+    from llm_integration.standin import StandinLLM, StandinServer, load_canned
+
+    llm = StandinLLM(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        chunk_delay_ms=args.chunk_delay_ms,
+        error_rate=args.error_rate,
+        canned=load_canned(args.canned) if args.canned else None,
+        seed=args.seed,
+    )
+    server = StandinServer((args.host, args.port), llm)
+    print(f"[INFO] Simulador LLM escuchando en {server.base_url} (CHOPPERFIX_LLM_BASE_URL={server.base_url})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"[INFO] {json.dumps(llm.stats())}")
+    return 0
+
+
+def _run(args):
+    import importlib
+
+    from chopperfix.runner import FlowRunner
+
+    module_name, _, attribute = args.flows.partition(':')
+    flows = getattr(importlib.import_module(module_name), attribute or 'FLOWS')
+    if callable(flows):
+        flows = flows()
+    runner = FlowRunner(
+        processes=args.processes,
+        contexts=args.contexts,
+        pool_kwargs={'browser': args.browser, 'headless': not args.headed},
+        db_url=args.db,
+    )
+    report = runner.run(flows)
+    summary = report['summary']
+    print(f"[INFO] {summary['ok']}/{summary['flows']} flujos correctos en {summary['wall_seconds']} s "
+          f"({summary['flows_per_second']} flujos/s, {summary['steps_per_second']} pasos/s, "
+          f"{summary['heals']} reparaciones)")
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as handle:
+            json.dump(report, handle, indent=2, ensure_ascii=False)
+    return 0 if not summary['failed'] else 1
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='chopperfix', description='Herramientas de ChopperFix.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    heal = subparsers.add_parser('heal', help='Repara en bloque los selectores guardados usando instantáneas HTML.')
+    heal.add_argument('snapshots', nargs='?', help='Directorio con instantáneas HTML (y opcionalmente manifest.json).')
+    heal.add_argument('--archive', help='Usa la última instantánea de cada URL del archivo (CHOPPERFIX_SNAPSHOT_DIR).')
+    heal.add_argument('--db', default=Config.PATTERN_DB_URL,
+                      help='URL de la base de datos de patrones (CHOPPERFIX_DB_URL).')
+    heal.add_argument('--workers', type=int, default=None, help='Procesos del pool (por defecto, CPUs disponibles).')
+    heal.add_argument('--llm-concurrency', type=int, default=4, help='Peticiones simultáneas al LLM.')
+    heal.add_argument('--no-llm', action='store_true', help='Sólo reparación local, sin LLM.')
+    heal.add_argument('--dry-run', action='store_true', help='No escribe los reemplazos en la base de datos.')
+    heal.add_argument('--report', help='Ruta del informe JSON.')
+    _add_shard_arguments(heal)
+    heal.set_defaults(handler=_heal)
+
+    export = subparsers.add_parser('export', help='Exporta los patrones aprendidos a JSONL (gzip si acaba en .gz).')
+    export.add_argument('path', help='Fichero de salida.')
+    export.add_argument('--db', default=Config.PATTERN_DB_URL,
+                        help='URL de la base de datos de patrones (CHOPPERFIX_DB_URL).')
+    export.add_argument('--chunk-size', type=int, default=1000, help='Patrones leídos por bloque.')
+    _add_shard_arguments(export)
+    export.set_defaults(handler=_export)
+
+    import_ = subparsers.add_parser('import', help='Fusiona en la base de datos los patrones de un fichero exportado.')
+    import_.add_argument('path', help='Fichero JSONL (o .jsonl.gz) generado con `chopperfix export`.')
+    import_.add_argument('--db', default=Config.PATTERN_DB_URL,
+                         help='URL de la base de datos de patrones (CHOPPERFIX_DB_URL).')
+    import_.add_argument('--chunk-size', type=int, default=1000, help='Patrones confirmados por transacción.')
+    _add_shard_arguments(import_)
+    import_.set_defaults(handler=_import)
+
+    compile_ = subparsers.add_parser(
+        'compile', help='Vuelve a resolver los selectores de un plan de reproducción con los patrones guardados.'
+    )
+    compile_.add_argument('plan', help='Plan JSON guardado con `ReplayPlan.save`.')
+    compile_.add_argument('--output', help='Fichero de salida (por defecto, sobrescribe el plan).')
+    compile_.add_argument('--db', default=Config.PATTERN_DB_URL,
+                          help='URL de la base de datos de patrones (CHOPPERFIX_DB_URL).')
+    _add_shard_arguments(compile_)
+    compile_.set_defaults(handler=_compile)
+
+    standin = subparsers.add_parser(
+        'llm-standin', help='Simulador local compatible con OpenAI para pruebas de carga sin gastar cuota.'
+    )
+    standin.add_argument('--host', default='127.0.0.1', help='Interfaz de escucha.')
+    standin.add_argument('--port', type=int, default=8765, help='Puerto de escucha.')
+    standin.add_argument('--latency-ms', type=float, default=0, help='Latencia fija de cada respuesta.')
+    standin.add_argument('--jitter-ms', type=float, default=0, help='Latencia aleatoria adicional (uniforme).')
+    standin.add_argument('--chunk-delay-ms', type=float, default=0, help='Pausa entre fragmentos en streaming.')
+    standin.add_argument('--error-rate', type=float, default=0.0, help='Fracción de peticiones respondidas con 429.')
+    standin.add_argument('--canned', help='JSON {fragmento del prompt: respuesta}; "*" es la respuesta por defecto.')
+    standin.add_argument('--seed', type=int, help='Semilla de la latencia y los errores simulados.')
+    standin.set_defaults(handler=_llm_standin)
+
+    run = subparsers.add_parser('run', help='Ejecuta en paralelo flujos decorados con chopperdoc.')
+    run.add_argument('flows', help='modulo:atributo con la lista de Flow (o una función que la devuelve).')
+    run.add_argument('--processes', type=int, default=2, help='Procesos worker (0 = proceso actual).')
+    run.add_argument('--contexts', type=int, default=4, help='Contextos de navegador por proceso.')
+    run.add_argument('--browser', default='chromium', help='Navegador de Playwright.')
+    run.add_argument('--headed', action='store_true', help='Muestra las ventanas del navegador.')
+    run.add_argument('--db', default=None, help='URL de la base de datos de patrones (CHOPPERFIX_DB_URL).')
+    run.add_argument('--report', help='Ruta del informe JSON por flujo.')
+    run.set_defaults(handler=_run)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
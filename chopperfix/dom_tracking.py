@@ -0,0 +1,202 @@
+"""
+Seguimiento incremental del DOM entre pasos.
+
+En una sesión larga sobre una SPA, cada paso sólo cambia un fragmento de la
+página, pero `chopperdoc` descargaba y parseaba `page.content()` entero en cada
+uno. Con el seguimiento activado se inyecta un MutationObserver que anota los
+subárboles modificados; en el siguiente paso el navegador devuelve sólo el
+`outerHTML` de esos subárboles (con su ruta desde `<html>`) y `DomTracker`
+los sustituye en el árbol lxml que ya tenía parseado. El árbol parcheado no se
+vuelve a serializar salvo que alguien pida el HTML (`serialize_tree`), por
+ejemplo para archivarlo o enviarlo al LLM.
+
+Si la página es nueva (navegación), hay demasiados cambios, cambia `<html>`,
+`<head>` o `<body>` enteros, o una ruta no coincide con el árbol local, se
+vuelve a tomar una instantánea completa.
+"""
+import weakref
+
+from lxml import etree
+
+from self_healing.candidates import parse_fragment, parse_html
+
+# Subárboles modificados a partir de los cuales sale más a cuenta la instantánea completa
+MAX_DIRTY_SUBTREES = 200
+
+# Función JS compartida por Playwright (page.evaluate) y Selenium (execute_script).
+# La primera llamada en cada documento instala el observador y pide una
+# instantánea completa; las siguientes devuelven los cambios desde la anterior.
+TRACK_CHANGES_JS = """
+({maxDirty}) => {
+    const state = window.__chopperfixDom;
+    if (!state || state.document !== document) {
+        const fresh = {document: document, dirty: new Set(), overflow: false};
+        fresh.observer = new MutationObserver((records) => {
+            if (fresh.overflow) {
+                return;
+            }
+            for (const record of records) {
+                let node = record.target;
+                if (node.nodeType !== Node.ELEMENT_NODE) {
+                    node = node.parentElement;
+                }
+                if (node) {
+                    fresh.dirty.add(node);
+                }
+            }
+            if (fresh.dirty.size > maxDirty) {
+                fresh.overflow = true;
+                fresh.dirty.clear();
+            }
+        });
+        fresh.observer.observe(document, {
+            subtree: true, childList: true, attributes: true, characterData: true,
+        });
+        window.__chopperfixDom = fresh;
+        return {full: true};
+    }
+    if (state.overflow) {
+        state.overflow = false;
+        return {full: true};
+    }
+    const dirty = state.dirty;
+    state.dirty = new Set();
+    const roots = [];
+    for (const node of dirty) {
+        if (!node.isConnected) {
+            continue;  // Su padre también está anotado (childList)
+        }
+        let covered = false;
+        for (let ancestor = node.parentElement; ancestor; ancestor = ancestor.parentElement) {
+            if (dirty.has(ancestor)) {
+                covered = true;
+                break;
+            }
+        }
+        if (!covered) {
+            roots.push(node);
+        }
+    }
+    const changes = [];
+    for (const node of roots) {
+        if (node === document.documentElement || node === document.head || node === document.body) {
+            return {full: true};
+        }
+        const path = [];
+        const tags = [];
+        for (let current = node; current !== document.documentElement; current = current.parentElement) {
+            path.unshift(Array.prototype.indexOf.call(current.parentElement.children, current));
+            tags.unshift(current.localName);
+        }
+        changes.push({path: path, tags: tags, html: node.outerHTML});
+    }
+    return {full: false, changes: changes};
+}
+"""
+
+_trackers = weakref.WeakKeyDictionary()
+
+
+def tracker_for(page):
+    """`DomTracker` asociado a la página (o WebDriver). None si no admite referencias débiles."""
+    try:
+        tracker = _trackers.get(page)
+        if tracker is None:
+            tracker = _trackers[page] = DomTracker()
+        return tracker
+    except TypeError:
+        return None
+
+
+def serialize_tree(tree):
+    """HTML completo de un árbol lxml."""
+    return etree.tostring(tree.getroottree(), method='html', encoding='unicode')
+
+
+def _element_children(element):
+    return [child for child in element if isinstance(child.tag, str)]
+
+
+class DomTracker:
+    """
+    Árbol lxml de una página mantenido al día con los cambios que informa el
+    observador. `apply()` aplica un resultado de `TRACK_CHANGES_JS` y devuelve
+    False si hace falta una instantánea completa, que se carga con `load()`.
+    """
+
+    def __init__(self, max_dirty=MAX_DIRTY_SUBTREES):
+        self.max_dirty = max_dirty
+        self.tree = None
+        self._html = None
+        self.full_snapshots = 0
+        self.incremental = 0
+        self.unchanged = 0
+        self.patched_subtrees = 0
+        self.resyncs = 0
+
+    @property
+    def js_args(self):
+        return {'maxDirty': self.max_dirty}
+
+    @property
+    def html(self):
+        """HTML del árbol actual; sólo se vuelve a serializar si ha cambiado."""
+        if self._html is None and self.tree is not None:
+            self._html = serialize_tree(self.tree)
+        return self._html
+
+    @property
+    def snapshot_html(self):
+        """HTML de la última instantánea completa si el árbol no ha cambiado desde entonces; si no, None."""
+        return self._html
+
+    def load(self, html_content):
+        """Sustituye el árbol por una instantánea completa."""
+        self.tree = parse_html(html_content)
+        self._html = html_content
+        self.full_snapshots += 1
+        return self.tree
+
+    def _resolve(self, path, tags):
+        element = self.tree
+        for index, tag in zip(path, tags):
+            children = _element_children(element)
+            if index < 0 or index >= len(children) or children[index].tag.lower() != tag.lower():
+                return None
+            element = children[index]
+        return element if element is not self.tree else None
+
+    def apply(self, result):
+        if self.tree is None or not result or result.get('full', True):
+            return False
+        changes = result.get('changes') or []
+        if not changes:
+            self.unchanged += 1
+            return True
+        # Se resuelven todas las rutas antes de tocar el árbol: los subárboles
+        # son disjuntos y sustituir uno no mueve los índices de los demás
+        patches = []
+        for change in changes:
+            element = self._resolve(change.get('path') or [], change.get('tags') or [])
+            replacement = parse_fragment(change.get('html'))
+            if element is None or replacement is None or not isinstance(replacement.tag, str) \
+                    or replacement.tag.lower() != element.tag.lower():
+                self.resyncs += 1
+                return False
+            patches.append((element, replacement))
+        for element, replacement in patches:
+            replacement.tail = element.tail
+            element.getparent().replace(element, replacement)
+        self._html = None
+        self.incremental += 1
+        self.patched_subtrees += len(patches)
+        return True
+
+    def stats(self):
+        return {
+            'full_snapshots': self.full_snapshots,
+            'incremental': self.incremental,
+            'unchanged': self.unchanged,
+            'patched_subtrees': self.patched_subtrees,
+            'resyncs': self.resyncs,
+        }
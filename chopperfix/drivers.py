@@ -0,0 +1,384 @@
+import inspect
+import time
+
+from chopperfix.dom_tracking import TRACK_CHANGES_JS, tracker_for
+from chopperfix.element_context import (
+    extract_contexts,
+    extract_element_context,
+    is_xpath_selector,
+    strip_selector_engine,
+)
+from utils.config import Config
+
+# Función JS compartida por Playwright (page.evaluate) y Selenium (execute_script).
+# Recibe un único objeto {selector, isXpath, contextOnly, maxSiblings, maxChildren}
+# para que ambos drivers la invoquen igual y devuelve sólo los fragmentos del
+# elemento, no la página, con las mismas cotas y resúmenes que `ElementContext`
+# (maxSiblings 0: todos los hermanos en la lista y sólo el elemento en la ventana del padre).
+_FIND_ELEMENT_JS = """
+({selector, isXpath, contextOnly, maxSiblings, maxChildren}) => {
+    let element = null;
+    try {
+        if (isXpath) {
+            element = document.evaluate(
+                selector, document, null,
+                XPathResult.FIRST_ORDERED_NODE_TYPE, null
+            ).singleNodeValue;
+        } else {
+            element = document.querySelector(selector);
+        }
+    } catch (e) {
+        return null;
+    }
+    if (!contextOnly) {
+        return !!element;
+    }
+    if (!element || element.nodeType !== Node.ELEMENT_NODE) {
+        return null;
+    }
+    const summary = (nodes, kind) => {
+        const tags = {};
+        const classes = {};
+        for (const node of nodes) {
+            tags[node.localName] = (tags[node.localName] || 0) + 1;
+            for (const name of new Set(node.classList)) {
+                classes[name] = (classes[name] || 0) + 1;
+            }
+        }
+        const top = (counts, limit) => Object.entries(counts).sort((a, b) => b[1] - a[1]).slice(0, limit);
+        let text = `${nodes.length} more ${kind} omitted`;
+        const histogram = top(tags, 5).map(([tag, count]) => `${tag} x${count}`);
+        if (histogram.length) {
+            text += ': ' + histogram.join(', ');
+        }
+        const shared = top(classes, 3).filter(([, seen]) => seen * 2 >= nodes.length).map(([name, seen]) =>
+            seen === nodes.length ? name : `${name} (${Math.round(100 * seen / nodes.length)}%)`);
+        if (shared.length) {
+            text += '; common classes: ' + shared.join(', ');
+        }
+        return text;
+    };
+    const parent = element.parentElement;
+    const all = parent ? Array.from(parent.children) : [element];
+    const position = all.indexOf(element);
+    const following = all.slice(position + 1);
+    const shownSiblings = maxSiblings ? following.slice(0, maxSiblings) : following;
+    const siblings = shownSiblings.map((node) => node.outerHTML);
+    if (shownSiblings.length < following.length) {
+        siblings.push(`<!-- ${summary(following.slice(shownSiblings.length), 'sibling elements')} -->`);
+    }
+    let parentHtml = parent ? parent.outerHTML : null;
+    const before = all.slice(Math.max(0, position - Math.floor(maxSiblings / 4)), position);
+    const after = following.slice(0, Math.max(0, maxSiblings - before.length));
+    if (parent && before.length + after.length + 1 < all.length) {
+        // Ventana del padre: el elemento y sus vecinos más cercanos, el resto resumido
+        const frame = parent.cloneNode(false);
+        const first = position - before.length;
+        const last = position + after.length;
+        if (first > 0) {
+            frame.appendChild(document.createComment(` ${summary(all.slice(0, first), 'elements')} `));
+        }
+        for (const node of all.slice(first, last + 1)) {
+            frame.appendChild(node.cloneNode(true));
+        }
+        if (last + 1 < all.length) {
+            frame.appendChild(document.createComment(` ${summary(all.slice(last + 1), 'elements')} `));
+        }
+        parentHtml = frame.outerHTML;
+    }
+    const allChildren = Array.from(element.children);
+    const shownChildren = maxChildren ? allChildren.slice(0, maxChildren) : allChildren;
+    const children = shownChildren.map((child) => child.outerHTML);
+    if (shownChildren.length < allChildren.length) {
+        children.push(`<!-- ${summary(allChildren.slice(shownChildren.length), 'child elements')} -->`);
+    }
+    return {
+        element: element.outerHTML,
+        parent: parentHtml,
+        children: children,
+        siblings: siblings,
+    };
+}
+"""
+
+_EMPTY_CONTEXT = (None, None, None, None)
+
+
+class SelectorNotFoundError(Exception):
+    """El selector no existe en la página; se lanza antes de esperar el timeout del driver."""
+
+    def __init__(self, selector, grace_ms=0):
+        self.selector = selector
+        self.grace_ms = grace_ms
+        super().__init__(
+            f"El selector '{selector}' no existe en el DOM (periodo de gracia: {grace_ms} ms)"
+        )
+
+
+def _js_args(selector, context_only):
+    return {
+        'selector': strip_selector_engine(selector),
+        'isXpath': is_xpath_selector(selector),
+        'contextOnly': context_only,
+        'maxSiblings': Config.CONTEXT_MAX_SIBLINGS,
+        'maxChildren': Config.CONTEXT_MAX_CHILDREN,
+    }
+
+
+def _context_from_js(result):
+    if not result:
+        return _EMPTY_CONTEXT
+    return (
+        result.get('element'),
+        result.get('parent'),
+        result.get('children') or [],
+        result.get('siblings') or [],
+    )
+
+
+def _playwright_selector(selector):
+    if selector.startswith(('xpath=', 'css=')):
+        return selector
+    return ('xpath=' if is_xpath_selector(selector) else 'css=') + selector
+
+
+class DriverAdapter:
+    """
+    Interfaz común que usa `chopperdoc` para hablar con el navegador.
+
+    Cada implementación expone la URL actual, una instantánea del DOM, el
+    contexto de un elemento concreto y una comprobación de existencia, de modo
+    que el decorador no dependa de la forma de cada driver.
+    """
+
+    is_async = False
+
+    def can_run_scripts(self):
+        """True si `element_context` se resuelve en el navegador sin descargar la página."""
+        return False
+
+    def url(self):
+        raise NotImplementedError
+
+    def content(self):
+        raise NotImplementedError
+
+    def tracked_snapshot(self):
+        """
+        (html, árbol lxml) de la página, actualizando sólo los subárboles que
+        han cambiado desde el paso anterior (`chopperfix.dom_tracking`). Si el
+        árbol se ha parcheado, html es None: se serializa con `serialize_tree`
+        sólo cuando hace falta. Los drivers que no pueden ejecutar JS devuelven
+        la instantánea completa y ningún árbol.
+        """
+        return self.content(), None
+
+    def element_context(self, selector):
+        """Devuelve (elemento, padre, hijos, hermanos) para el selector."""
+        if not selector:
+            return _EMPTY_CONTEXT
+        return extract_element_context(self.content(), selector, is_xpath=is_xpath_selector(selector))
+
+    def element_contexts(self, selectors):
+        """Contexto de muchos selectores con una sola captura y un solo parseo del DOM."""
+        return extract_contexts(self.content(), selectors)
+
+    def exists(self, selector, timeout=0):
+        """
+        Comprueba si el selector existe en el DOM vivo, esperando como mucho
+        `timeout` milisegundos. Devuelve None si el driver no puede comprobarlo.
+        """
+        raise NotImplementedError
+
+
+class PlaywrightSyncAdapter(DriverAdapter):
+    def __init__(self, page):
+        self.page = page
+
+    def can_run_scripts(self):
+        return hasattr(self.page, 'evaluate')
+
+    def url(self):
+        return self.page.url
+
+    def content(self):
+        return self.page.content()
+
+    def tracked_snapshot(self):
+        tracker = tracker_for(self.page) if hasattr(self.page, 'evaluate') else None
+        if tracker is None:
+            return super().tracked_snapshot()
+        try:
+            changes = self.page.evaluate(TRACK_CHANGES_JS, tracker.js_args)
+        except Exception:
+            changes = None
+        if not tracker.apply(changes):
+            tracker.load(self.content())
+        return tracker.snapshot_html, tracker.tree
+
+    def element_context(self, selector):
+        if not selector:
+            return _EMPTY_CONTEXT
+        if not hasattr(self.page, 'evaluate'):
+            return super().element_context(selector)
+        try:
+            return _context_from_js(self.page.evaluate(_FIND_ELEMENT_JS, _js_args(selector, True)))
+        except Exception:
+            return _EMPTY_CONTEXT
+
+    def exists(self, selector, timeout=0):
+        if not selector:
+            return None
+        try:
+            if timeout and hasattr(self.page, 'wait_for_selector'):
+                self.page.wait_for_selector(_playwright_selector(selector), state='attached', timeout=timeout)
+                return True
+            if hasattr(self.page, 'evaluate'):
+                return bool(self.page.evaluate(_FIND_ELEMENT_JS, _js_args(selector, False)))
+        except Exception as e:
+            if 'timeout' in type(e).__name__.lower():
+                return False
+            return None
+        return None
+
+
+class PlaywrightAsyncAdapter(DriverAdapter):
+    """Versión para `playwright.async_api`: todos los métodos son corrutinas."""
+
+    is_async = True
+
+    def __init__(self, page):
+        self.page = page
+
+    def can_run_scripts(self):
+        return hasattr(self.page, 'evaluate')
+
+    async def url(self):
+        return self.page.url
+
+    async def content(self):
+        return await self.page.content()
+
+    async def tracked_snapshot(self):
+        tracker = tracker_for(self.page)
+        if tracker is None:
+            return await self.content(), None
+        try:
+            changes = await self.page.evaluate(TRACK_CHANGES_JS, tracker.js_args)
+        except Exception:
+            changes = None
+        if not tracker.apply(changes):
+            tracker.load(await self.content())
+        return tracker.snapshot_html, tracker.tree
+
+    async def element_context(self, selector):
+        if not selector:
+            return _EMPTY_CONTEXT
+        try:
+            return _context_from_js(await self.page.evaluate(_FIND_ELEMENT_JS, _js_args(selector, True)))
+        except Exception:
+            return _EMPTY_CONTEXT
+
+    async def element_contexts(self, selectors):
+        return extract_contexts(await self.content(), selectors)
+
+    async def exists(self, selector, timeout=0):
+        if not selector:
+            return None
+        try:
+            if timeout:
+                await self.page.wait_for_selector(_playwright_selector(selector), state='attached', timeout=timeout)
+                return True
+            return bool(await self.page.evaluate(_FIND_ELEMENT_JS, _js_args(selector, False)))
+        except Exception as e:
+            if 'timeout' in type(e).__name__.lower():
+                return False
+            return None
+
+
+class SeleniumAdapter(DriverAdapter):
+    """
+    Adaptador para Selenium WebDriver (local o Grid). El contexto del elemento y
+    la comprobación de existencia se resuelven con `execute_script`, sin
+    descargar `page_source` completo.
+    """
+
+    poll_interval = 0.05
+
+    def __init__(self, webdriver):
+        self.webdriver = webdriver
+
+    def can_run_scripts(self):
+        return True
+
+    def url(self):
+        return self.webdriver.current_url
+
+    def content(self):
+        return self.webdriver.page_source
+
+    def tracked_snapshot(self):
+        tracker = tracker_for(self.webdriver)
+        if tracker is None:
+            return super().tracked_snapshot()
+        try:
+            changes = self.webdriver.execute_script(f"return ({TRACK_CHANGES_JS})(arguments[0]);", tracker.js_args)
+        except Exception:
+            changes = None
+        if not tracker.apply(changes):
+            tracker.load(self.content())
+        return tracker.snapshot_html, tracker.tree
+
+    def _run(self, selector, context_only):
+        return self.webdriver.execute_script(
+            f"return ({_FIND_ELEMENT_JS})(arguments[0]);", _js_args(selector, context_only)
+        )
+
+    def element_context(self, selector):
+        if not selector:
+            return _EMPTY_CONTEXT
+        try:
+            return _context_from_js(self._run(selector, True))
+        except Exception:
+            return _EMPTY_CONTEXT
+
+    def exists(self, selector, timeout=0):
+        if not selector:
+            return None
+        deadline = time.monotonic() + (timeout or 0) / 1000.0
+        try:
+            while True:
+                if self._run(selector, False):
+                    return True
+                if time.monotonic() >= deadline:
+                    return False
+                time.sleep(self.poll_interval)
+        except Exception:
+            return None
+
+
+def get_driver_adapter(driver):
+    """Devuelve el adaptador adecuado para el driver recibido por `chopperdoc`."""
+    if isinstance(driver, DriverAdapter):
+        return driver
+
+    page = getattr(driver, 'page', None)
+    if page is not None:
+        if inspect.iscoroutinefunction(getattr(page, 'content', None)):
+            return PlaywrightAsyncAdapter(page)
+        return PlaywrightSyncAdapter(page)
+
+    for candidate in (driver, getattr(driver, 'driver', None), getattr(driver, 'webdriver', None)):
+        if candidate is not None and hasattr(candidate, 'execute_script') and hasattr(candidate, 'current_url'):
+            return SeleniumAdapter(candidate)
+
+    if hasattr(driver, 'evaluate') and hasattr(driver, 'content'):
+        if inspect.iscoroutinefunction(driver.content):
+            return PlaywrightAsyncAdapter(driver)
+        return PlaywrightSyncAdapter(driver)
+
+    raise TypeError(
+        f"No se reconoce el driver de tipo '{type(driver).__name__}'. "
+        "Se esperaba un objeto con 'page' (Playwright), un WebDriver de Selenium "
+        "o un DriverAdapter."
+    )
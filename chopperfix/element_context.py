@@ -0,0 +1,275 @@
+from collections import Counter, deque
+from functools import cached_property
+from itertools import islice
+
+from lxml import etree
+
+from utils.config import Config
+
+_EMPTY_CONTEXT = (None, None, None, None)
+
+
+def is_xpath_selector(selector):
+    """Indica si el selector es una expresión XPath (en lugar de CSS)."""
+    if not selector:
+        return False
+    selector = selector.strip()
+    return selector.startswith(('/', '(', './', '..', 'xpath='))
+
+
+def strip_selector_engine(selector):
+    """Elimina los prefijos de motor de Playwright ('xpath=', 'css=')."""
+    for prefix in ('xpath=', 'css='):
+        if selector.startswith(prefix):
+            return selector[len(prefix):]
+    return selector
+
+
+def css_to_xpath(selector):
+    """
+    Traduce un selector CSS a XPath. Devuelve None si no se puede traducir. La
+    traducción se guarda en `chopperfix.selector_registry` con el resto de la
+    compilación del selector.
+    """
+    from chopperfix.selector_registry import compile_selector
+
+    return compile_selector('css=' + strip_selector_engine(selector)).xpath
+
+
+# Texto máximo de cada nodo en una copia acotada
+MAX_NODE_TEXT = 500
+MAX_SUMMARY_TAGS = 5
+MAX_SUMMARY_CLASSES = 3
+
+
+def _serialize(element):
+    return etree.tostring(element, pretty_print=True).decode()
+
+
+def summarize_nodes(nodes):
+    """
+    Resumen compacto de nodos omitidos: cuántos son, histograma de etiquetas
+    y clases que comparten al menos la mitad (con la fracción que las lleva).
+    """
+    tags = Counter()
+    classes = Counter()
+    for node in nodes:
+        tags[node.tag] += 1
+        classes.update(set((node.get('class') or '').split()))
+    count = sum(tags.values())
+    return {
+        'count': count,
+        'tags': dict(tags.most_common(MAX_SUMMARY_TAGS)),
+        'classes': {
+            name: round(seen / count, 2)
+            for name, seen in classes.most_common(MAX_SUMMARY_CLASSES) if seen * 2 >= count
+        },
+    }
+
+
+def summary_comment(summary, kind):
+    """Texto del comentario HTML que sustituye a los nodos omitidos (va a los prompts)."""
+    text = f"{summary['count']} more {kind} omitted"
+    if summary['tags']:
+        text += ': ' + ', '.join(f"{tag} x{count}" for tag, count in summary['tags'].items())
+    if summary['classes']:
+        text += '; common classes: ' + ', '.join(
+            name if share == 1 else f"{name} ({share:.0%})" for name, share in summary['classes'].items()
+        )
+    return text
+
+
+def _shallow_copy(element):
+    copy = etree.Element(element.tag, dict(element.attrib))
+    copy.text = element.text if not element.text or len(element.text) <= MAX_NODE_TEXT \
+        else element.text[:MAX_NODE_TEXT] + '...'
+    copy.tail = element.tail
+    return copy
+
+
+def bounded_copy(element, max_nodes, max_children):
+    """
+    Copia de `element` con como mucho `max_nodes` elementos y `max_children`
+    hijos por nodo (recorrido en anchura). Cada grupo de hijos omitidos se
+    sustituye por un comentario con su resumen.
+    """
+    root = _shallow_copy(element)
+    budget = max_nodes - 1
+    pending = deque([(element, root)])
+    while pending:
+        source, target = pending.popleft()
+        elided = []
+        kept = 0
+        for child in source:
+            if not isinstance(child.tag, str):
+                continue
+            if kept < max_children and budget > 0:
+                kept += 1
+                budget -= 1
+                child_copy = _shallow_copy(child)
+                target.append(child_copy)
+                pending.append((child, child_copy))
+            else:
+                elided.append(child)
+        if elided:
+            target.append(etree.Comment(f" {summary_comment(summarize_nodes(elided), 'elements')} "))
+    return root
+
+
+def _fits(element, max_nodes):
+    return sum(1 for _ in islice(element.iter(), max_nodes + 1)) <= max_nodes
+
+
+class ElementContext:
+    """
+    Contexto estructural de un elemento lxml. Cada parte se serializa la
+    primera vez que se pide, de modo que comprobar cientos de selectores no
+    cuesta serializar cientos de hermanos e hijos.
+
+    El contexto está acotado para que su tamaño no dependa de la longitud de
+    las listas o tablas: sólo se serializan los `max_siblings` hermanos
+    siguientes y los primeros `max_children` hijos, cada fragmento con como
+    mucho `max_nodes` elementos, y el padre se reduce a una ventana con los
+    vecinos más cercanos del elemento (una cuarta parte anteriores, el resto
+    posteriores). Lo omitido se resume (cantidad, etiquetas, clases comunes) en
+    un comentario HTML al final de la lista correspondiente o en el lugar del
+    padre donde estaba. Un límite 0 desactiva esa cota; con `max_siblings=0`
+    la lista de hermanos es completa y la ventana del padre se queda sólo con
+    el elemento. `sibling_summary` y `child_summary` resumen lo omitido y se
+    pueden leer sin serializar las listas.
+    """
+
+    def __init__(self, element, max_siblings=None, max_children=None, max_nodes=None):
+        self.element = element
+        self.max_siblings = Config.CONTEXT_MAX_SIBLINGS if max_siblings is None else max_siblings
+        self.max_children = Config.CONTEXT_MAX_CHILDREN if max_children is None else max_children
+        self.max_nodes = Config.CONTEXT_MAX_NODES if max_nodes is None else max_nodes
+
+    def _fragment(self, element):
+        if not self.max_nodes or _fits(element, self.max_nodes):
+            return _serialize(element)
+        return _serialize(bounded_copy(element, self.max_nodes, self.max_children or self.max_nodes))
+
+    def _sibling_window(self, before_limit, limit):
+        """
+        (anteriores más cercanos, posteriores más cercanos, posteriores
+        omitidos), con `limit` vecinos en total; None no pone límite.
+        """
+        preceding = self.element.itersiblings(etree.Element, preceding=True)
+        before = list(islice(preceding, before_limit))
+        following = self.element.itersiblings(etree.Element)
+        after = list(following if limit is None else islice(following, max(0, limit - len(before))))
+        elided = list(following)
+        before.reverse()
+        return before, after, elided
+
+    @cached_property
+    def _sibling_slice(self):
+        _, shown, elided = self._sibling_window(0, self.max_siblings or None)
+        return shown, elided
+
+    @cached_property
+    def _child_slice(self):
+        # Sólo hijos elemento: comentarios e instrucciones de proceso no cuentan
+        elements = [child for child in self.element if isinstance(child.tag, str)]
+        if not self.max_children:
+            return elements, []
+        return elements[:self.max_children], elements[self.max_children:]
+
+    @cached_property
+    def sibling_summary(self):
+        """Resumen de los hermanos siguientes que no entran en `siblings` (o None)."""
+        elided = self._sibling_slice[1]
+        return summarize_nodes(elided) if elided else None
+
+    @cached_property
+    def child_summary(self):
+        """Resumen de los hijos que no entran en `children` (o None)."""
+        elided = self._child_slice[1]
+        return summarize_nodes(elided) if elided else None
+
+    @cached_property
+    def element_html(self):
+        return self._fragment(self.element)
+
+    @cached_property
+    def parent_html(self):
+        parent = self.element.getparent()
+        if parent is None:
+            return None
+        if not self.max_nodes or _fits(parent, self.max_nodes):
+            return _serialize(parent)
+        # Ventana del padre: el elemento y sus vecinos más cercanos, el resto resumido
+        before, after, _ = self._sibling_window(self.max_siblings // 4, self.max_siblings)
+        shown = [node for node in before + [self.element] + after if isinstance(node.tag, str)]
+        elements = list(parent.iterchildren(etree.Element))
+        first, last = elements.index(shown[0]), elements.index(shown[-1])
+        window = _shallow_copy(parent)
+        window.tail = None
+        if first:
+            window.append(etree.Comment(f" {summary_comment(summarize_nodes(elements[:first]), 'elements')} "))
+        budget = max(1, self.max_nodes // len(shown))
+        for node in shown:
+            window.append(bounded_copy(node, budget, self.max_children or budget))
+        if last + 1 < len(elements):
+            window.append(etree.Comment(f" {summary_comment(summarize_nodes(elements[last + 1:]), 'elements')} "))
+        return _serialize(window)
+
+    @cached_property
+    def children(self):
+        children = [self._fragment(child) for child in self._child_slice[0]]
+        if self.child_summary:
+            children.append(f"<!-- {summary_comment(self.child_summary, 'child elements')} -->")
+        return children
+
+    @cached_property
+    def siblings(self):
+        siblings = [self._fragment(sibling) for sibling in self._sibling_slice[0]]
+        if self.sibling_summary:
+            siblings.append(f"<!-- {summary_comment(self.sibling_summary, 'sibling elements')} -->")
+        return siblings
+
+    def as_tuple(self):
+        """(elemento, padre, hijos, hermanos), como `extract_element_context`."""
+        return self.element_html, self.parent_html, self.children, self.siblings
+
+
+def _first_element(tree, selector):
+    from chopperfix.selector_registry import compile_selector
+
+    matches = compile_selector(selector).select(tree)
+    return matches[0] if matches else None
+
+
+def extract_contexts(html_content, selectors, tree=None):
+    """
+    Contexto de muchos selectores XPath o CSS sobre una sola página.
+
+    El HTML se parsea una vez con lxml (o se usa `tree` si ya está parseado) y
+    cada selector se evalúa sobre el mismo árbol con su XPath compilado en
+    `chopperfix.selector_registry` (los CSS, traducidos). Devuelve {selector:
+    ElementContext o None}.
+    """
+    if tree is None:
+        tree = etree.HTML(html_content) if html_content else None
+    contexts = {}
+    for selector in selectors:
+        if selector in contexts:
+            continue
+        contexts[selector] = None
+        if tree is None or not selector:
+            continue
+        element = _first_element(tree, selector)
+        if element is not None:
+            contexts[selector] = ElementContext(element)
+    return contexts
+
+
+def extract_element_context(html_content, selector, is_xpath=True, tree=None):
+    if not selector:
+        return _EMPTY_CONTEXT
+    selector = strip_selector_engine(selector)
+    # lxml para XPath y para CSS (traducido con cssselect), con los límites de `ElementContext`
+    context = extract_contexts(html_content, [('xpath=' if is_xpath else 'css=') + selector], tree=tree)
+    found = next(iter(context.values()))
+    return found.as_tuple() if found is not None else _EMPTY_CONTEXT
@@ -0,0 +1,323 @@
+"""
+Grabación y reproducción rápida de flujos decorados con `chopperdoc`.
+
+Un flujo estable no necesita pasar por todo el decorador en cada ejecución
+(instantánea, extracción de contexto, descripción con el LLM, persistencia):
+`PatternStorage` ya sabe qué selector funciona en cada paso. `Recorder` graba
+los pasos de una ejecución normal, `compile_plan` los convierte en un
+`ReplayPlan` con los selectores ya resueltos (el reemplazo guardado si el
+original está roto) y `ReplayPlan.run` los ejecuta llamando directamente a la
+función sin decorar, a la velocidad del driver.
+
+Sólo si un paso falla se ejecuta ese paso por la ruta completa de
+`chopperdoc` con el selector grabado, que lo repara y guarda el reemplazo; el
+plan se actualiza con él y el resto de pasos siguen por la vía rápida. El
+fallo de la vía rápida pasa directamente a la reparación (`known_failure`)
+sin repetir la acción, y si el plan usaba un reemplazo se sondea el selector
+grabado antes de ejecutarlo, así que no se espera un segundo timeout.
+
+    with Recorder() as recording:
+        login_flow(driver)
+    plan = compile_plan(recording, pattern_storage)
+    plan.save('login.plan.json')
+    ...
+    ReplayPlan.load('login.plan.json').run(driver)
+"""
+import importlib
+import json
+import threading
+import time
+from datetime import datetime
+
+_local = threading.local()
+
+
+def function_path(function):
+    """'modulo:Clase.funcion' con el que se vuelve a importar `function`."""
+    return f"{function.__module__}:{function.__qualname__}"
+
+
+def resolve_function(path):
+    module_name, _, qualname = path.partition(':')
+    target = importlib.import_module(module_name)
+    for name in qualname.split('.'):
+        target = getattr(target, name)
+    return target
+
+
+def record_step(function, action, selector, url, args, kwargs):
+    """Lo llama `chopperdoc` en cada paso; sólo graba si hay un `Recorder` activo en el hilo."""
+    recorder = getattr(_local, 'recorder', None)
+    if recorder is not None and not getattr(_local, 'replaying', False):
+        recorder.steps.append(RecordedStep(function, action, selector, url, args, dict(kwargs)))
+
+
+def known_failure(selector):
+    """
+    Excepción con la que `selector` acaba de fallar en la vía rápida de
+    `ReplayPlan.run`, o None. `chopperdoc` la consume una sola vez.
+    """
+    failure = getattr(_local, 'failure', None)
+    if failure is None or failure[0] != selector:
+        return None
+    _local.failure = None
+    return failure[1]
+
+
+def fallback_probe():
+    """True mientras `ReplayPlan.run` ejecuta un paso por la ruta completa."""
+    return getattr(_local, 'probe', False)
+
+
+class _Fallback:
+    """Activa `known_failure` y `fallback_probe` durante la llamada a la ruta completa."""
+
+    def __init__(self, step, error):
+        # El fallo sólo es conocido si la vía rápida usó el mismo selector
+        self.failure = (step.selector, error) if step.resolved == step.selector else None
+
+    def __enter__(self):
+        _local.failure, _local.probe = self.failure, True
+        return self
+
+    def __exit__(self, *exc_info):
+        _local.failure, _local.probe = None, False
+        return False
+
+
+class RecordedStep:
+    def __init__(self, function, action, selector, url, args=(), kwargs=None):
+        self.function = function
+        self.action = action
+        self.selector = selector
+        self.url = url
+        self.args = tuple(args)
+        self.kwargs = dict(kwargs or {})
+
+    def __repr__(self):
+        return f"<RecordedStep(action={self.action}, selector={self.selector}, url={self.url})>"
+
+
+class Recorder:
+    """Graba los pasos `chopperdoc` que se ejecutan en el hilo actual mientras está activo."""
+
+    def __init__(self):
+        self.steps = []
+        self._previous = None
+
+    def __enter__(self):
+        self._previous = getattr(_local, 'recorder', None)
+        _local.recorder = self
+        return self
+
+    def __exit__(self, *exc_info):
+        _local.recorder = self._previous
+        return False
+
+
+class ReplayStep:
+    """
+    Un paso del plan. `selector` es el grabado (la clave de sus patrones) y
+    `resolved` el que se usa en la vía rápida; `source` indica de dónde sale
+    ('recorded' o 'replacement').
+    """
+
+    def __init__(self, function, action, selector, url, resolved=None, source='recorded',
+                 args=(), kwargs=None):
+        self.function = function
+        self.action = action
+        self.selector = selector
+        self.url = url
+        self.resolved = resolved if resolved is not None else selector
+        self.source = source
+        self.args = tuple(args)
+        self.kwargs = dict(kwargs or {})
+
+    def callable(self, functions=None):
+        """Función decorada del paso (se importa si el plan viene de un fichero)."""
+        if not isinstance(self.function, str):
+            return self.function
+        if functions and self.function in functions:
+            return functions[self.function]
+        self.function = resolve_function(self.function)
+        return self.function
+
+    def call_kwargs(self, selector):
+        kwargs = dict(self.kwargs)
+        if self.selector and self.selector != 'URL':
+            kwargs['xpath'] = selector
+        return kwargs
+
+    def to_dict(self):
+        return {
+            'function': self.function if isinstance(self.function, str) else function_path(self.function),
+            'action': self.action,
+            'selector': self.selector,
+            'url': self.url,
+            'resolved': self.resolved,
+            'source': self.source,
+            'args': list(self.args),
+            'kwargs': self.kwargs,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            data['function'], data['action'], data['selector'], data['url'],
+            resolved=data.get('resolved'), source=data.get('source', 'recorded'),
+            args=data.get('args', ()), kwargs=data.get('kwargs'),
+        )
+
+    def __repr__(self):
+        return f"<ReplayStep(action={self.action}, resolved={self.resolved}, source={self.source})>"
+
+
+def _resolve_selector(storage, step):
+    if not step.selector or step.selector == 'URL':
+        return step.selector, 'recorded'
+    replacement = storage.get_stored_replacement(step.action, step.selector, step.url)
+    if replacement:
+        return replacement, 'replacement'
+    return step.selector, 'recorded'
+
+
+def compile_plan(recording, storage):
+    """
+    Convierte una grabación (`Recorder` o lista de `RecordedStep`) en un
+    `ReplayPlan`, resolviendo cada selector con los reemplazos guardados.
+    """
+    steps = []
+    for step in getattr(recording, 'steps', recording):
+        resolved, source = _resolve_selector(storage, step)
+        steps.append(ReplayStep(
+            step.function, step.action, step.selector, step.url,
+            resolved=resolved, source=source, args=step.args, kwargs=step.kwargs,
+        ))
+    return ReplayPlan(steps, store_version=storage.get_version())
+
+
+class ReplayPlan:
+    """
+    Pasos con sus selectores resueltos. `run(driver)` los ejecuta sin
+    instantáneas ni LLM y recurre a `chopperdoc` sólo en los que fallan.
+    `store_version` es la versión de la base de datos de patrones al compilar.
+    """
+
+    def __init__(self, steps, store_version=None, compiled_at=None):
+        self.steps = list(steps)
+        self.store_version = store_version
+        self.compiled_at = compiled_at or datetime.utcnow().isoformat(timespec='seconds')
+        # Pasos reparados durante la reproducción: conviene guardar el plan de nuevo
+        self.dirty = False
+
+    def is_stale(self, storage):
+        """True si la base de datos de patrones ha cambiado desde la compilación."""
+        return self.store_version is not None and storage.get_version() != self.store_version
+
+    def recompile(self, storage):
+        """Vuelve a resolver los selectores con el estado actual de `storage`."""
+        for step in self.steps:
+            step.resolved, step.source = _resolve_selector(storage, step)
+        self.store_version = storage.get_version()
+        self.dirty = False
+        return self
+
+    # -- ejecución -----------------------------------------------------------
+
+    def _fallback_storage(self):
+        from chopperfix import chopper_decorators
+
+        return chopper_decorators.pattern_storage
+
+    def _after_fallback(self, step, stats):
+        stats['fallbacks'] += 1
+        replacement = self._fallback_storage().get_stored_replacement(step.action, step.selector, step.url)
+        if replacement and replacement != step.resolved:
+            print(f"[INFO] Paso '{step.action}' reparado; el plan usará '{replacement}'")
+            step.resolved, step.source = replacement, 'replacement'
+            self.dirty = True
+            stats['healed'] += 1
+
+    def run(self, driver, functions=None):
+        """
+        Ejecuta el plan con `driver`. `functions` ({ruta: función}) permite
+        indicar funciones que no se pueden importar. Devuelve
+        {'steps', 'fast', 'fallbacks', 'healed', 'seconds'}.
+        """
+        stats = {'steps': 0, 'fast': 0, 'fallbacks': 0, 'healed': 0}
+        started = time.perf_counter()
+        for step in self.steps:
+            function = step.callable(functions)
+            stats['steps'] += 1
+            _local.replaying = True
+            try:
+                getattr(function, '__wrapped__', function)(driver, *step.args, **step.call_kwargs(step.resolved))
+                stats['fast'] += 1
+                continue
+            except Exception as e:
+                print(f"[WARN] Falló el paso '{step.action}' con '{step.resolved}' en la vía rápida: {e}")
+                fallback = _Fallback(step, e)
+            finally:
+                _local.replaying = False
+            # Ruta completa: instantánea, self-healing y registro del patrón
+            with fallback:
+                function(driver, *step.args, **step.call_kwargs(step.selector))
+            self._after_fallback(step, stats)
+        stats['seconds'] = round(time.perf_counter() - started, 4)
+        return stats
+
+    async def run_async(self, driver, functions=None):
+        """Variante de `run` para acciones `async def`."""
+        stats = {'steps': 0, 'fast': 0, 'fallbacks': 0, 'healed': 0}
+        started = time.perf_counter()
+        for step in self.steps:
+            function = step.callable(functions)
+            stats['steps'] += 1
+            _local.replaying = True
+            try:
+                await getattr(function, '__wrapped__', function)(driver, *step.args, **step.call_kwargs(step.resolved))
+                stats['fast'] += 1
+                continue
+            except Exception as e:
+                print(f"[WARN] Falló el paso '{step.action}' con '{step.resolved}' en la vía rápida: {e}")
+                fallback = _Fallback(step, e)
+            finally:
+                _local.replaying = False
+            with fallback:
+                await function(driver, *step.args, **step.call_kwargs(step.selector))
+            self._after_fallback(step, stats)
+        stats['seconds'] = round(time.perf_counter() - started, 4)
+        return stats
+
+    # -- persistencia --------------------------------------------------------
+
+    def to_dict(self):
+        return {
+            'compiled_at': self.compiled_at,
+            'store_version': self.store_version,
+            'steps': [step.to_dict() for step in self.steps],
+        }
+
+    def save(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, indent=2, ensure_ascii=False)
+        self.dirty = False
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            [ReplayStep.from_dict(step) for step in data.get('steps', [])],
+            store_version=data.get('store_version'),
+            compiled_at=data.get('compiled_at'),
+        )
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding='utf-8') as f:
+            return cls.from_dict(json.load(f))
+
+    def __len__(self):
+        return len(self.steps)
+
+    def __repr__(self):
+        return f"<ReplayPlan(steps={len(self.steps)}, store_version={self.store_version})>"
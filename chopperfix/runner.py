@@ -0,0 +1,293 @@
+"""
+Ejecución en paralelo de muchos flujos decorados con `chopperdoc`.
+
+Los flujos se reparten entre procesos worker y, dentro de cada proceso, entre
+un pool de contextos de navegador (un hilo por contexto). Todos los workers
+comparten la base de datos de patrones y coordinan las reparaciones con
+`self_healing.coordination.HealCoordinator`: si varios flujos rompen el mismo
+selector, sólo uno lo repara y el resto reutiliza el reemplazo.
+
+El reparto es por localidad de URL: los flujos del mismo sitio y sección van
+al mismo proceso y se ejecutan seguidos, de modo que la caché de patrones, las
+instantáneas deduplicadas y las reparaciones ya hechas se reutilizan.
+"""
+import os
+import queue
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import urlsplit
+
+from utils.config import Config
+
+
+class Flow:
+    """Un flujo: `function(driver, *args, **kwargs)` que empieza en `url`."""
+
+    def __init__(self, name, url, function, args=(), kwargs=None):
+        self.name = name
+        self.url = url
+        self.function = function
+        self.args = tuple(args)
+        self.kwargs = dict(kwargs or {})
+
+    def __repr__(self):
+        return f"<Flow(name={self.name}, url={self.url})>"
+
+
+class FlowDriver:
+    """Driver que recibe cada flujo: una página nueva en su propio contexto de navegador."""
+
+    def __init__(self, page, context=None):
+        self.page = page
+        self.context = context
+
+
+class PlaywrightContextPool:
+    """
+    Un navegador por hilo worker y un contexto nuevo (cookies y almacenamiento
+    aislados) por flujo. Abrir un contexto cuesta milisegundos frente a los
+    segundos de lanzar un navegador. La API síncrona de Playwright no se puede
+    compartir entre hilos, por eso cada hilo tiene el suyo.
+    """
+
+    def __init__(self, browser='chromium', headless=True, timeout_ms=10000, **launch_kwargs):
+        self.browser_name = browser
+        self.headless = headless
+        self.timeout_ms = timeout_ms
+        self.launch_kwargs = launch_kwargs
+        self._local = threading.local()
+
+    def _browser(self):
+        browser = getattr(self._local, 'browser', None)
+        if browser is None:
+            from playwright.sync_api import sync_playwright
+
+            self._local.playwright = sync_playwright().start()
+            launcher = getattr(self._local.playwright, self.browser_name)
+            browser = self._local.browser = launcher.launch(headless=self.headless, **self.launch_kwargs)
+        return browser
+
+    def acquire(self):
+        context = self._browser().new_context()
+        page = context.new_page()
+        page.set_default_timeout(self.timeout_ms)
+        return FlowDriver(page, context)
+
+    def release(self, driver):
+        driver.context.close()
+
+    def close(self):
+        """Cierra el navegador del hilo actual."""
+        browser = getattr(self._local, 'browser', None)
+        if browser is not None:
+            browser.close()
+            self._local.playwright.stop()
+            self._local.browser = None
+
+
+def locality_key(url):
+    """Sitio y primera sección de la URL: 'es.wikipedia.org/wiki'."""
+    parts = urlsplit(url if '://' in url else f"//{url}")
+    host = parts.netloc.lower()
+    if host.startswith('www.'):
+        host = host[4:]
+    section = next((segment for segment in parts.path.split('/') if segment), '')
+    return f"{host}/{section}" if section else host
+
+
+def schedule(flows, workers):
+    """
+    Reparte los flujos en `workers` grupos por localidad de URL: cada sección
+    va entera a un worker (la más grande primero al menos cargado) y dentro de
+    cada worker los flujos quedan ordenados por URL. Devuelve listas de índices.
+    """
+    groups = {}
+    for index, flow in enumerate(flows):
+        groups.setdefault(locality_key(flow.url), []).append(index)
+    buckets = [[] for _ in range(max(1, workers))]
+    for key in sorted(groups, key=lambda key: (-len(groups[key]), key)):
+        min(buckets, key=len).extend(groups[key])
+    return [sorted(bucket, key=lambda index: (flows[index].url, index)) for bucket in buckets if bucket]
+
+
+def _percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def run_worker(task):
+    """
+    Trabajo de un proceso worker: ejecuta sus flujos con `contexts` hilos, cada
+    uno tomando contextos del pool. `task` es un dict con `flows` [(índice,
+    Flow)], `pool_factory`, `pool_kwargs`, `contexts`, `db_url` y
+    `heal_coordinator_db`; `db_url` se omite cuando se ejecuta en el proceso
+    actual. Devuelve los resultados por flujo y las métricas de coordinación.
+    """
+    from chopperfix import chopper_decorators
+
+    previous_coordinator = chopper_decorators.heal_coordinator
+    chopper_decorators.configure(task.get('db_url'), task.get('heal_coordinator_db'))
+    try:
+        return _run_flows(task, chopper_decorators)
+    finally:
+        if not task.get('db_url'):
+            # En el proceso actual la coordinación sólo dura lo que la ejecución
+            chopper_decorators.heal_coordinator = previous_coordinator
+
+
+def _run_flows(task, chopper_decorators):
+    pool = task['pool_factory'](**task.get('pool_kwargs', {}))
+    pending = queue.Queue()
+    for item in task['flows']:
+        pending.put(item)
+    results = []
+    lock = threading.Lock()
+
+    def work():
+        try:
+            while True:
+                try:
+                    index, flow = pending.get_nowait()
+                except queue.Empty:
+                    return
+                result = _run_flow(pool, flow, chopper_decorators.thread_counters)
+                result['index'] = index
+                with lock:
+                    results.append(result)
+        finally:
+            pool.close()
+
+    threads = [
+        threading.Thread(target=work, name=f'chopperfix-flow-{number}')
+        for number in range(max(1, min(task.get('contexts', 1), len(task['flows']))))
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    coordinator = chopper_decorators.heal_coordinator
+    return {
+        'pid': os.getpid(),
+        'results': results,
+        'coordination': coordinator.stats() if coordinator is not None else None,
+    }
+
+
+def _run_flow(pool, flow, counters):
+    before = counters()
+    started = time.perf_counter()
+    result = {'name': flow.name, 'url': flow.url, 'pid': os.getpid(), 'status': 'ok', 'error': None}
+    driver = None
+    try:
+        driver = pool.acquire()
+        flow.function(driver, *flow.args, **flow.kwargs)
+    except Exception as e:
+        result.update(status='failed', error=f"{type(e).__name__}: {e}")
+    finally:
+        if driver is not None:
+            try:
+                pool.release(driver)
+            except Exception as e:
+                print(f"[WARN] No se pudo cerrar el contexto del flujo '{flow.name}': {e}")
+    seconds = time.perf_counter() - started
+    after = counters()
+    steps = after['steps'] - before['steps']
+    result.update(
+        seconds=round(seconds, 4),
+        steps=steps,
+        heals=after['heals'] - before['heals'],
+        steps_per_second=round(steps / seconds, 3) if seconds > 0 else 0.0,
+    )
+    return result
+
+
+class FlowRunner:
+    """
+    Ejecuta `flows` en `processes` procesos con `contexts` contextos de
+    navegador cada uno. `processes=0` ejecuta todo en el proceso actual.
+
+    `pool_factory(**pool_kwargs)` crea en cada worker el pool de drivers, con
+    `acquire()`, `release(driver)` y `close()` (por defecto
+    `PlaywrightContextPool`). Las funciones de los flujos y la factoría deben
+    poder importarse desde los workers (definidas a nivel de módulo).
+    """
+
+    def __init__(self, processes=2, contexts=4, pool_factory=PlaywrightContextPool, pool_kwargs=None,
+                 db_url=None, heal_coordinator_db=None):
+        self.processes = processes
+        self.contexts = contexts
+        self.pool_factory = pool_factory
+        self.pool_kwargs = pool_kwargs or {}
+        self.db_url = db_url
+        self.heal_coordinator_db = heal_coordinator_db
+
+    def run(self, flows):
+        """Ejecuta los flujos y devuelve {'flows': [...], 'summary': {...}} en el orden recibido."""
+        flows = list(flows)
+        started = time.perf_counter()
+        with tempfile.TemporaryDirectory(prefix='chopperfix-run-') as tmp:
+            coordination_db = self.heal_coordinator_db or os.path.join(tmp, 'heals.db')
+            buckets = schedule(flows, self.processes or 1)
+            tasks = [
+                {
+                    'flows': [(index, flows[index]) for index in bucket],
+                    'pool_factory': self.pool_factory,
+                    'pool_kwargs': self.pool_kwargs,
+                    'contexts': self.contexts,
+                    'db_url': (self.db_url or Config.PATTERN_DB_URL) if self.processes else self.db_url,
+                    'heal_coordinator_db': coordination_db,
+                }
+                for bucket in buckets
+            ]
+            if self.processes:
+                # El esquema se crea antes de lanzar los workers para que no compitan por crearlo
+                from learning.sharded_storage import open_pattern_storage
+
+                open_pattern_storage(
+                    tasks[0]['db_url'] if tasks else Config.PATTERN_DB_URL,
+                    shards=Config.PATTERN_SHARDS, shard_by=Config.PATTERN_SHARD_BY,
+                ).close()
+                with ProcessPoolExecutor(max_workers=len(tasks) or 1) as executor:
+                    outputs = list(executor.map(run_worker, tasks))
+            else:
+                outputs = [run_worker(task) for task in tasks]
+        wall_seconds = time.perf_counter() - started
+
+        results = sorted((result for output in outputs for result in output['results']),
+                         key=lambda result: result.pop('index'))
+        return {'flows': results, 'summary': self._summary(results, outputs, buckets, flows, wall_seconds)}
+
+    def _summary(self, results, outputs, buckets, flows, wall_seconds):
+        durations = [result['seconds'] for result in results]
+        steps = sum(result['steps'] for result in results)
+        coordination = {}
+        for output in outputs:
+            for name, value in (output['coordination'] or {}).items():
+                coordination[name] = coordination.get(name, 0) + value
+        workers = {}
+        for result in results:
+            worker = workers.setdefault(result['pid'], {'flows': 0, 'steps': 0, 'seconds': 0.0})
+            worker['flows'] += 1
+            worker['steps'] += result['steps']
+            worker['seconds'] = round(worker['seconds'] + result['seconds'], 4)
+        return {
+            'flows': len(results),
+            'ok': sum(result['status'] == 'ok' for result in results),
+            'failed': sum(result['status'] != 'ok' for result in results),
+            'steps': steps,
+            'heals': sum(result['heals'] for result in results),
+            'wall_seconds': round(wall_seconds, 3),
+            'flows_per_second': round(len(results) / wall_seconds, 3) if wall_seconds > 0 else 0.0,
+            'steps_per_second': round(steps / wall_seconds, 3) if wall_seconds > 0 else 0.0,
+            'flow_seconds_p50': _percentile(durations, 0.5),
+            'flow_seconds_p95': _percentile(durations, 0.95),
+            'locality_groups': len({locality_key(flow.url) for flow in flows}),
+            'worker_buckets': [len(bucket) for bucket in buckets],
+            'workers': {str(pid): stats for pid, stats in workers.items()},
+            'coordination': coordination,
+        }
@@ -0,0 +1,307 @@
+"""
+Registro de selectores compilados.
+
+Cada selector (XPath o CSS, con o sin prefijo 'xpath='/'css=') se analiza una
+sola vez: se traduce a XPath si es CSS, se compila en un `etree.XPath`, se
+calcula su forma normalizada (la que usa `PatternStorage` como clave) y, bajo
+demanda, sus formas con comillas (`quoted`, `double_quoted`) y su estructura
+(pasos, predicados, atributos y literales). La normalización de
+`PatternStorage`, el entrecomillado de reemplazos y respuestas del LLM, la
+traducción de CSS, la extracción de contexto, la validación de candidatos, las
+cadenas de respaldo y la reparación consultan el mismo registro, así que un
+selector que se evalúa en cada paso no se vuelve a analizar nunca.
+
+El registro es un LRU acotado con métricas de aciertos (`registry.stats()`).
+"""
+import re
+import threading
+from collections import OrderedDict
+from functools import cached_property
+
+from cssselect import HTMLTranslator
+from lxml import etree
+
+from chopperfix.element_context import is_xpath_selector, strip_selector_engine
+from utils.config import Config
+
+DEFAULT_MAX_ENTRIES = 1024
+
+_AXIS_RE = re.compile(r"^(?P<axis>[\w-]+)::")
+_ATTRIBUTE_RE = re.compile(r"^@(?P<name>[\w:-]+)\s*=\s*(?P<quote>['\"])(?P<value>.*)(?P=quote)$", re.S)
+_CONTAINS_RE = re.compile(r"^contains\(\s*@(?P<name>[\w:-]+)\s*,\s*(?P<quote>['\"])(?P<value>.*)(?P=quote)\s*\)$", re.S)
+_TEXT_RE = re.compile(r"^(?:normalize-space\(\s*(?:\.|text\(\))?\s*\)|text\(\)|\.)\s*=\s*(?P<quote>['\"])(?P<value>.*)(?P=quote)$", re.S)
+_LITERAL_RE = re.compile(r"'([^']*)'|\"([^\"]*)\"")
+_BARE_VALUE_RE = re.compile(r"(@[\w-]+)=([\w-]+)")
+_ANY_VALUE_RE = re.compile(r"(@[\w-]+)=['\"]?([^'\"]+)['\"]?")
+
+
+def normalize_selector_text(selector):
+    """Forma normalizada con la que se guardan los selectores (sin espacios ni comillas)."""
+    if not selector:
+        return selector
+    normalized = re.sub(r'\s+', '', selector.strip())
+    return re.sub(r'[\"\'<>]', '', normalized)
+
+
+def _translate_css(expression):
+    """XPath equivalente a un selector CSS, o None si no se puede traducir."""
+    try:
+        return HTMLTranslator().css_to_xpath(expression)
+    except Exception:
+        return None
+
+
+def _split_top_level(expression, separator):
+    """Divide `expression` por `separator` fuera de corchetes, paréntesis y comillas."""
+    parts, current, depth, quote = [], [], 0, None
+    index = 0
+    while index < len(expression):
+        char = expression[index]
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in ('"', "'"):
+            quote = char
+        elif char in '[(':
+            depth += 1
+        elif char in '])':
+            depth -= 1
+        elif depth == 0 and expression.startswith(separator, index):
+            parts.append(''.join(current))
+            current = []
+            index += len(separator)
+            continue
+        current.append(char)
+        index += 1
+    parts.append(''.join(current))
+    return parts
+
+
+def _closing_parenthesis(expression):
+    depth, quote = 0, None
+    for index, char in enumerate(expression):
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in ('"', "'"):
+            quote = char
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+            if depth == 0:
+                return index
+    return None
+
+
+def _predicates(step):
+    """Separa 'tag[p1][p2]' en ('tag', ['p1', 'p2'])."""
+    predicates, current, depth, quote, node_test = [], [], 0, None, None
+    for index, char in enumerate(step):
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in ('"', "'"):
+            quote = char
+        elif char == '[':
+            if depth == 0:
+                if node_test is None:
+                    node_test = step[:index]
+                current = []
+                depth += 1
+                continue
+            depth += 1
+        elif char == ']':
+            depth -= 1
+            if depth == 0:
+                predicates.append(''.join(current).strip())
+                continue
+        if depth > 0:
+            current.append(char)
+    return (step if node_test is None else node_test).strip(), predicates
+
+
+def parse_xpath_steps(xpath):
+    """
+    Estructura de un XPath de ubicación: [{'axis', 'tag', 'predicates',
+    'attributes', 'contains', 'text', 'position'}]. Las expresiones que no son
+    rutas simples (uniones, funciones de nivel superior) devuelven [].
+    """
+    expression = xpath.strip()
+    if not expression or len(_split_top_level(expression, '|')) > 1:
+        return []
+    position = None
+    if expression.startswith('('):
+        # (ruta)[n]: se analiza la ruta interior y la posición se aplica al último paso
+        closing = _closing_parenthesis(expression)
+        if closing is None:
+            return []
+        inner, trailing = expression[1:closing], expression[closing + 1:].strip()
+        _, outer = _predicates(trailing) if trailing else ('', [])
+        position = next((int(p) for p in outer if p.isdigit()), None)
+        expression = inner
+    steps = []
+    axis = 'child'
+    for raw in _split_top_level(expression, '/'):
+        if raw == '':
+            axis = 'descendant'
+            continue
+        step = raw.strip()
+        match = _AXIS_RE.match(step)
+        step_axis = axis
+        if match:
+            step_axis = match.group('axis')
+            step = step[match.end():]
+        tag, predicates = _predicates(step)
+        parsed = {
+            'axis': step_axis, 'tag': tag, 'predicates': predicates,
+            'attributes': {}, 'contains': {}, 'text': None, 'position': None,
+        }
+        for predicate in predicates:
+            for clause in _split_top_level(predicate, ' and '):
+                clause = clause.strip()
+                if clause.isdigit():
+                    parsed['position'] = int(clause)
+                elif _ATTRIBUTE_RE.match(clause):
+                    found = _ATTRIBUTE_RE.match(clause)
+                    parsed['attributes'][found.group('name')] = found.group('value')
+                elif _CONTAINS_RE.match(clause):
+                    found = _CONTAINS_RE.match(clause)
+                    parsed['contains'][found.group('name')] = found.group('value')
+                elif _TEXT_RE.match(clause):
+                    parsed['text'] = _TEXT_RE.match(clause).group('value')
+        steps.append(parsed)
+        axis = 'child'
+    if steps and position is not None:
+        steps[-1]['position'] = position
+    return steps
+
+
+class CompiledSelector:
+    """
+    Un selector analizado una vez. `xpath` es la expresión XPath equivalente
+    (None si el CSS no se puede traducir) y `compiled` el `etree.XPath` listo
+    para evaluar; `valid` indica si compila.
+    """
+
+    def __init__(self, selector):
+        self.selector = selector
+        self.expression = strip_selector_engine(selector)
+        self.kind = 'xpath' if is_xpath_selector(selector) else 'css'
+        self.xpath = self.expression if self.kind == 'xpath' else _translate_css(self.expression)
+        self.normalized = normalize_selector_text(selector)
+        self.compiled = None
+        if self.xpath is not None:
+            try:
+                self.compiled = etree.XPath(self.xpath, smart_strings=False)
+            except etree.XPathError:
+                self.compiled = None
+
+    @property
+    def valid(self):
+        return self.compiled is not None
+
+    def select(self, tree):
+        """Elementos que encuentra en `tree`, o None si no se puede evaluar."""
+        if tree is None or self.compiled is None:
+            return None
+        try:
+            result = self.compiled(tree)
+        except Exception:
+            return None
+        if not isinstance(result, list):
+            return None
+        return [node for node in result if isinstance(getattr(node, 'tag', None), str)]
+
+    @cached_property
+    def steps(self):
+        return parse_xpath_steps(self.xpath) if self.xpath else []
+
+    @cached_property
+    def attributes(self):
+        """Atributos con valor exacto del último paso (el elemento objetivo)."""
+        return dict(self.steps[-1]['attributes']) if self.steps else {}
+
+    @cached_property
+    def quoted(self):
+        """El selector con comillas dobles en los valores de atributo sin comillas (`@id=go`)."""
+        return _BARE_VALUE_RE.sub(r'\1="\2"', self.selector)
+
+    @cached_property
+    def double_quoted(self):
+        """El selector con comillas dobles en todos los valores de atributo, como los pide el driver."""
+        corrected = _ANY_VALUE_RE.sub(r'\1="\2"', self.selector)
+        if corrected.count('"') % 2 != 0:
+            corrected = corrected.replace(']"', ']')
+        return corrected
+
+    @cached_property
+    def literals(self):
+        """Todos los literales entre comillas del selector original."""
+        return [single or double for single, double in _LITERAL_RE.findall(self.expression)]
+
+    def __repr__(self):
+        return f"<CompiledSelector({self.kind}: {self.selector!r})>"
+
+
+class SelectorRegistry:
+    """LRU de `CompiledSelector` por texto de selector, seguro entre hilos."""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, selector):
+        with self._lock:
+            compiled = self._entries.get(selector)
+            if compiled is not None:
+                self._entries.move_to_end(selector)
+                self.hits += 1
+                return compiled
+            self.misses += 1
+        # Se compila fuera del bloqueo; si dos hilos compilan a la vez, gana el primero
+        compiled = CompiledSelector(selector)
+        with self._lock:
+            existing = self._entries.get(selector)
+            if existing is not None:
+                return existing
+            self._entries[selector] = compiled
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return compiled
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+# Registro compartido por todo el proceso
+registry = SelectorRegistry(Config.SELECTOR_CACHE_SIZE)
+
+
+def compile_selector(selector, cache=True):
+    """
+    `CompiledSelector` de `selector` desde el registro compartido. Con
+    `cache=False` se compila sin guardarlo, para selectores que se evalúan una
+    sola vez (líneas de una respuesta del LLM) y no deben desalojar a los del
+    flujo.
+    """
+    if not cache:
+        return CompiledSelector(selector)
+    return registry.get(selector)
@@ -0,0 +1,80 @@
+"""
+Benchmark del registro de selectores compilados.
+
+Simula un flujo con muchos selectores por paso (extracción de contexto más
+validación de una cadena de respaldo por acción) y compara el coste por paso
+evaluando cada selector en crudo (`tree.xpath(texto)`, CSS traducido cada vez)
+con el del registro compartido (`chopperfix.selector_registry`).
+
+    python examples/selector_benchmark.py --steps 300 --selectors 40
+"""
+import argparse
+import time
+
+from cssselect import HTMLTranslator
+from lxml import etree
+
+from chopperfix.element_context import is_xpath_selector, strip_selector_engine
+from chopperfix.selector_registry import SelectorRegistry
+
+
+def build_page(rows):
+    items = ''.join(
+        f"<li class='item row-{i % 7}' data-testid='item-{i}'>"
+        f"<a href='/item/{i}' title='Item {i}'>Item {i}</a><button name='buy-{i}'>Comprar</button></li>"
+        for i in range(rows)
+    )
+    return f"<html><body><nav id='menu'><a href='/'>Inicio</a></nav><ul id='list'>{items}</ul></body></html>"
+
+
+def build_selectors(count, rows):
+    selectors = []
+    for i in range(count):
+        row = (i * 37) % rows
+        selectors.extend([
+            f"//li[@data-testid='item-{row}']/a",
+            f"//ul[@id='list']//button[@name='buy-{row}']",
+            f"css=li[data-testid='item-{row}'] > button",
+            f"//a[normalize-space()='Item {row}']",
+        ])
+    return selectors[:count]
+
+
+def raw_select(tree, selector):
+    raw = strip_selector_engine(selector)
+    xpath = raw if is_xpath_selector(selector) else HTMLTranslator().css_to_xpath(raw)
+    return tree.xpath(xpath)
+
+
+def run(steps, selector_count, rows):
+    tree = etree.HTML(build_page(rows))
+    selectors = build_selectors(selector_count, rows)
+    registry = SelectorRegistry()
+
+    started = time.perf_counter()
+    for _ in range(steps):
+        for selector in selectors:
+            raw_select(tree, selector)
+    raw_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for _ in range(steps):
+        for selector in selectors:
+            registry.get(selector).select(tree)
+    compiled_seconds = time.perf_counter() - started
+
+    raw_ms = raw_seconds / steps * 1000
+    compiled_ms = compiled_seconds / steps * 1000
+    print(f"Pasos: {steps}, selectores por paso: {len(selectors)}, filas: {rows}")
+    print(f"Sin registro: {raw_ms:.3f} ms/paso")
+    print(f"Con registro: {compiled_ms:.3f} ms/paso ({raw_ms / compiled_ms:.1f}x)")
+    print(f"Registro: {registry.stats()}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--steps', type=int, default=300)
+    parser.add_argument('--selectors', type=int, default=40)
+    parser.add_argument('--rows', type=int, default=200)
+    args = parser.parse_args()
+    run(args.steps, args.selectors, args.rows)
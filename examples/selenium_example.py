@@ -0,0 +1,51 @@
+from selenium import webdriver
+from selenium.webdriver.common.by import By
+
+from chopperfix.chopper_decorators import chopperdoc
+
+
+class CustomSelenium:
+    def __init__(self, timeout=5, retry_attempts=1):
+        self.driver = webdriver.Chrome()
+        self.driver.implicitly_wait(timeout)
+        self.retry_attempts = retry_attempts
+
+    @chopperdoc
+    def perform_action(self, action, **kwargs):
+        for attempt in range(self.retry_attempts):
+            try:
+                if action == 'navigate':
+                    self.driver.get(kwargs.get('url', ''))
+                    return True
+                element = self.driver.find_element(By.XPATH, kwargs['xpath'])
+                if action == 'click':
+                    element.click()
+                elif action == 'type':
+                    element.clear()
+                    element.send_keys(kwargs.get('text', ''))
+                elif action == 'press':
+                    element.send_keys(kwargs.get('key', ''))
+                return True
+            except Exception as e:
+                print(f"Intento {attempt + 1} fallido: {e}")
+                if attempt == self.retry_attempts - 1:
+                    raise
+
+    def click(self, xpath):
+        return self.perform_action('click', xpath=xpath)
+
+    def navigate(self, url):
+        return self.perform_action('navigate', url=url)
+
+    def type(self, xpath, text):
+        return self.perform_action('type', xpath=xpath, text=text)
+
+    def close(self):
+        self.driver.quit()
+
+
+# Prueba del decorador y self-healing con Selenium en Wikipedia
+driver = CustomSelenium()
+driver.navigate('https://www.wikipedia.org')
+driver.type(xpath="//input[@id='casmpo_ingreso']", text='One piece')  # Selector inválido: activa el self-healing
+driver.close()
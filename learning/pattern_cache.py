@@ -0,0 +1,240 @@
+"""
+Caché en memoria de los patrones más usados, delante de `PatternStorage`.
+
+Las claves son la tripleta normalizada (acción, selector, URL). La primera vez
+que se consulta una URL se cargan todos sus patrones en una sola consulta; a
+partir de ahí las lecturas son búsquedas en diccionario. Las escrituras se
+aplican en memoria y se propagan a la base de datos al momento
+(write-through) o en lotes (write-behind). Los fallos con reemplazo se
+escriben siempre al momento: otros workers (`HealCoordinator`) esperan a
+verlos en la base de datos. Otros procesos se detectan mediante el contador
+de versión de la base de datos.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from learning.pattern_storage import Pattern
+
+
+class CachedPattern:
+    __slots__ = (
+        'action', 'selector', 'url', 'replacement_selector', 'peso',
+        'usage_count', 'success_rate', 'failed', 'active',
+    )
+
+    def __init__(self, action, selector, url, replacement_selector=None, peso=1.0,
+                 usage_count=0, success_rate=0.0, failed=False, active=True):
+        self.action = action
+        self.selector = selector
+        self.url = url
+        self.replacement_selector = replacement_selector
+        self.peso = peso
+        self.usage_count = usage_count
+        self.success_rate = success_rate
+        self.failed = failed
+        self.active = active
+
+    def record(self, success, replacement_selector=None):
+        """Aplica las mismas reglas que `PatternStorage.save_pattern`."""
+        self.usage_count += 1
+        self.success_rate = (
+            (self.success_rate * (self.usage_count - 1) + (1 if success else 0)) / self.usage_count
+        )
+        self.failed = not success
+        if not success and replacement_selector:
+            self.replacement_selector = replacement_selector
+        self.peso += 0.1 if success else -0.1
+
+
+def _updated(entry, key, success, replacement_selector):
+    """`entry` con una escritura más aplicada (o uno nuevo si no existía)."""
+    if entry is None:
+        return CachedPattern(
+            key[0], key[1], key[2],
+            replacement_selector=replacement_selector,
+            usage_count=1,
+            success_rate=1.0 if success else 0.0,
+            failed=not success,
+        )
+    entry.record(success, replacement_selector)
+    return entry
+
+
+class PatternCache:
+    """
+    Proxy de `PatternStorage` con caché LRU. Los métodos que no se cachean se
+    delegan tal cual en el almacenamiento.
+    """
+
+    _COLUMNS = (
+        Pattern.action, Pattern.selector, Pattern.url, Pattern.replacement_selector,
+        Pattern.peso, Pattern.usage_count, Pattern.success_rate, Pattern.failed, Pattern.active,
+    )
+
+    def __init__(self, storage, max_entries=2000, write_behind=False, batch_size=50,
+                 check_interval=1.0):
+        self.storage = storage
+        self.max_entries = max_entries
+        self.write_behind = write_behind
+        self.batch_size = batch_size
+        self.check_interval = check_interval
+        # El decorador, los hilos del ejecutor y el planificador comparten la caché
+        self._lock = threading.RLock()
+        self._entries = OrderedDict()
+        self._loaded_urls = set()
+        self._pending = []
+        self._version = storage.get_version()
+        self._last_check = time.monotonic()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def __getattr__(self, name):
+        return getattr(self.storage, name)
+
+    # -- coherencia ----------------------------------------------------------
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+            self._loaded_urls.clear()
+            self.invalidations += 1
+
+    def _check_version(self):
+        now = time.monotonic()
+        if now - self._last_check < self.check_interval:
+            return
+        self._last_check = now
+        version = self.storage.get_version()
+        if version != self._version:
+            self.invalidate()
+            self._version = version
+
+    def _after_write(self, previous_version, previous_bumps):
+        # Si sólo hemos escrito nosotros, la versión avanza lo mismo que nuestros
+        # propios incrementos y la caché sigue siendo válida
+        if self.storage.last_version != previous_version + (self.storage.version_bumps - previous_bumps):
+            self.invalidate()
+        self._version = self.storage.last_version
+
+    # -- lecturas ------------------------------------------------------------
+
+    def _key(self, action, selector, url):
+        return action, self.storage.normalize_selector(selector), self.storage.normalize_url(url)
+
+    def _remember(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            _, evicted = self._entries.popitem(last=False)
+            # La URL deja de estar completa en memoria
+            self._loaded_urls.discard(evicted.url)
+
+    def _preload(self, normalized_url, key=None):
+        if normalized_url in self._loaded_urls:
+            return
+        rows = self.storage.storage_for(normalized_url).session.query(*self._COLUMNS).filter(Pattern.url == normalized_url).all()
+        loaded = {(row.action, row.selector, row.url): CachedPattern(*row) for row in rows}
+        for record in self._pending:
+            pending_key = self._key(record['action'], record['selector'], record['url'])
+            if pending_key[2] == normalized_url and pending_key not in self._entries:
+                # Entrada desalojada con escrituras pendientes: la base de datos aún no las tiene
+                loaded[pending_key] = _updated(
+                    loaded.get(pending_key), pending_key, record['success'], record['replacement_selector']
+                )
+        # Si la URL no cabe en la caché, un desalojo durante la carga la vuelve a
+        # marcar como incompleta; la clave pedida se carga la última para conservarla
+        self._loaded_urls.add(normalized_url)
+        for loaded_key, entry in sorted(loaded.items(), key=lambda item: item[0] == key):
+            # Lo que ya está en memoria es igual o más reciente que la base de datos
+            if loaded_key not in self._entries:
+                self._remember(loaded_key, entry)
+
+    def get(self, action, selector, url):
+        """Devuelve el `CachedPattern` de la tripleta o None si no existe."""
+        key = self._key(action, selector, url)
+        with self._lock:
+            self._check_version()
+            self._preload(key[2], key)
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def get_stored_replacement(self, action, selector, url):
+        entry = self.get(action, selector, url)
+        if entry is not None and entry.failed and entry.replacement_selector:
+            return entry.replacement_selector
+        if entry is not None and not entry.failed:
+            return None
+        # Sin patrón exacto: se consulta la plantilla de URL en la base de datos
+        return self.storage.get_stored_replacement(action, selector, url)
+
+    # -- escrituras ----------------------------------------------------------
+
+    def _apply(self, key, success, replacement_selector):
+        self._remember(key, _updated(self._entries.get(key), key, success, replacement_selector))
+
+    def save_pattern(self, action, selector, url, description, success=True,
+                     replacement_selector=None, **context):
+        key = self._key(action, selector, url)
+        record = dict(
+            action=action, selector=selector, url=url, description=description,
+            success=success, replacement_selector=replacement_selector, **context
+        )
+        with self._lock:
+            self._check_version()
+            if self.write_behind:
+                # Sin la fila en memoria no se podrían acumular sus contadores
+                self._preload(key[2], key)
+                self._apply(key, success, replacement_selector)
+                self._pending.append(record)
+                # Un reemplazo tiene que estar en la base de datos para los demás workers
+                if len(self._pending) >= self.batch_size or (not success and replacement_selector):
+                    self._flush()
+                return
+            # Write-through: la base de datos ya lee y actualiza la fila, así que
+            # sólo se actualiza la memoria si la URL ya está cargada
+            if key[2] in self._loaded_urls:
+                self._apply(key, success, replacement_selector)
+            previous_version, previous_bumps = self._version, self.storage.version_bumps
+        self.storage.save_pattern(**record)
+        with self._lock:
+            self._after_write(previous_version, previous_bumps)
+
+    def _flush(self):
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, []
+        previous_version, previous_bumps = self._version, self.storage.version_bumps
+        self.storage.save_patterns(pending)
+        self._after_write(previous_version, previous_bumps)
+
+    def flush(self):
+        """Escribe en la base de datos las escrituras pendientes (write-behind)."""
+        with self._lock:
+            self._flush()
+
+    def stats(self):
+        with self._lock:
+            return self._stats()
+
+    def _stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'urls': len(self._loaded_urls),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+            'invalidations': self.invalidations,
+            'pending_writes': len(self._pending),
+        }
+
+    def close(self):
+        self.flush()
+        self.storage.close()
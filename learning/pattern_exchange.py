@@ -0,0 +1,93 @@
+"""
+Formato de intercambio de patrones entre nodos (JSONL, opcionalmente gzip).
+
+Cada línea es un patrón con sus contadores y su contexto. Se lee y escribe en
+streaming para no cargar nunca la tabla entera en memoria; la fusión con la
+base de datos local la hace `PatternStorage.import_patterns`.
+"""
+import gzip
+import json
+from datetime import datetime
+
+from learning import scoring
+
+FORMAT_VERSION = 1
+
+# Columnas que viajan en el fichero (el id y la plantilla de URL son locales)
+EXPORTED_FIELDS = (
+    'action', 'selector', 'url', 'description', 'timestamp', 'full_element_html',
+    'parent_element', 'child_elements', 'sibling_elements', 'peso', 'usage_count',
+    'success_rate', 'active', 'failed', 'replacement_selector', 'decayed_successes',
+    'decayed_attempts', 'score_updated_at', 'decayed_score', 'fallback_selectors',
+    'raw_selector',
+)
+DATETIME_FIELDS = ('timestamp', 'score_updated_at')
+
+
+def open_stream(path, mode):
+    """Abre el fichero en modo texto; los `.gz` se comprimen con gzip."""
+    if str(path).endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+def pattern_to_record(pattern):
+    record = {field: getattr(pattern, field) for field in EXPORTED_FIELDS}
+    for field in DATETIME_FIELDS:
+        if record[field] is not None:
+            record[field] = record[field].isoformat()
+    return record
+
+
+def record_from_json(line):
+    record = json.loads(line)
+    for field in DATETIME_FIELDS:
+        if record.get(field):
+            record[field] = datetime.fromisoformat(record[field])
+    return record
+
+
+def write_records(stream, records):
+    count = 0
+    for record in records:
+        stream.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')))
+        stream.write('\n')
+        count += 1
+    return count
+
+
+def read_chunks(stream, chunk_size):
+    """Genera listas de hasta `chunk_size` registros."""
+    chunk = []
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        chunk.append(record_from_json(line))
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def decayed_evidence(successes, attempts, updated_at, success_rate, usage_count, timestamp):
+    """(éxitos, intentos, fecha) de un patrón, partiendo de sus totales si no tiene decaimiento."""
+    if attempts is None:
+        return (success_rate or 0.0) * (usage_count or 0), float(usage_count or 0), timestamp
+    return successes or 0.0, attempts, updated_at or timestamp
+
+
+def merge_evidence(local, incoming, half_life_seconds):
+    """
+    Suma dos evidencias con decaimiento llevándolas a la fecha más reciente.
+    Devuelve (éxitos, intentos, fecha, score).
+    """
+    dates = [date for date in (local[2], incoming[2]) if date is not None]
+    now = max(dates) if dates else datetime.utcnow()
+    successes = attempts = 0.0
+    for evidence_successes, evidence_attempts, date in (local, incoming):
+        factor = scoring.decay_factor(((now - date).total_seconds() if date else 0.0), half_life_seconds)
+        successes += evidence_successes * factor
+        attempts += evidence_attempts * factor
+    return successes, attempts, now, scoring.score(successes, attempts)
@@ -13,18 +13,34 @@ from sqlalchemy import (
     JSON,
     or_,
     and_,
+    case,
+    inspect,
+    select,
+    text,
 )
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-
-from llm_integration.langchain_manager import LangChainManager
+from sqlalchemy.orm import scoped_session, sessionmaker
+
+from chopperfix.selector_registry import compile_selector
+from learning import pattern_exchange, scoring
+from learning.selector_search import SelectorSearchIndex
+from learning.url_templates import UrlTemplateInferrer
+from llm_integration.backend import create_llm_manager
+from self_healing.candidates import (
+    find_local_replacement,
+    is_unique_match,
+    parse_html,
+    select_elements,
+)
 
 Base = declarative_base()
 
 
 def agregar_comillas_xpath(xpath):
     """Agrega comillas a los atributos en expresiones XPath."""
-    return re.sub(r"(@[\w-]+)=([\w-]+)", r'\1="\2"', xpath)
+    if not xpath:
+        return xpath
+    return compile_selector(xpath).quoted
 
 
 class Pattern(Base):
@@ -34,6 +50,7 @@ class Pattern(Base):
     action = Column(String, nullable=False)
     selector = Column(String, nullable=False)
     url = Column(String, nullable=False)
+    url_template = Column(String, index=True)
     description = Column(Text)
     timestamp = Column(DateTime, default=datetime.utcnow)
     full_element_html = Column(Text)
@@ -46,6 +63,18 @@ class Pattern(Base):
     active = Column(Boolean, default=True)
     failed = Column(Boolean, default=False)
     replacement_selector = Column(String, nullable=True)
+    # Selector tal como lo usó el flujo: `selector` es la clave normalizada (sin
+    # espacios ni comillas) y no siempre se puede evaluar contra el DOM
+    raw_selector = Column(String)
+    decayed_successes = Column(Float)
+    decayed_attempts = Column(Float)
+    score_updated_at = Column(DateTime)
+    decayed_score = Column(Float, default=scoring.PRIOR, index=True)
+    # Selectores alternativos verificados contra el DOM al grabar, del más al menos estable
+    fallback_selectors = Column(JSON)
+    # Huella estructural de referencia del elemento y deriva medida en el último éxito
+    element_fingerprint = Column(JSON)
+    drift_score = Column(Float)
 
     def __repr__(self):
         return (
@@ -55,12 +84,96 @@ class Pattern(Base):
         )
 
 
+class StoreVersion(Base):
+    """
+    Contador que se incrementa en cada escritura que cambia lo que devuelven
+    las búsquedas (patrones nuevos, fallos, reemplazos, plantillas); sirve para
+    invalidar cachés de otros procesos y planes de reproducción compilados.
+    """
+    __tablename__ = 'pattern_store_version'
+
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+
+def effective_selector(pattern):
+    """
+    Selector con el que comprobar el patrón contra el DOM: el reemplazo si el
+    original está roto o el selector tal como se grabó. None en patrones
+    antiguos sin `raw_selector`, cuya clave normalizada no es evaluable (se
+    pierden comillas y espacios: `//a[text()='Sign in']` → `//a[text()=Signin]`).
+    """
+    if pattern.failed and pattern.replacement_selector:
+        return agregar_comillas_xpath(pattern.replacement_selector)
+    return pattern.raw_selector or None
+
+
+def _evidence(pattern, now):
+    """(éxitos, intentos, fecha) ponderados del patrón, a partir de sus totales si es anterior al decaimiento."""
+    if pattern.decayed_attempts is None:
+        successes = (pattern.success_rate or 0.0) * (pattern.usage_count or 0)
+        return successes, float(pattern.usage_count or 0), pattern.timestamp or now
+    return pattern.decayed_successes or 0.0, pattern.decayed_attempts, pattern.score_updated_at or now
+
+
+def current_score(pattern, now=None, half_life_seconds=scoring.DEFAULT_HALF_LIFE_SECONDS):
+    """
+    Puntuación del patrón decaída hasta `now`. `decayed_score` está calculada a
+    fecha de la última escritura; un patrón que no se ha vuelto a usar conserva
+    allí su puntuación antigua hasta el siguiente `recompute_scores`.
+    """
+    now = now or datetime.utcnow()
+    successes, attempts, updated_at = _evidence(pattern, now)
+    factor = scoring.decay_factor((now - updated_at).total_seconds(), half_life_seconds)
+    return scoring.score(successes * factor, attempts * factor)
+
+
+def search_rank(normalized_url, now=None, half_life_seconds=scoring.DEFAULT_HALF_LIFE_SECONDS):
+    """
+    Clave de orden de los resultados [(patrón, similitud)] de `search_patterns`:
+    similitud, URL exacta, puntuación decaída hasta `now`, peso y tasa de éxito.
+    """
+    now = now or datetime.utcnow()
+    return lambda item: (
+        -round(item[1], 3),
+        item[0].url != normalized_url,
+        -current_score(item[0], now, half_life_seconds),
+        -(item[0].peso or 0.0),
+        -(item[0].success_rate or 0.0),
+    )
+
+
 class PatternStorage:
-    def __init__(self, db_url='sqlite:///patterns.db'):
-        self.engine = create_engine(db_url)
+    def __init__(self, db_url='sqlite:///patterns.db',
+                 half_life_seconds=scoring.DEFAULT_HALF_LIFE_SECONDS, llm_manager=None,
+                 schema=None):
+        self.half_life_seconds = half_life_seconds
+        # Gestor LLM para `get_replacement_selector` (por defecto, uno nuevo del backend configurado)
+        self.llm_manager = llm_manager
+        self._score_scheduler = None
+        self.schema = schema
+        if schema:
+            # Esquema propio en PostgreSQL (una partición de `ShardedPatternStorage`)
+            self.engine = create_engine(db_url, connect_args={'options': f'-csearch_path={schema},public'})
+            self._create_schema(schema)
+        else:
+            self.engine = create_engine(db_url)
         Base.metadata.create_all(self.engine)
-        self.Session = sessionmaker(bind=self.engine)
-        self.session = self.Session()
+        self._migrate_schema()
+        self.selector_index = SelectorSearchIndex(self.engine, Pattern)
+        # Los objetos se desvinculan al confirmar, así que no hace falta expirarlos
+        self.Session = sessionmaker(bind=self.engine, expire_on_commit=False)
+        # Una sesión por hilo (el decorador, el planificador y los crawlers en hilos)
+        self.session = scoped_session(self.Session)
+        self.url_templates = UrlTemplateInferrer()
+        for (known_url,) in self.session.query(Pattern.url).distinct():
+            self.url_templates.observe(known_url)
+        if self.session.get(StoreVersion, 1) is None:
+            self.session.add(StoreVersion(id=1, version=0))
+            self.session.commit()
+        self.last_version = self.get_version()
+        # Incrementos de versión hechos por este objeto (para `PatternCache`)
+        self.version_bumps = 0
         # self.nlp = self.load_spacy_model()
 
     # def load_spacy_model(self):
@@ -79,12 +192,36 @@ class PatternStorage:
     #                 not token.is_stop]
     #     return keywords
 
+    def _create_schema(self, schema):
+        if not re.fullmatch(r'[A-Za-z_][A-Za-z0-9_]*', schema):
+            raise ValueError(f"Nombre de esquema no válido: '{schema}'")
+        with self.engine.begin() as connection:
+            connection.execute(text(f"CREATE SCHEMA IF NOT EXISTS {schema}"))
+        try:
+            # pg_trgm se instala una sola vez en `public`, visible desde todos los esquemas
+            with self.engine.begin() as connection:
+                connection.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm WITH SCHEMA public"))
+        except Exception as e:
+            print(f"[WARN] No se pudo instalar pg_trgm en public: {e}")
+
+    def _migrate_schema(self):
+        """Añade a una base de datos existente las columnas e índices nuevos."""
+        existing = {column['name'] for column in inspect(self.engine).get_columns(Pattern.__tablename__)}
+        with self.engine.begin() as connection:
+            for column in Pattern.__table__.columns:
+                if column.name in existing:
+                    continue
+                column_type = column.type.compile(dialect=self.engine.dialect)
+                connection.execute(text(
+                    f"ALTER TABLE {Pattern.__tablename__} ADD COLUMN {column.name} {column_type}"
+                ))
+        for index in Pattern.__table__.indexes:
+            index.create(self.engine, checkfirst=True)
+
     def normalize_selector(self, selector):
         if not selector:
             return selector
-        normalized = re.sub(r'\s+', '', selector.strip())
-        normalized = re.sub(r'[\"\'<>]', '', normalized)
-        return normalized
+        return compile_selector(selector).normalized
 
     def normalize_url(self, url):
         url = re.sub(r'^(https?://)?(www\.)?', '', url)
@@ -93,6 +230,56 @@ class PatternStorage:
         url = url.rstrip('/')
         return url
 
+    def get_version(self):
+        """Versión actual de la base de datos de patrones."""
+        return self.session.query(StoreVersion.version).filter(StoreVersion.id == 1).scalar() or 0
+
+    def _commit(self, bump=True):
+        """
+        Confirma la transacción. Con `bump`, incrementa también el contador de
+        versión; las escrituras que sólo actualizan contadores de uso no lo
+        tocan, para no serializar todos los pasos en la misma fila.
+        """
+        if bump:
+            self.session.query(StoreVersion).filter(StoreVersion.id == 1).update(
+                {StoreVersion.version: StoreVersion.version + 1}, synchronize_session=False
+            )
+            self.last_version = self.get_version()
+            self.version_bumps += 1
+        self.session.commit()
+        # Tras confirmar se vacía el mapa de identidad para que la memoria no crezca
+        self.session.expunge_all()
+
+    def storage_for(self, url):
+        """Almacenamiento que guarda los patrones de `url` (él mismo; ver `ShardedPatternStorage`)."""
+        return self
+
+    def url_template(self, url):
+        """Devuelve la plantilla de la URL normalizada (p. ej. 'wikipedia.org/wiki/{slug}')."""
+        return self.url_templates.template_for(self.normalize_url(url))
+
+    def _observe_url(self, normalized_url):
+        """Registra la URL y reindexa los patrones cuyo grupo acaba de formar plantilla."""
+        for member_url in self.url_templates.observe(normalized_url):
+            if member_url == normalized_url:
+                continue
+            self.session.query(Pattern).filter(Pattern.url == member_url).update(
+                {Pattern.url_template: self.url_templates.template_for(member_url)},
+                synchronize_session=False,
+            )
+        return self.url_templates.template_for(normalized_url)
+
+    def _url_filter(self, normalized_url):
+        """Filtro por URL exacta o por su plantilla."""
+        template = self.url_templates.template_for(normalized_url)
+        if template == normalized_url:
+            return Pattern.url == normalized_url
+        return or_(Pattern.url == normalized_url, Pattern.url_template == template)
+
+    def _exact_first(self, normalized_url):
+        # La URL exacta tiene prioridad sobre los patrones de la plantilla
+        return case((Pattern.url == normalized_url, 0), else_=1)
+
     def update_original_pattern(self, action, original_selector, url,
                                 replacement_selector):
         normalized_url = self.normalize_url(url)
@@ -105,7 +292,7 @@ class PatternStorage:
         if pattern:
             pattern.replacement_selector = replacement_selector
             pattern.failed = True
-            self.session.commit()
+            self._commit()
             print(
                 f"Patrón original actualizado: {original_selector} -> "
                 f"{replacement_selector}"
@@ -115,8 +302,41 @@ class PatternStorage:
                      replacement_selector=None, full_element_html=None,
                      parent_element=None, child_elements=None,
                      sibling_elements=None):
+        changed = self._apply_pattern(
+            action, selector, url, description, success=success,
+            replacement_selector=replacement_selector,
+            full_element_html=full_element_html,
+            parent_element=parent_element,
+            child_elements=child_elements,
+            sibling_elements=sibling_elements,
+        )
+        self._commit(bump=changed)
+
+    def save_patterns(self, records):
+        """
+        Guarda varios patrones en una sola transacción. Cada registro es un
+        dict con los mismos argumentos que `save_pattern`.
+        """
+        if not records:
+            return
+        changed = False
+        for record in records:
+            changed = self._apply_pattern(**record) or changed
+            self.session.flush()
+        self._commit(bump=changed)
+
+    def _apply_pattern(self, action, selector, url, description, success=True,
+                       replacement_selector=None, full_element_html=None,
+                       parent_element=None, child_elements=None,
+                       sibling_elements=None):
+        """
+        Inserta o actualiza el patrón. Devuelve True si cambia lo que ven las
+        búsquedas (patrón nuevo, estado de fallo, reemplazo o plantilla) y no
+        sólo sus contadores.
+        """
         normalized_selector = self.normalize_selector(selector)
         normalized_url = self.normalize_url(url)
+        url_template = self._observe_url(normalized_url)
 
         existing_pattern = self.session.query(Pattern).filter_by(
             action=action,
@@ -124,7 +344,15 @@ class PatternStorage:
             url=normalized_url,
         ).first()
 
+        now = datetime.utcnow()
         if existing_pattern:
+            changed = (
+                existing_pattern.failed != (not success)
+                or existing_pattern.url_template != url_template
+                or bool(not success and replacement_selector
+                        and existing_pattern.replacement_selector != replacement_selector)
+            )
+            self._update_decayed_score(existing_pattern, success, now)
             existing_pattern.usage_count += 1
             existing_pattern.success_rate = (
                 (existing_pattern.success_rate *
@@ -137,6 +365,8 @@ class PatternStorage:
             existing_pattern.description = description
             existing_pattern.timestamp = datetime.utcnow()
             existing_pattern.peso += 0.1 if success else -0.1
+            existing_pattern.url_template = url_template
+            existing_pattern.raw_selector = selector
 
             if full_element_html:
                 existing_pattern.full_element_html = full_element_html
@@ -151,17 +381,24 @@ class PatternStorage:
                 f"Patrón actualizado: {existing_pattern.selector} "
                 f"para la URL {normalized_url}"
             )
+            return changed
         else:
             new_pattern = Pattern(
                 action=action,
                 selector=normalized_selector,
                 url=normalized_url,
+                url_template=url_template,
+                raw_selector=selector,
                 description=description,
                 peso=1.0,
                 usage_count=1,
                 success_rate=1.0 if success else 0.0,
                 failed=not success,
                 replacement_selector=replacement_selector,
+                decayed_successes=1.0 if success else 0.0,
+                decayed_attempts=1.0,
+                score_updated_at=now,
+                decayed_score=scoring.score(1.0 if success else 0.0, 1.0),
                 full_element_html=full_element_html,
                 parent_element=parent_element,
                 child_elements=child_elements,
@@ -172,43 +409,117 @@ class PatternStorage:
                 f"Nuevo patrón guardado: {normalized_selector} "
                 f"para la URL {normalized_url}"
             )
-
-        self.session.commit()
+            return True
+
+    def _update_decayed_score(self, pattern, success, now):
+        """Actualización incremental de la puntuación con decaimiento en cada escritura."""
+        successes, attempts, updated_at = _evidence(pattern, now)
+        elapsed = (now - updated_at).total_seconds()
+        successes, attempts, score = scoring.update(
+            successes, attempts, elapsed, success, self.half_life_seconds
+        )
+        pattern.decayed_successes = successes
+        pattern.decayed_attempts = attempts
+        pattern.score_updated_at = now
+        pattern.decayed_score = score
+
+    def recompute_scores(self, url=None, now=None, chunk_size=5000):
+        """
+        Recalcula en bloque (NumPy) la puntuación con decaimiento de todos los
+        patrones, o sólo los de una URL, a fecha de `now`. Devuelve cuántos
+        patrones se actualizaron.
+        """
+        now = now or datetime.utcnow()
+        session = self.Session()
+        try:
+            query = session.query(
+                Pattern.id, Pattern.decayed_successes, Pattern.decayed_attempts,
+                Pattern.score_updated_at, Pattern.success_rate, Pattern.usage_count,
+                Pattern.timestamp,
+            )
+            if url is not None:
+                query = query.filter(self._url_filter(self.normalize_url(url)))
+            ids, successes, attempts, elapsed = [], [], [], []
+            for row in query.yield_per(chunk_size):
+                ids.append(row.id)
+                if row.decayed_attempts is None:
+                    successes.append((row.success_rate or 0.0) * (row.usage_count or 0))
+                    attempts.append(float(row.usage_count or 0))
+                    updated_at = row.timestamp or now
+                else:
+                    successes.append(row.decayed_successes or 0.0)
+                    attempts.append(row.decayed_attempts)
+                    updated_at = row.score_updated_at or now
+                elapsed.append((now - updated_at).total_seconds())
+            if not ids:
+                return 0
+            scores = scoring.bulk_scores(successes, attempts, elapsed, self.half_life_seconds)
+            for start in range(0, len(ids), chunk_size):
+                session.bulk_update_mappings(Pattern, [
+                    {'id': pattern_id, 'decayed_score': float(value)}
+                    for pattern_id, value in zip(ids[start:start + chunk_size], scores[start:start + chunk_size])
+                ])
+            session.commit()
+            return len(ids)
+        finally:
+            session.close()
+
+    def start_score_scheduler(self, interval_seconds):
+        """Recalcula las puntuaciones en segundo plano cada `interval_seconds`."""
+        if self._score_scheduler is None:
+            self._score_scheduler = scoring.ScoreScheduler(self, interval_seconds)
+            self._score_scheduler.start()
+        return self._score_scheduler
+
+    def search_patterns(self, selector, url=None, limit=10, min_similarity=0.3,
+                        include_failed=False):
+        """
+        Búsqueda aproximada de patrones por selector (subcadena o parecido).
+        Devuelve [(patrón, similitud)] ordenado por similitud, URL exacta,
+        puntuación con decaimiento, peso y tasa de éxito.
+        """
+        normalized_selector = self.normalize_selector(selector)
+        if not normalized_selector:
+            return []
+        normalized_url = self.normalize_url(url) if url is not None else None
+        template = self.url_templates.template_for(normalized_url) if url is not None else None
+        filters = [self.selector_index.candidate_clause(
+            normalized_selector, max(limit * 20, 200),
+            url=normalized_url, template=template, include_failed=include_failed,
+        )]
+        if url is not None:
+            filters.append(self._url_filter(normalized_url))
+        if not include_failed:
+            filters.append(Pattern.failed.is_(False))
+
+        ranked = []
+        for pattern in self.session.query(Pattern).filter(and_(*filters)):
+            similarity = self.selector_index.score(pattern, normalized_selector)
+            if similarity >= min_similarity:
+                ranked.append((pattern, similarity))
+        ranked.sort(key=search_rank(normalized_url, half_life_seconds=self.half_life_seconds))
+        return ranked[:limit]
 
     def get_patterns(self, failed_selector, url, limit=10):
         normalized_failed_selector = self.normalize_selector(failed_selector)
         normalized_url = self.normalize_url(url)
 
-        patterns = self.session.query(Pattern).filter(
-            and_(
-                Pattern.url == normalized_url,
-                Pattern.failed is False,
-                or_(
-                    Pattern.selector == normalized_failed_selector,
-                    Pattern.selector.like(f"%{normalized_failed_selector}%"),
-                    Pattern.replacement_selector == normalized_failed_selector,
-                    Pattern.replacement_selector.like(
-                        f"%{normalized_failed_selector}%"
-                    ),
-                ),
-            )
-        ).order_by(
-            Pattern.peso.desc(),
-            Pattern.success_rate.desc()
-        ).limit(limit).all()
+        patterns = [pattern for pattern, _ in self.search_patterns(failed_selector, url, limit=limit)]
 
-        if patterns:
-            best_pattern = patterns[0]
+        for best_pattern in patterns:
+            replacement = (
+                best_pattern.selector
+                if best_pattern.selector != normalized_failed_selector
+                else best_pattern.replacement_selector
+            )
+            if not replacement:
+                continue
             print(
                 f"[INFO] Patrón encontrado para el selector: "
                 f"'{normalized_failed_selector}' con peso: "
                 f"{best_pattern.peso}"
             )
-            return (
-                best_pattern.selector
-                if best_pattern.selector != normalized_failed_selector
-                else best_pattern.replacement_selector
-            )
+            return replacement
 
         print(
             f"[WARN] No se encontraron patrones para el selector: "
@@ -217,7 +528,7 @@ class PatternStorage:
         return None
 
     def get_replacement_selector(self, failed_selector, url, action_name):
-        adal_flow_manager = LangChainManager()
+        adal_flow_manager = self.llm_manager or create_llm_manager()
         normalized_failed_selector = self.normalize_selector(failed_selector)
         normalized_url = self.normalize_url(url)
 
@@ -267,6 +578,328 @@ class PatternStorage:
         )
         return None
 
+    def get_active_patterns(self, url=None):
+        """
+        Devuelve los patrones activos con selector real. Si se indica una URL,
+        incluye los de su plantilla, con prioridad para los de la URL exacta y,
+        después, para los de mayor puntuación decaída hasta ahora.
+        """
+        query = self.session.query(Pattern).filter(
+            Pattern.active.is_(True),
+            Pattern.selector != 'URL',
+        )
+        if url is None:
+            return query.order_by(Pattern.url, Pattern.id).all()
+
+        normalized_url = self.normalize_url(url)
+        now = datetime.utcnow()
+        patterns = sorted(
+            query.filter(self._url_filter(normalized_url)).all(),
+            key=lambda pattern: (
+                pattern.url != normalized_url,
+                -current_score(pattern, now, self.half_life_seconds),
+                -(pattern.peso or 0.0),
+                pattern.id,
+            ),
+        )
+        unique = {}
+        for pattern in patterns:
+            unique.setdefault((pattern.action, pattern.selector), pattern)
+        return list(unique.values())
+
+    def iter_active_patterns(self, chunk_size=1000):
+        """
+        Recorre todos los patrones activos leyendo la tabla por bloques, sin
+        cargarla entera en memoria. Los patrones no quedan en `self.session`.
+        """
+        session = self.Session()
+        try:
+            yield from session.scalars(
+                select(Pattern)
+                .where(Pattern.active.is_(True), Pattern.selector != 'URL')
+                .order_by(Pattern.url, Pattern.id)
+                .execution_options(yield_per=chunk_size)
+            )
+        finally:
+            session.close()
+
+    def bulk_update_replacements(self, replacements):
+        """
+        Guarda en una sola transacción los selectores de reemplazo encontrados
+        fuera de línea. `replacements` es una lista de dicts con `id` y
+        `replacement_selector`.
+        """
+        if not replacements:
+            return 0
+        self.session.bulk_update_mappings(Pattern, [
+            {
+                'id': item['id'],
+                'replacement_selector': item['replacement_selector'],
+                'failed': True,
+                'timestamp': datetime.utcnow(),
+            }
+            for item in replacements
+        ])
+        self._commit()
+        print(f"[INFO] {len(replacements)} selectores de reemplazo actualizados")
+        return len(replacements)
+
+    def get_stored_replacement(self, action, selector, url):
+        """Devuelve el reemplazo ya guardado para un selector fallido, si existe."""
+        normalized_url = self.normalize_url(url)
+        pattern = self.session.query(Pattern).filter(
+            Pattern.action == action,
+            Pattern.selector == self.normalize_selector(selector),
+            self._url_filter(normalized_url),
+            Pattern.failed.is_(True),
+            Pattern.replacement_selector.isnot(None),
+        ).order_by(self._exact_first(normalized_url), Pattern.timestamp.desc()).first()
+        return pattern.replacement_selector if pattern else None
+
+    def save_fallback_chain(self, action, selector, url, chain, fingerprint=None, drift=None):
+        """
+        Guarda la cadena de selectores de respaldo de un patrón (ver
+        `self_healing.fallbacks`) y, si se indican, su huella de referencia y la
+        última deriva medida. Los valores None no sobrescriben los guardados.
+        Usa su propia sesión porque se llama desde el hilo de fondo, y no
+        incrementa la versión: estos campos no se cachean. Devuelve False si el
+        patrón aún no existe.
+        """
+        values = {}
+        if chain is not None:
+            values[Pattern.fallback_selectors] = chain
+        if fingerprint is not None:
+            values[Pattern.element_fingerprint] = fingerprint
+        if drift is not None:
+            values[Pattern.drift_score] = drift
+        if not values:
+            return False
+        session = self.Session()
+        try:
+            updated = session.query(Pattern).filter_by(
+                action=action,
+                selector=self.normalize_selector(selector),
+                url=self.normalize_url(url),
+            ).update(values, synchronize_session=False)
+            session.commit()
+            return bool(updated)
+        finally:
+            session.close()
+
+    def get_element_fingerprint(self, action, selector, url):
+        """Huella de referencia guardada para el patrón exacto, o None."""
+        session = self.Session()
+        try:
+            return session.query(Pattern.element_fingerprint).filter_by(
+                action=action,
+                selector=self.normalize_selector(selector),
+                url=self.normalize_url(url),
+            ).scalar()
+        finally:
+            session.close()
+
+    def get_fallback_selectors(self, action, selector, url):
+        """Selectores de respaldo precalculados para un selector, en orden de preferencia."""
+        normalized_url = self.normalize_url(url)
+        patterns = self.session.query(Pattern.fallback_selectors).filter(
+            Pattern.action == action,
+            Pattern.selector == self.normalize_selector(selector),
+            self._url_filter(normalized_url),
+            Pattern.fallback_selectors.isnot(None),
+        ).order_by(self._exact_first(normalized_url), Pattern.timestamp.desc()).limit(5).all()
+        selectors = []
+        for (chain,) in patterns:
+            for item in chain or []:
+                if item.get('selector') and item['selector'] not in selectors:
+                    selectors.append(item['selector'])
+        return selectors
+
+    def heal_url(self, url, html_content, llm_manager=None, extra_failures=None,
+                 dry_run=False):
+        """
+        Repara de una vez todos los selectores activos de una URL.
+
+        Comprueba cada patrón contra una única instantánea del DOM, intenta
+        primero candidatos locales y resuelve el resto con una sola petición en
+        lote al LLM. Cada reemplazo se verifica contra el DOM antes de guardarlo.
+        `extra_failures` permite añadir selectores que aún no están guardados.
+        Devuelve {selector: reemplazo o None}.
+        """
+        tree = parse_html(html_content)
+        failures = []
+        for pattern in self.get_active_patterns(url):
+            effective = effective_selector(pattern)
+            if effective is None or select_elements(tree, effective):
+                continue
+            failures.append({
+                'id': pattern.id,
+                'action': pattern.action,
+                'selector': pattern.selector,
+                'effective_selector': effective,
+                'full_element_html': pattern.full_element_html,
+            })
+        known = {failure['selector'] for failure in failures}
+        for failure in extra_failures or []:
+            if self.normalize_selector(failure['selector']) not in known:
+                failures.append(dict(failure, effective_selector=failure['selector']))
+
+        resolved = {}
+        pending = []
+        for failure in failures:
+            found = find_local_replacement(
+                tree, failure.get('full_element_html'),
+                exclude=(failure['effective_selector'],),
+            )
+            if found:
+                resolved[failure['selector']] = found[0]
+            else:
+                pending.append(failure)
+
+        if pending and llm_manager is not None:
+            print(f"[INFO] Solicitando {len(pending)} selectores en lote al LLM para {url}")
+            suggestions = llm_manager.suggest_alternative_selectors(html_content, pending)
+            for failure in pending:
+                suggestion = suggestions.get(failure['selector'])
+                if suggestion and is_unique_match(tree, suggestion):
+                    resolved[failure['selector']] = suggestion
+                elif suggestion:
+                    print(f"[WARN] Selector sugerido descartado (no coincide con el DOM): '{suggestion}'")
+
+        if not dry_run:
+            self.bulk_update_replacements([
+                {'id': failure['id'], 'replacement_selector': resolved[failure['selector']]}
+                for failure in failures
+                if failure.get('id') and failure['selector'] in resolved
+            ])
+        return {failure['selector']: resolved.get(failure['selector']) for failure in failures}
+
+    def export_patterns(self, path, chunk_size=1000):
+        """
+        Exporta todos los patrones a un fichero JSONL (gzip si acaba en `.gz`)
+        leyendo la tabla por bloques. Devuelve cuántos patrones se escribieron.
+        """
+        with pattern_exchange.open_stream(path, 'w') as stream:
+            return pattern_exchange.write_records(
+                stream, (pattern_exchange.pattern_to_record(pattern) for pattern in self.iter_patterns(chunk_size))
+            )
+
+    def iter_patterns(self, chunk_size=1000):
+        """Recorre todos los patrones por bloques, en orden de id, fuera de `self.session`."""
+        session = self.Session()
+        try:
+            yield from session.scalars(
+                select(Pattern).order_by(Pattern.id).execution_options(yield_per=chunk_size)
+            )
+        finally:
+            session.close()
+
+    def import_patterns(self, path, chunk_size=1000):
+        """
+        Fusiona en la base de datos los patrones de un fichero exportado con
+        `export_patterns`, confirmando cada bloque por separado. Los contadores
+        se suman (importar dos veces el mismo fichero cuenta dos veces sus
+        usos). Devuelve {'inserted': n, 'merged': n}.
+        """
+        stats = {'inserted': 0, 'merged': 0}
+        with pattern_exchange.open_stream(path, 'r') as stream:
+            for chunk in pattern_exchange.read_chunks(stream, chunk_size):
+                self.import_chunk(chunk, stats)
+        print(f"[INFO] Patrones importados: {stats['inserted']} nuevos, {stats['merged']} fusionados")
+        return stats
+
+    def import_chunk(self, chunk, stats):
+        """Fusiona un bloque de registros exportados en una transacción y actualiza `stats`."""
+        existing = {}
+        urls = {self.normalize_url(record['url']) for record in chunk}
+        selectors = {self.normalize_selector(record['selector']) for record in chunk}
+        for pattern in self.session.query(Pattern).filter(
+            Pattern.url.in_(urls), Pattern.selector.in_(selectors)
+        ):
+            existing[(pattern.action, pattern.selector, pattern.url)] = pattern
+        for record in chunk:
+            record['selector'] = self.normalize_selector(record['selector'])
+            record['url'] = self.normalize_url(record['url'])
+            key = (record['action'], record['selector'], record['url'])
+            if key in existing:
+                self._merge_pattern(existing[key], record)
+                stats['merged'] += 1
+            else:
+                existing[key] = self._imported_pattern(record)
+                stats['inserted'] += 1
+        self._commit()
+
+    def _imported_pattern(self, record):
+        pattern = Pattern(**{
+            field: record[field] for field in pattern_exchange.EXPORTED_FIELDS
+            if record.get(field) is not None
+        })
+        pattern.url_template = self._observe_url(pattern.url)
+        if pattern.decayed_score is None:
+            successes, attempts, _ = pattern_exchange.decayed_evidence(
+                pattern.decayed_successes, pattern.decayed_attempts, pattern.score_updated_at,
+                pattern.success_rate, pattern.usage_count, pattern.timestamp,
+            )
+            pattern.decayed_score = scoring.score(successes, attempts)
+        self.session.add(pattern)
+        return pattern
+
+    def _merge_pattern(self, pattern, record):
+        """Combina un patrón local con el mismo patrón aprendido en otro nodo."""
+        local_count = pattern.usage_count or 0
+        local_evidence = pattern_exchange.decayed_evidence(
+            pattern.decayed_successes, pattern.decayed_attempts, pattern.score_updated_at,
+            pattern.success_rate, local_count, pattern.timestamp,
+        )
+        incoming_count = record.get('usage_count') or 0
+        total = local_count + incoming_count
+        if total:
+            pattern.success_rate = (
+                (pattern.success_rate or 0.0) * local_count +
+                (record.get('success_rate') or 0.0) * incoming_count
+            ) / total
+        pattern.usage_count = total
+        # `peso` parte de 1.0 y cada uso lo mueve ±0.1: se suman los desplazamientos
+        local_peso = 1.0 if pattern.peso is None else pattern.peso
+        incoming_peso = record.get('peso')
+        pattern.peso = local_peso + ((1.0 if incoming_peso is None else incoming_peso) - 1.0)
+
+        local_score = pattern.decayed_score if pattern.decayed_score is not None else scoring.PRIOR
+        incoming_score = record.get('decayed_score')
+        if incoming_score is None:
+            incoming_score = scoring.PRIOR
+        incoming_wins = incoming_score > local_score
+        incoming_replacement = record.get('replacement_selector')
+        if incoming_replacement and (not pattern.replacement_selector or incoming_wins):
+            # Reemplazos distintos: gana el del patrón con mejor puntuación
+            pattern.replacement_selector = incoming_replacement
+
+        incoming_timestamp = record.get('timestamp')
+        if incoming_timestamp and (pattern.timestamp is None or incoming_timestamp > pattern.timestamp):
+            # El estado más reciente decide si el selector original está roto
+            pattern.timestamp = incoming_timestamp
+            pattern.failed = bool(record.get('failed'))
+            pattern.active = record.get('active', pattern.active)
+            if record.get('description'):
+                pattern.description = record['description']
+        for field in ('full_element_html', 'parent_element', 'child_elements', 'sibling_elements',
+                      'fallback_selectors', 'raw_selector'):
+            if not getattr(pattern, field) and record.get(field):
+                setattr(pattern, field, record[field])
+
+        successes, attempts, updated_at, score = pattern_exchange.merge_evidence(
+            local_evidence,
+            pattern_exchange.decayed_evidence(
+                record.get('decayed_successes'), record.get('decayed_attempts'),
+                record.get('score_updated_at'), record.get('success_rate'), incoming_count,
+                incoming_timestamp,
+            ),
+            self.half_life_seconds,
+        )
+        pattern.decayed_successes = successes
+        pattern.decayed_attempts = attempts
+        pattern.score_updated_at = updated_at
+        pattern.decayed_score = score
+
     def get_all_patterns(self, limit=10):
         patterns = (
             self.session.query(Pattern)
@@ -277,5 +910,8 @@ class PatternStorage:
         return patterns
 
     def close(self):
-        self.session.close()
+        if self._score_scheduler is not None:
+            self._score_scheduler.stop()
+            self._score_scheduler = None
+        self.session.remove()
         self.engine.dispose()
@@ -0,0 +1,70 @@
+"""
+Puntuación de patrones con decaimiento exponencial en el tiempo.
+
+Cada patrón guarda sus éxitos e intentos ponderados (`decayed_successes`,
+`decayed_attempts`) a fecha de `score_updated_at`. La evidencia pierde la mitad
+de su peso cada `half_life` segundos, y la puntuación es una estimación
+suavizada hacia `PRIOR`:
+
+    score = (éxitos_decaídos + PRIOR * PRIOR_WEIGHT) / (intentos_decaídos + PRIOR_WEIGHT)
+
+Así un selector que funcionó mil veces hace un año vuelve a la incertidumbre
+(0.5) y queda por debajo de uno que funcionó ayer. La actualización de cada
+escritura es escalar; el recálculo completo está vectorizado con NumPy.
+"""
+import threading
+
+import numpy as np
+
+PRIOR = 0.5
+PRIOR_WEIGHT = 1.0
+DEFAULT_HALF_LIFE_SECONDS = 14 * 24 * 3600
+
+
+def decay_factor(elapsed_seconds, half_life_seconds=DEFAULT_HALF_LIFE_SECONDS):
+    return 0.5 ** (max(elapsed_seconds, 0.0) / half_life_seconds)
+
+
+def score(successes, attempts):
+    return (successes + PRIOR * PRIOR_WEIGHT) / (attempts + PRIOR_WEIGHT)
+
+
+def update(successes, attempts, elapsed_seconds, success,
+           half_life_seconds=DEFAULT_HALF_LIFE_SECONDS):
+    """Decae la evidencia hasta ahora y añade un intento. Devuelve (éxitos, intentos, score)."""
+    factor = decay_factor(elapsed_seconds, half_life_seconds)
+    successes = successes * factor + (1.0 if success else 0.0)
+    attempts = attempts * factor + 1.0
+    return successes, attempts, score(successes, attempts)
+
+
+def bulk_scores(successes, attempts, elapsed_seconds,
+                half_life_seconds=DEFAULT_HALF_LIFE_SECONDS):
+    """Versión vectorizada: puntuaciones de todos los patrones decaídas hasta ahora."""
+    successes = np.asarray(successes, dtype=np.float64)
+    attempts = np.asarray(attempts, dtype=np.float64)
+    elapsed = np.clip(np.asarray(elapsed_seconds, dtype=np.float64), 0.0, None)
+    factor = np.exp2(-elapsed / half_life_seconds)
+    return (successes * factor + PRIOR * PRIOR_WEIGHT) / (attempts * factor + PRIOR_WEIGHT)
+
+
+class ScoreScheduler(threading.Thread):
+    """Hilo que ejecuta `storage.recompute_scores()` periódicamente."""
+
+    def __init__(self, storage, interval_seconds):
+        super().__init__(name='chopperfix-scores', daemon=True)
+        self.storage = storage
+        self.interval_seconds = interval_seconds
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval_seconds):
+            try:
+                self.storage.recompute_scores()
+            except Exception as e:
+                print(f"[ERROR] Error al recalcular las puntuaciones: {e}")
+
+    def stop(self):
+        self._stop_event.set()
+        if self.is_alive():
+            self.join()
@@ -0,0 +1,152 @@
+"""
+Índice de búsqueda aproximada de selectores.
+
+Sustituye los `LIKE '%selector%'` (que recorren toda la tabla) por un índice de
+trigramas: una tabla virtual FTS5 con `tokenize='trigram'` en SQLite o índices
+GIN `pg_trgm` en PostgreSQL. El índice sólo preselecciona candidatos; el orden
+final se calcula con la similitud de trigramas y después `peso`/`success_rate`.
+"""
+from sqlalchemy import or_, text
+
+FTS_TABLE = 'patterns_fts'
+MAX_QUERY_TRIGRAMS = 64
+
+_SQLITE_SETUP = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    "selector, replacement_selector, content='patterns', content_rowid='id', tokenize='trigram')",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON patterns BEGIN "
+    f"INSERT INTO {FTS_TABLE}(rowid, selector, replacement_selector) "
+    "VALUES (new.id, new.selector, new.replacement_selector); END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON patterns BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, selector, replacement_selector) "
+    "VALUES ('delete', old.id, old.selector, old.replacement_selector); END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF selector, replacement_selector ON patterns BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, selector, replacement_selector) "
+    "VALUES ('delete', old.id, old.selector, old.replacement_selector); "
+    f"INSERT INTO {FTS_TABLE}(rowid, selector, replacement_selector) "
+    "VALUES (new.id, new.selector, new.replacement_selector); END",
+)
+
+_POSTGRES_SETUP = (
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_patterns_selector_trgm ON patterns USING gin (selector gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_patterns_replacement_trgm ON patterns USING gin (replacement_selector gin_trgm_ops)",
+)
+
+
+def trigrams(value):
+    value = (value or '').lower()
+    return {value[i:i + 3] for i in range(len(value) - 2)}
+
+
+def trigram_similarity(a, b):
+    """Similitud de Jaccard entre los trigramas de dos cadenas (0-1)."""
+    if not a or not b:
+        return 0.0
+    if a == b:
+        return 1.0
+    first, second = trigrams(a), trigrams(b)
+    union = first | second
+    return len(first & second) / len(union) if union else 0.0
+
+
+class SelectorSearchIndex:
+    """Preselección de patrones parecidos a un selector usando el mejor índice disponible."""
+
+    def __init__(self, engine, pattern_model):
+        self.engine = engine
+        self.Pattern = pattern_model
+        self.backend = 'like'
+        dialect = engine.dialect.name
+        if dialect == 'sqlite':
+            self._setup_sqlite()
+        elif dialect == 'postgresql':
+            self._setup_postgres()
+
+    def _setup_sqlite(self):
+        try:
+            with self.engine.begin() as connection:
+                exists = connection.execute(text(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"
+                ), {'name': FTS_TABLE}).first()
+                for statement in _SQLITE_SETUP:
+                    connection.execute(text(statement))
+                if not exists:
+                    # Indexa las filas que ya existían antes de crear el índice
+                    connection.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+            self.backend = 'fts5'
+        except Exception as e:
+            print(f"[WARN] FTS5 con trigramas no disponible, se usará LIKE: {e}")
+
+    def _setup_postgres(self):
+        try:
+            with self.engine.begin() as connection:
+                for statement in _POSTGRES_SETUP:
+                    connection.execute(text(statement))
+            self.backend = 'pg_trgm'
+        except Exception as e:
+            print(f"[WARN] pg_trgm no disponible, se usará LIKE: {e}")
+
+    def _like_clause(self, query):
+        Pattern = self.Pattern
+        return or_(
+            Pattern.selector.contains(query, autoescape=True),
+            Pattern.replacement_selector.contains(query, autoescape=True),
+        )
+
+    @staticmethod
+    def _scope(url, template, include_failed):
+        """Condiciones sobre `patterns` que se aplican antes del LIMIT de preselección."""
+        conditions, params = [], {}
+        if url is not None:
+            if template is not None and template != url:
+                conditions.append("(patterns.url = :scope_url OR patterns.url_template = :scope_template)")
+                params['scope_template'] = template
+            else:
+                conditions.append("patterns.url = :scope_url")
+            params['scope_url'] = url
+        if not include_failed:
+            conditions.append("patterns.failed = :scope_failed")
+            params['scope_failed'] = False
+        return ''.join(f" AND {condition}" for condition in conditions), params
+
+    def candidate_clause(self, query, limit, url=None, template=None, include_failed=True):
+        """
+        Devuelve una condición SQL que limita la consulta a los `limit`
+        patrones más parecidos a `query` según el índice. El filtro de URL (o
+        plantilla) y de fallidos va dentro de la subconsulta: si se aplicara
+        después del LIMIT, los patrones de otras URLs podrían ocupar todos los
+        candidatos y dejar fuera los de la URL buscada.
+        """
+        Pattern = self.Pattern
+        scope, params = self._scope(url, template, include_failed)
+        if self.backend == 'fts5' and len(query) >= 3:
+            terms = sorted(trigrams(query))[:MAX_QUERY_TRIGRAMS]
+            match = ' OR '.join('"' + term.replace('"', '""') + '"' for term in terms)
+            subquery = text(
+                f"SELECT {FTS_TABLE}.rowid FROM {FTS_TABLE} JOIN patterns ON patterns.id = {FTS_TABLE}.rowid "
+                f"WHERE {FTS_TABLE} MATCH :match{scope} ORDER BY {FTS_TABLE}.rank LIMIT :limit"
+            ).bindparams(match=match, limit=limit, **params)
+            return Pattern.id.in_(subquery)
+        if self.backend == 'pg_trgm':
+            contains = '%' + query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+            subquery = text(
+                "SELECT id FROM patterns "
+                "WHERE (selector % :query OR replacement_selector % :query "
+                "OR selector LIKE :contains OR replacement_selector LIKE :contains)"
+                f"{scope} ORDER BY greatest(similarity(selector, :query), "
+                "similarity(coalesce(replacement_selector, ''), :query)) DESC LIMIT :limit"
+            ).bindparams(query=query, contains=contains, limit=limit, **params)
+            return Pattern.id.in_(subquery)
+        return self._like_clause(query)
+
+    @staticmethod
+    def score(pattern, query):
+        """Similitud del patrón con la consulta (selector o reemplazo)."""
+        best = trigram_similarity(pattern.selector, query)
+        if pattern.replacement_selector:
+            best = max(best, trigram_similarity(pattern.replacement_selector, query))
+        if query and (query in (pattern.selector or '') or query in (pattern.replacement_selector or '')):
+            # Una coincidencia de subcadena nunca queda por debajo de la mitad
+            best = max(best, 0.5)
+        return best
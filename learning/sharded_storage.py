@@ -0,0 +1,277 @@
+"""
+Almacenamiento de patrones particionado por sitio.
+
+Con muchos workers escribiendo a la vez en un único fichero SQLite, todas las
+escrituras se serializan en el mismo bloqueo. `ShardedPatternStorage` reparte
+los patrones entre N `PatternStorage` (un fichero SQLite o un esquema de
+PostgreSQL por partición) según el dominio normalizado de la URL o, con
+`shard_by='section'`, el dominio y la primera sección de la ruta. Los workers
+que prueban sitios distintos escriben en particiones distintas y dejan de
+esperarse entre sí.
+
+Todas las URLs de una plantilla comparten dominio (y sección), así que cada
+partición sigue infiriendo y consultando sus plantillas sin ver las demás. Las
+consultas globales (recorridos, exportación, recálculo de puntuaciones,
+búsquedas sin URL y `shard_stats()`) recorren todas las particiones.
+"""
+import hashlib
+import heapq
+import itertools
+import os
+from datetime import datetime
+
+from sqlalchemy import case, func
+
+from learning import pattern_exchange, scoring
+from learning.pattern_storage import Pattern, PatternStorage, search_rank
+
+SHARD_BY = ('domain', 'section')
+
+
+def shard_locations(db_url, shards):
+    """
+    [(db_url, esquema)] de cada partición. `{shard}` en la URL se sustituye por
+    el número de partición; sin él, PostgreSQL usa un esquema por partición y
+    SQLite un fichero por partición junto al indicado ('patterns-0.db', ...).
+    """
+    if '{shard}' in db_url:
+        return [(db_url.format(shard=index), None) for index in range(shards)]
+    if db_url.startswith('postgresql'):
+        return [(db_url, f'chopperfix_shard_{index}') for index in range(shards)]
+    prefix, separator, path = db_url.partition(':///')
+    if not separator or not path or path == ':memory:':
+        # SQLite en memoria: cada motor tiene su propia base de datos
+        return [(db_url, None) for _ in range(shards)]
+    root, extension = os.path.splitext(path)
+    return [(f"{prefix}:///{root}-{index}{extension}", None) for index in range(shards)]
+
+
+class ShardedPatternStorage:
+    """
+    Misma API que `PatternStorage`, repartida en `shards` particiones. Cada
+    llamada con URL va a su partición; el resto se resuelve en todas.
+    """
+
+    def __init__(self, db_url='sqlite:///patterns.db', shards=4, shard_by='domain', **storage_kwargs):
+        if shards < 1:
+            raise ValueError("Se necesita al menos una partición")
+        if shard_by not in SHARD_BY:
+            raise ValueError(f"shard_by debe ser uno de {SHARD_BY}, no '{shard_by}'")
+        self.shard_by = shard_by
+        self.half_life_seconds = storage_kwargs.get('half_life_seconds', scoring.DEFAULT_HALF_LIFE_SECONDS)
+        self._score_scheduler = None
+        self.shards = [
+            PatternStorage(url, schema=schema, **storage_kwargs)
+            for url, schema in shard_locations(db_url, shards)
+        ]
+
+    # -- enrutado ------------------------------------------------------------
+
+    def normalize_selector(self, selector):
+        return self.shards[0].normalize_selector(selector)
+
+    def normalize_url(self, url):
+        return self.shards[0].normalize_url(url)
+
+    def shard_key(self, url):
+        """Clave de reparto: 'example.com' o, por sección, 'example.com/shop'."""
+        segments = self.normalize_url(url).lower().split('/')
+        if self.shard_by == 'section':
+            return '/'.join(segment for segment in segments[:2] if segment)
+        return segments[0]
+
+    def shard_index(self, url):
+        # Resumen estable entre procesos (a diferencia de hash()); CRC32 reparte mal
+        # dominios que sólo difieren en un carácter ('site1.com', 'site2.com')
+        digest = hashlib.blake2b(self.shard_key(url).encode('utf-8'), digest_size=8).digest()
+        return int.from_bytes(digest, 'big') % len(self.shards)
+
+    def storage_for(self, url):
+        """`PatternStorage` de la partición que guarda los patrones de `url`."""
+        return self.shards[self.shard_index(url)]
+
+    def _group_by_shard(self, items, url_of):
+        groups = {}
+        for item in items:
+            groups.setdefault(self.shard_index(url_of(item)), []).append(item)
+        return groups
+
+    # -- versión (para `PatternCache`) ---------------------------------------
+
+    def get_version(self):
+        """Suma de las versiones de las particiones: cambia con cualquier escritura."""
+        return sum(shard.get_version() for shard in self.shards)
+
+    @property
+    def last_version(self):
+        return sum(shard.last_version for shard in self.shards)
+
+    @property
+    def version_bumps(self):
+        return sum(shard.version_bumps for shard in self.shards)
+
+    # -- operaciones de una URL ----------------------------------------------
+
+    def url_template(self, url):
+        return self.storage_for(url).url_template(url)
+
+    def update_original_pattern(self, action, original_selector, url, replacement_selector):
+        return self.storage_for(url).update_original_pattern(
+            action, original_selector, url, replacement_selector
+        )
+
+    def save_pattern(self, action, selector, url, description, success=True,
+                     replacement_selector=None, full_element_html=None,
+                     parent_element=None, child_elements=None,
+                     sibling_elements=None):
+        return self.storage_for(url).save_pattern(
+            action, selector, url, description, success=success,
+            replacement_selector=replacement_selector, full_element_html=full_element_html,
+            parent_element=parent_element, child_elements=child_elements,
+            sibling_elements=sibling_elements,
+        )
+
+    def save_patterns(self, records):
+        """Guarda los registros con una transacción por partición afectada."""
+        for index, group in self._group_by_shard(records, lambda record: record['url']).items():
+            self.shards[index].save_patterns(group)
+
+    def get_patterns(self, failed_selector, url, limit=10):
+        return self.storage_for(url).get_patterns(failed_selector, url, limit=limit)
+
+    def get_replacement_selector(self, failed_selector, url, action_name):
+        return self.storage_for(url).get_replacement_selector(failed_selector, url, action_name)
+
+    def get_stored_replacement(self, action, selector, url):
+        return self.storage_for(url).get_stored_replacement(action, selector, url)
+
+    def save_fallback_chain(self, action, selector, url, chain, fingerprint=None, drift=None):
+        return self.storage_for(url).save_fallback_chain(
+            action, selector, url, chain, fingerprint=fingerprint, drift=drift
+        )
+
+    def get_element_fingerprint(self, action, selector, url):
+        return self.storage_for(url).get_element_fingerprint(action, selector, url)
+
+    def get_fallback_selectors(self, action, selector, url):
+        return self.storage_for(url).get_fallback_selectors(action, selector, url)
+
+    def heal_url(self, url, html_content, llm_manager=None, extra_failures=None,
+                 dry_run=False):
+        return self.storage_for(url).heal_url(
+            url, html_content, llm_manager=llm_manager, extra_failures=extra_failures, dry_run=dry_run
+        )
+
+    # -- operaciones globales ------------------------------------------------
+
+    def search_patterns(self, selector, url=None, limit=10, min_similarity=0.3,
+                        include_failed=False):
+        options = dict(limit=limit, min_similarity=min_similarity, include_failed=include_failed)
+        if url is not None:
+            return self.storage_for(url).search_patterns(selector, url, **options)
+        ranked = [
+            item for shard in self.shards
+            for item in shard.search_patterns(selector, **options)
+        ]
+        ranked.sort(key=search_rank(None, half_life_seconds=self.half_life_seconds))
+        return ranked[:limit]
+
+    def get_active_patterns(self, url=None):
+        if url is not None:
+            return self.storage_for(url).get_active_patterns(url)
+        patterns = [pattern for shard in self.shards for pattern in shard.get_active_patterns()]
+        return sorted(patterns, key=lambda pattern: pattern.url)
+
+    def iter_active_patterns(self, chunk_size=1000):
+        """Patrones activos de todas las particiones, ordenados por URL como en `PatternStorage`."""
+        return heapq.merge(
+            *(shard.iter_active_patterns(chunk_size) for shard in self.shards),
+            key=lambda pattern: pattern.url,
+        )
+
+    def iter_patterns(self, chunk_size=1000):
+        return itertools.chain.from_iterable(shard.iter_patterns(chunk_size) for shard in self.shards)
+
+    def get_all_patterns(self, limit=10):
+        patterns = [pattern for shard in self.shards for pattern in shard.get_all_patterns(limit=limit)]
+        patterns.sort(key=lambda pattern: pattern.timestamp or datetime.min, reverse=True)
+        return patterns[:limit]
+
+    def bulk_update_replacements(self, replacements):
+        """
+        Como `PatternStorage.bulk_update_replacements`, pero los ids sólo son
+        únicos dentro de cada partición: cada elemento debe llevar también la
+        `url` del patrón.
+        """
+        if any('url' not in item for item in replacements):
+            raise ValueError("En modo particionado cada reemplazo necesita la 'url' del patrón")
+        return sum(
+            self.shards[index].bulk_update_replacements(group)
+            for index, group in self._group_by_shard(replacements, lambda item: item['url']).items()
+        )
+
+    def recompute_scores(self, url=None, now=None, chunk_size=5000):
+        if url is not None:
+            return self.storage_for(url).recompute_scores(url, now=now, chunk_size=chunk_size)
+        return sum(shard.recompute_scores(now=now, chunk_size=chunk_size) for shard in self.shards)
+
+    def start_score_scheduler(self, interval_seconds):
+        """Un único hilo recalcula todas las particiones cada `interval_seconds`."""
+        if self._score_scheduler is None:
+            self._score_scheduler = scoring.ScoreScheduler(self, interval_seconds)
+            self._score_scheduler.start()
+        return self._score_scheduler
+
+    def export_patterns(self, path, chunk_size=1000):
+        """Exporta los patrones de todas las particiones a un único fichero."""
+        with pattern_exchange.open_stream(path, 'w') as stream:
+            return pattern_exchange.write_records(
+                stream, (pattern_exchange.pattern_to_record(pattern) for pattern in self.iter_patterns(chunk_size))
+            )
+
+    def import_patterns(self, path, chunk_size=1000):
+        """Importa un fichero exportado repartiendo cada bloque entre sus particiones."""
+        stats = {'inserted': 0, 'merged': 0}
+        with pattern_exchange.open_stream(path, 'r') as stream:
+            for chunk in pattern_exchange.read_chunks(stream, chunk_size):
+                self.import_chunk(chunk, stats)
+        print(f"[INFO] Patrones importados: {stats['inserted']} nuevos, {stats['merged']} fusionados")
+        return stats
+
+    def import_chunk(self, chunk, stats):
+        for index, group in self._group_by_shard(chunk, lambda record: record['url']).items():
+            self.shards[index].import_chunk(group, stats)
+
+    def shard_stats(self):
+        """Patrones, URLs y selectores rotos por partición, para análisis global."""
+        stats = []
+        for index, shard in enumerate(self.shards):
+            patterns, urls, failed = shard.session.query(
+                func.count(Pattern.id),
+                func.count(func.distinct(Pattern.url)),
+                func.coalesce(func.sum(case((Pattern.failed.is_(True), 1), else_=0)), 0),
+            ).one()
+            stats.append({
+                'shard': index,
+                'url': shard.engine.url.render_as_string(hide_password=True),
+                'schema': shard.schema,
+                'patterns': patterns,
+                'urls': urls,
+                'failed': failed,
+                'version': shard.get_version(),
+            })
+        return stats
+
+    def close(self):
+        if self._score_scheduler is not None:
+            self._score_scheduler.stop()
+            self._score_scheduler = None
+        for shard in self.shards:
+            shard.close()
+
+
+def open_pattern_storage(db_url, shards=0, shard_by='domain', **storage_kwargs):
+    """`ShardedPatternStorage` si se piden 2 o más particiones; si no, `PatternStorage`."""
+    if shards and shards > 1:
+        return ShardedPatternStorage(db_url, shards=shards, shard_by=shard_by, **storage_kwargs)
+    return PatternStorage(db_url, **storage_kwargs)
@@ -0,0 +1,356 @@
+"""
+Archivo de instantáneas HTML comprimidas y deduplicadas.
+
+Cada página se guarda una sola vez, identificada por el SHA-256 de su HTML y
+comprimida con zlib, dentro de ficheros de segmento de sólo-añadir. Un índice
+JSON indica, para cada hash, el segmento, el desplazamiento y las URLs en las
+que se vio. Las lecturas usan mmap sobre los segmentos, de modo que se pueden
+reproducir miles de páginas sin navegador. Las escrituras se hacen en un hilo
+de fondo para no añadir latencia al paso; la cola es acotada y, si se llena,
+las instantáneas se descartan (`stats()['dropped']`) en lugar de acumular HTML
+en memoria.
+
+Varios procesos pueden compartir el directorio (workers de
+`chopperfix.runner`): cada lote se escribe con un bloqueo de fichero sobre
+`index.lock`, releyendo antes el índice del disco para no perder las entradas
+de los demás. Los segmentos sólo crecen; al compactar, las entradas vivas se
+copian a un segmento nuevo en lugar de reescribir uno que otro proceso pueda
+estar leyendo, y un lector con el índice desfasado lo relee y reintenta.
+"""
+import hashlib
+import json
+import mmap
+import os
+import queue
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+INDEX_FILE = 'index.json'
+LOCK_FILE = 'index.lock'
+SEGMENT_PATTERN = 'segment-{:05d}.pack'
+MAX_URLS_PER_ENTRY = 20
+MAX_PENDING = 256
+
+
+@contextmanager
+def _file_lock(path):
+    """Bloqueo exclusivo entre procesos sobre `path`."""
+    with open(path, 'a+b') as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class SnapshotStore:
+    def __init__(self, root, max_bytes=512 * 1024 * 1024, max_age_seconds=30 * 24 * 3600,
+                 segment_bytes=64 * 1024 * 1024, compression_level=6, read_only=False,
+                 max_pending=MAX_PENDING):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.segment_bytes = segment_bytes
+        self.compression_level = compression_level
+        self.read_only = read_only
+        self.max_pending = max_pending
+        self.dropped = 0
+        self._lock = threading.RLock()
+        self._maps = {}
+        self._queue = None
+        self._writer = None
+        if not read_only:
+            os.makedirs(root, exist_ok=True)
+        self._load_index()
+
+    # -- índice --------------------------------------------------------------
+
+    def _index_stamp(self):
+        try:
+            stat = os.stat(os.path.join(self.root, INDEX_FILE))
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    def _load_index(self):
+        path = os.path.join(self.root, INDEX_FILE)
+        data = {'entries': {}, 'urls': {}, 'segment': 0}
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+        self._entries = data['entries']
+        self._urls = data['urls']
+        self._segment = data['segment']
+        self._stamp = self._index_stamp()
+
+    def _refresh_index(self):
+        """Relee el índice sólo si otro proceso lo ha cambiado desde la última vez."""
+        if self._index_stamp() != self._stamp:
+            self._load_index()
+
+    def _save_index(self):
+        path = os.path.join(self.root, INDEX_FILE)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'entries': self._entries, 'urls': self._urls, 'segment': self._segment}, f)
+        os.replace(tmp_path, path)
+        self._stamp = self._index_stamp()
+
+    def reload(self):
+        """Relee el índice (para lectores en otro proceso)."""
+        with self._lock:
+            self._close_maps()
+            self._load_index()
+
+    # -- escritura -----------------------------------------------------------
+
+    @staticmethod
+    def content_hash(html_content):
+        return hashlib.sha256(html_content.encode('utf-8', errors='replace')).hexdigest()
+
+    def put(self, url, html_content):
+        """
+        Encola la instantánea y devuelve su hash sin esperar a que se escriba.
+        """
+        if self.read_only:
+            raise RuntimeError("SnapshotStore abierto en modo sólo lectura")
+        key = self.content_hash(html_content)
+        self._ensure_writer()
+        try:
+            self._queue.put_nowait((key, url, html_content, time.time()))
+        except queue.Full:
+            # El disco no da abasto: mejor perder una instantánea que frenar el paso
+            self.dropped += 1
+            if self.dropped == 1 or self.dropped % 100 == 0:
+                print(f"[WARN] Cola de instantáneas llena; descartadas: {self.dropped}")
+        return key
+
+    def _ensure_writer(self):
+        if self._writer is not None and self._writer.is_alive():
+            return
+        with self._lock:
+            if self._writer is not None and self._writer.is_alive():
+                return
+            self._queue = queue.Queue(maxsize=self.max_pending)
+            self._writer = threading.Thread(target=self._write_loop, name='chopperfix-snapshots', daemon=True)
+            self._writer.start()
+
+    def _write_loop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                return
+            batch = [item]
+            stop = False
+            # Agrupa lo que haya pendiente para guardar el índice una sola vez
+            while True:
+                try:
+                    extra = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if extra is None:
+                    self._queue.task_done()
+                    stop = True
+                    break
+                batch.append(extra)
+            try:
+                with self._lock, _file_lock(os.path.join(self.root, LOCK_FILE)):
+                    # Otros procesos pueden haber escrito desde la última vez
+                    self._refresh_index()
+                    for key, url, html_content, seen_at in batch:
+                        self._write(key, url, html_content, seen_at)
+                    self._enforce_limits()
+                    self._save_index()
+            except Exception as e:
+                print(f"[ERROR] No se pudo guardar la instantánea: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+            if stop:
+                return
+
+    def _segment_path(self, number):
+        return os.path.join(self.root, SEGMENT_PATTERN.format(number))
+
+    def _write(self, key, url, html_content, seen_at):
+        entry = self._entries.get(key)
+        if entry is None:
+            blob = zlib.compress(html_content.encode('utf-8', errors='replace'), self.compression_level)
+            path = self._segment_path(self._segment)
+            if os.path.exists(path) and os.path.getsize(path) + len(blob) > self.segment_bytes:
+                self._segment += 1
+                path = self._segment_path(self._segment)
+            with open(path, 'ab') as f:
+                offset = f.tell()
+                f.write(blob)
+            entry = self._entries[key] = {
+                'segment': self._segment,
+                'offset': offset,
+                'length': len(blob),
+                'size': len(html_content),
+                'created': seen_at,
+                'last_seen': seen_at,
+                'urls': [],
+            }
+        entry['last_seen'] = max(entry['last_seen'], seen_at)
+        if url and url not in entry['urls']:
+            entry['urls'] = (entry['urls'] + [url])[-MAX_URLS_PER_ENTRY:]
+        if url:
+            self._urls[url] = key
+
+    def flush(self):
+        """Espera a que se hayan escrito todas las instantáneas encoladas."""
+        if self._queue is not None:
+            self._queue.join()
+
+    # -- límites de tamaño y antigüedad --------------------------------------
+
+    def _enforce_limits(self):
+        now = time.time()
+        if self.max_age_seconds:
+            for key in [k for k, e in self._entries.items() if now - e['last_seen'] > self.max_age_seconds]:
+                self._drop(key)
+        if self.max_bytes:
+            total = sum(e['length'] for e in self._entries.values())
+            for key in sorted(self._entries, key=lambda k: self._entries[k]['last_seen']):
+                if total <= self.max_bytes:
+                    break
+                total -= self._entries[key]['length']
+                self._drop(key)
+        self._collect_segments()
+
+    def _drop(self, key):
+        self._entries.pop(key, None)
+        for url in [u for u, k in self._urls.items() if k == key]:
+            del self._urls[url]
+
+    def _collect_segments(self):
+        """Borra los segmentos sin entradas vivas y compacta los muy fragmentados."""
+        live = {}
+        for entry in self._entries.values():
+            live[entry['segment']] = live.get(entry['segment'], 0) + entry['length']
+        fragmented = []
+        for name in os.listdir(self.root):
+            if not (name.startswith('segment-') and name.endswith('.pack')):
+                continue
+            number = int(name[len('segment-'):-len('.pack')])
+            path = os.path.join(self.root, name)
+            if number not in live:
+                self._unmap(number)
+                os.remove(path)
+            elif live[number] < os.path.getsize(path) // 2:
+                fragmented.append(number)
+        if fragmented:
+            self._compact_segments(sorted(fragmented))
+
+    def _compact_segments(self, numbers):
+        # Las entradas vivas pasan a un segmento nuevo: los desplazamientos de un
+        # segmento existente no cambian nunca para quien aún lo esté leyendo
+        self._segment += 1
+        with open(self._segment_path(self._segment), 'ab') as dst:
+            for number in numbers:
+                with open(self._segment_path(number), 'rb') as src:
+                    for entry in sorted((e for e in self._entries.values() if e['segment'] == number),
+                                        key=lambda e: e['offset']):
+                        src.seek(entry['offset'])
+                        blob = src.read(entry['length'])
+                        entry['segment'] = self._segment
+                        entry['offset'] = dst.tell()
+                        dst.write(blob)
+        for number in numbers:
+            self._unmap(number)
+            os.remove(self._segment_path(number))
+
+    # -- lectura -------------------------------------------------------------
+
+    def _unmap(self, number):
+        handle = self._maps.pop(number, None)
+        if handle is not None:
+            handle[1].close()
+            handle[0].close()
+
+    def _close_maps(self):
+        for number in list(self._maps):
+            self._unmap(number)
+
+    def _map(self, number):
+        handle = self._maps.get(number)
+        if handle is None:
+            f = open(self._segment_path(number), 'rb')
+            handle = self._maps[number] = (f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        return handle[1]
+
+    def _read(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        data = self._map(entry['segment'])
+        if entry['offset'] + entry['length'] > len(data):
+            # El segmento creció desde que se mapeó
+            self._unmap(entry['segment'])
+            data = self._map(entry['segment'])
+        blob = data[entry['offset']:entry['offset'] + entry['length']]
+        return zlib.decompress(blob).decode('utf-8', errors='replace')
+
+    def get(self, key):
+        """Devuelve el HTML de la instantánea `key` o None si no existe."""
+        with self._lock:
+            try:
+                return self._read(key)
+            except (OSError, ValueError, zlib.error):
+                # Otro proceso compactó o borró el segmento: el índice está desfasado
+                self._close_maps()
+                self._load_index()
+                return self._read(key)
+
+    def latest_key(self, url):
+        return self._urls.get(url)
+
+    def get_latest(self, url):
+        key = self.latest_key(url)
+        return self.get(key) if key else None
+
+    def keys(self):
+        return list(self._entries)
+
+    def urls(self):
+        """Devuelve {url: hash de la última instantánea vista}."""
+        return dict(self._urls)
+
+    def stats(self):
+        with self._lock:
+            stored = sum(e['length'] for e in self._entries.values())
+            raw = sum(e['size'] for e in self._entries.values())
+        return {
+            'snapshots': len(self._entries),
+            'urls': len(self._urls),
+            'stored_bytes': stored,
+            'raw_chars': raw,
+            'compression_ratio': round(raw / stored, 2) if stored else 0.0,
+            'dropped': self.dropped,
+        }
+
+    def close(self):
+        if self._writer is not None and self._writer.is_alive():
+            self.flush()
+            self._queue.put(None)
+            self._writer.join()
+        with self._lock:
+            self._close_maps()
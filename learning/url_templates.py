@@ -0,0 +1,121 @@
+"""
+Inferencia de plantillas de URL.
+
+Agrupa segmentos de ruta variables (ids numéricos, UUIDs, hashes y slugs) en
+plantillas como `wikipedia.org/wiki/{slug}`, de modo que un patrón aprendido en
+una página sirva para todas las páginas del mismo tipo.
+"""
+import re
+from collections import OrderedDict
+
+from utils.config import Config
+
+ID_RE = re.compile(r'^\d+$')
+UUID_RE = re.compile(r'^[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}$')
+HASH_RE = re.compile(r'^(?=.*\d)[0-9a-fA-F]{16,}$')
+SLOT_RE = re.compile(r'^\{\w+\}$')
+
+
+def classify_segment(segment):
+    """Devuelve el marcador de un segmento claramente variable o None."""
+    if ID_RE.match(segment):
+        return '{id}'
+    if UUID_RE.match(segment):
+        return '{uuid}'
+    if HASH_RE.match(segment):
+        return '{hash}'
+    return None
+
+
+def split_url(normalized_url):
+    host, _, path = normalized_url.partition('/')
+    return host, [segment for segment in path.split('/') if segment]
+
+
+def join_url(host, segments):
+    return '/'.join([host] + list(segments))
+
+
+class UrlTemplateInferrer:
+    """
+    Aprende plantillas a partir de las URLs normalizadas observadas.
+
+    Los ids, UUIDs y hashes se sustituyen siempre. Un segmento de texto se
+    convierte en `{slug}` cuando, con el mismo prefijo y resto de ruta, se han
+    visto al menos `min_cluster` valores distintos (por defecto
+    `Config.URL_TEMPLATE_MIN_CLUSTER`). Con pocos valores no se distingue una
+    plantilla de secciones distintas bajo el mismo padre (`/docs/install` y
+    `/docs/billing`). El primer segmento de la ruta nunca se convierte en slug
+    (`/about` y `/contact` son páginas distintas, no instancias de la misma).
+
+    La memoria está acotada: de un grupo ya promovido sólo se recuerda la
+    clave, y de los grupos pendientes como mucho `max_pending` (se olvidan
+    primero los más antiguos).
+    """
+
+    def __init__(self, min_cluster=None, max_pending=100000):
+        self.min_cluster = Config.URL_TEMPLATE_MIN_CLUSTER if min_cluster is None else min_cluster
+        self.max_pending = max_pending
+        self._clusters = OrderedDict()
+        self._promoted = set()
+        self._registered = []
+
+    def register(self, template):
+        """Registra una plantilla explícita, p. ej. 'example.com/users/{slug}'."""
+        host, segments = split_url(template)
+        self._registered.append((host, segments))
+
+    def _masked(self, segments):
+        return [classify_segment(segment) or segment for segment in segments]
+
+    def _cluster_keys(self, host, segments):
+        for position in range(1, len(segments)):
+            if SLOT_RE.match(segments[position]):
+                continue
+            shape = tuple(segments[:position]) + ('*',) + tuple(segments[position + 1:])
+            yield position, (host, shape)
+
+    def observe(self, normalized_url):
+        """
+        Registra una URL. Devuelve las URLs de los grupos que acaban de
+        alcanzar el tamaño mínimo (cuya plantilla acaba de cambiar).
+        """
+        host, segments = split_url(normalized_url)
+        segments = self._masked(segments)
+        promoted = []
+        for position, key in self._cluster_keys(host, segments):
+            if key in self._promoted:
+                continue
+            members = self._clusters.setdefault(key, {})
+            if segments[position] in members:
+                continue
+            members[segments[position]] = normalized_url
+            if len(members) >= self.min_cluster:
+                # A partir de aquí basta con saber que el grupo es una plantilla
+                promoted.extend(members.values())
+                self._promoted.add(key)
+                del self._clusters[key]
+            elif len(self._clusters) > self.max_pending:
+                self._clusters.popitem(last=False)
+        return promoted
+
+    def _match_registered(self, host, segments):
+        for template_host, template_segments in self._registered:
+            if template_host != host or len(template_segments) != len(segments):
+                continue
+            if all(SLOT_RE.match(t) or t == s for t, s in zip(template_segments, segments)):
+                return join_url(host, template_segments)
+        return None
+
+    def template_for(self, normalized_url):
+        """Devuelve la plantilla de la URL (la propia URL si no hay partes variables)."""
+        host, segments = split_url(normalized_url)
+        registered = self._match_registered(host, segments)
+        if registered:
+            return registered
+        segments = self._masked(segments)
+        template = list(segments)
+        for position, key in self._cluster_keys(host, segments):
+            if key in self._promoted:
+                template[position] = '{slug}'
+        return join_url(host, template)
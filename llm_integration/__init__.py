@@ -1 +1,2 @@
 from .langchain_manager import LangChainManager, fix_xpath, clean_xpath
+from .backend import LLMBackend, create_llm_manager
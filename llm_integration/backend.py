@@ -0,0 +1,175 @@
+"""
+Interfaz común de los backends LLM.
+
+`LLMBackend` implementa las cuatro operaciones que usa ChopperFix
+(`suggest_alternative_selector`, `suggest_alternative_selectors`,
+`generate_description` y `analyze_context_from_text`) con los prompts de
+`llm_integration.prompts`, el limitador compartido y el modo streaming. Cada
+backend sólo tiene que implementar `_complete` (y opcionalmente `_stream`).
+"""
+import re
+
+from self_healing.candidates import is_unique_match, parse_html
+from utils.config import Config
+
+from . import prompts
+from .rate_limiter import estimate_tokens, shared_rate_limiter
+from .selector_parsing import (
+    StreamingSelectorParser,
+    clean_xpath,
+    consume_selector_stream,
+    fix_xpath,
+    format_batch_failures,
+    parse_selector_map,
+)
+
+BACKENDS = ('langchain', 'adalflow')
+
+
+class LLMBackend:
+    name = 'llm'
+
+    def __init__(self, rate_limiter=None, streaming=None):
+        self.rate_limiter = rate_limiter if rate_limiter is not None else shared_rate_limiter(Config)
+        self.streaming = Config.LLM_STREAMING if streaming is None else streaming
+
+    # -- a implementar por cada backend --------------------------------------
+
+    def _complete(self, prompt: str) -> str:
+        """Devuelve la respuesta completa del modelo. Los errores se lanzan como excepciones."""
+        raise NotImplementedError
+
+    def _stream(self, prompt: str):
+        """Iterador de fragmentos de texto; debe cerrar la conexión al llamar a `close()`."""
+        yield self._complete(prompt)
+
+    # -- llamadas con cuota y reintentos -------------------------------------
+
+    def complete(self, prompt: str) -> str:
+        return self.rate_limiter.call(lambda: self._complete(prompt), tokens=estimate_tokens(prompt))
+
+    def _stream_selector(self, prompt: str, html_content: str) -> str | None:
+        """Lee la respuesta en streaming y la corta en cuanto hay un selector que coincide con el DOM."""
+        tree = parse_html(html_content)
+        validate = (lambda selector: is_unique_match(tree, selector)) if tree is not None else None
+
+        def run():
+            parser = StreamingSelectorParser(normalize=fix_xpath, validate=validate)
+            selector, cut = consume_selector_stream(self._stream(prompt), parser)
+            if cut:
+                print(f"[INFO] Stream del LLM cortado tras {parser.chunks} fragmentos")
+            return selector
+
+        return self.rate_limiter.call(run, tokens=estimate_tokens(prompt))
+
+    # -- operaciones ---------------------------------------------------------
+
+    def suggest_alternative_selector(
+        self,
+        html_content: str,
+        failed_selector: str,
+        action_name: str,
+        full_element_html: str | None = None,
+        parent_element: str | None = None,
+        child_elements: list[str] | None = None,
+        sibling_elements: list[str] | None = None,
+    ) -> str | None:
+        formatted = prompts.SUGGEST_SELECTOR.format(
+            action_name=action_name,
+            failed_selector=failed_selector,
+            html_content=html_content,
+            **prompts.context_fields(full_element_html, parent_element, child_elements, sibling_elements),
+        )
+        try:
+            if self.streaming:
+                selector = self._stream_selector(formatted, html_content)
+            else:
+                selector = fix_xpath(clean_xpath(self.complete(formatted)))
+            return selector if selector else None
+        except Exception as e:
+            print(f"[ERROR] {self.name}: la sugerencia de selector falló: {e}")
+            return None
+
+    def suggest_alternative_selectors(
+        self,
+        html_content: str,
+        failures: list[dict],
+    ) -> dict[str, str | None]:
+        """
+        Repara en una sola petición todos los selectores rotos de una página.
+        `failures` es una lista de dicts con `selector`, `action` y opcionalmente
+        `full_element_html`. Devuelve {selector: nuevo selector o None}.
+        """
+        if not failures:
+            return {}
+        formatted = prompts.SUGGEST_SELECTORS.format(
+            failures=format_batch_failures(failures), html_content=html_content
+        )
+        keys = [str(key) for key in range(1, len(failures) + 1)]
+        try:
+            response = self.complete(formatted)
+        except Exception as e:
+            print(f"[ERROR] {self.name}: la sugerencia de selectores en lote falló: {e}")
+            return {failure["selector"]: None for failure in failures}
+        suggestions = parse_selector_map(response, keys)
+        return {
+            failure["selector"]: fix_xpath(suggestions[key]) if suggestions[key] else None
+            for key, failure in zip(keys, failures)
+        }
+
+    def generate_description(
+        self,
+        action_name: str,
+        selector: str,
+        url: str,
+        html_content: str,
+        full_element_html: str | None = None,
+        parent_element: str | None = None,
+        child_elements: list[str] | None = None,
+        sibling_elements: list[str] | None = None,
+    ) -> str | None:
+        formatted = prompts.GENERATE_DESCRIPTION.format(
+            action_name=action_name,
+            selector=selector,
+            url=url,
+            truncated_html=prompts.truncate_html(html_content),
+            **prompts.context_fields(full_element_html, parent_element, child_elements, sibling_elements),
+        )
+        try:
+            return self.complete(formatted).strip()
+        except Exception as e:
+            print(f"[ERROR] {self.name}: la descripción falló: {e}")
+            return None
+
+    def analyze_context_from_text(
+        self,
+        db_text_data: str,
+        failed_selector: str,
+        action_name: str,
+    ) -> str | None:
+        formatted = prompts.ANALYZE_CONTEXT.format(
+            db_text_data=db_text_data,
+            failed_selector=failed_selector,
+            action_name=action_name,
+        )
+        try:
+            selector = re.sub(r'[`\'"\n]', '', self.complete(formatted)).strip()
+            return None if selector.lower() == "none" else selector
+        except Exception as e:
+            print(f"[ERROR] {self.name}: el análisis de contexto falló: {e}")
+            return None
+
+
+def create_llm_manager(backend=None, **kwargs):
+    """
+    Crea el gestor LLM del backend indicado o del configurado en
+    `CHOPPERFIX_LLM_BACKEND` ('langchain' por defecto, o 'adalflow').
+    """
+    backend = (backend or Config.LLM_BACKEND).lower()
+    if backend == 'langchain':
+        from .langchain_manager import LangChainManager
+        return LangChainManager(**kwargs)
+    if backend == 'adalflow':
+        from .adalflow_manager import AdalFlowManager
+        return AdalFlowManager(**kwargs)
+    raise ValueError(f"Backend LLM desconocido: '{backend}' (disponibles: {', '.join(BACKENDS)})")
@@ -1,194 +1,37 @@
-import re
-from bs4 import BeautifulSoup
 from langchain.chat_models import ChatOpenAI
-from langchain.prompts import PromptTemplate
 
+from utils.config import Config
 
-def fix_xpath(xpath: str) -> str:
-    pattern = r"(@[\w-]+)=['\"]?([^'\"]+)['\"]?"
-    corrected_xpath = re.sub(pattern, r'\1="\2"', xpath)
-    if corrected_xpath.count('"') % 2 != 0:
-        corrected_xpath = corrected_xpath.replace('="', '="').replace(']"', ']')
-    return corrected_xpath
+from .backend import LLMBackend
+from .selector_parsing import clean_xpath, fix_xpath
 
+__all__ = ["LangChainManager", "fix_xpath", "clean_xpath"]
 
-def clean_xpath(raw_response: str) -> str:
-    cleaned_xpath = raw_response.strip().replace("```xpath", "").replace("```", "").strip()
-    return cleaned_xpath
 
+class LangChainManager(LLMBackend):
+    name = "LangChain"
 
-class LangChainManager:
-    def __init__(self, model_name: str = "gpt-3.5-turbo-0125", temperature: float = 0.0):
-        self.llm = ChatOpenAI(model=model_name, temperature=temperature)
+    def __init__(self, model_name: str = "gpt-3.5-turbo-0125", temperature: float = 0.0, rate_limiter=None,
+                 streaming: bool | None = None, base_url: str | None = None):
+        super().__init__(rate_limiter=rate_limiter, streaming=streaming)
+        self.model_name = model_name
+        kwargs = {"model": model_name, "temperature": temperature}
+        base_url = base_url or Config.LLM_BASE_URL
+        if base_url:
+            kwargs["openai_api_base"] = base_url
+        # Los reintentos los gestiona el limitador compartido
+        kwargs["max_retries"] = 0
+        self.llm = ChatOpenAI(**kwargs)
 
-    def suggest_alternative_selector(
-        self,
-        html_content: str,
-        failed_selector: str,
-        action_name: str,
-        full_element_html: str | None = None,
-        parent_element: str | None = None,
-        child_elements: list[str] | None = None,
-        sibling_elements: list[str] | None = None,
-    ) -> str | None:
-        template = (
-            "Generate a robust and valid XPath selector based on the following context and HTML."
-            " Ensure all attribute values are enclosed in single quotes (`'`).\n\n"
-            "- Action to perform: {action_name}\n"
-            "- Failed selector: {failed_selector}\n"
-            "- Full element HTML: {full_element_html}\n"
-            "- Parent element HTML: {parent_element}\n"
-            "- Child elements HTML: {child_elements}\n"
-            "- Sibling elements HTML: {sibling_elements}\n"
-            "- Current HTML:\n```html\n{html_content}\n```\n\n"
-            "Return only the XPath selector."
-        )
-        prompt = PromptTemplate(
-            input_variables=[
-                "action_name",
-                "failed_selector",
-                "full_element_html",
-                "parent_element",
-                "child_elements",
-                "sibling_elements",
-                "html_content",
-            ],
-            template=template,
-        )
-        formatted = prompt.format(
-            action_name=action_name,
-            failed_selector=failed_selector,
-            full_element_html=full_element_html or "Not available",
-            parent_element=parent_element or "Not available",
-            child_elements=", ".join(child_elements) if child_elements else "Not available",
-            sibling_elements=", ".join(sibling_elements) if sibling_elements else "Not available",
-            html_content=html_content,
-        )
-        try:
-            response = self.llm.predict(formatted)
-            selector = fix_xpath(clean_xpath(response))
-            return selector if selector else None
-        except Exception as e:
-            print(f"[ERROR] LangChain suggestion failed: {e}")
-            return None
-
-    def generate_description(
-        self,
-        action_name: str,
-        selector: str,
-        url: str,
-        html_content: str,
-        full_element_html: str | None = None,
-        parent_element: str | None = None,
-        child_elements: list[str] | None = None,
-        sibling_elements: list[str] | None = None,
-    ) -> str | None:
-        soup = BeautifulSoup(html_content, "html.parser")
-        important = soup.find_all([
-            "input",
-            "button",
-            "a",
-            "select",
-            "textarea",
-            "form",
-            "div",
-            "span",
-            "section",
-            "article",
-            "header",
-            "footer",
-            "h1",
-            "h2",
-            "h3",
-            "h4",
-            "h5",
-            "h6",
-            "p",
-            "li",
-            "ul",
-            "ol",
-            "table",
-            "tr",
-            "td",
-            "th",
-            "thead",
-            "tbody",
-            "tfoot",
-            "img",
-            "svg",
-            "video",
-            "audio",
-            "canvas",
-        ])
-        truncated_html = "\n".join(str(el) for el in important[:50])
-        template = (
-            "Given the following details of a web automation action:\n"
-            "- Action: {action_name}\n"
-            "- Selector: {selector}\n"
-            "- URL: {url}\n"
-            "- Full element HTML: {full_element_html}\n"
-            "- Parent element HTML: {parent_element}\n"
-            "- Child elements HTML: {child_elements}\n"
-            "- Sibling elements HTML: {sibling_elements}\n"
-            "- HTML Content (truncated):\n```\n{truncated_html}\n```\n\n"
-            "Please generate a concise description of this action in the context of the web page's structure."
-        )
-        prompt = PromptTemplate(
-            input_variables=[
-                "action_name",
-                "selector",
-                "url",
-                "full_element_html",
-                "parent_element",
-                "child_elements",
-                "sibling_elements",
-                "truncated_html",
-            ],
-            template=template,
-        )
-        formatted = prompt.format(
-            action_name=action_name,
-            selector=selector,
-            url=url,
-            full_element_html=full_element_html or "Not available",
-            parent_element=parent_element or "Not available",
-            child_elements=", ".join(child_elements) if child_elements else "Not available",
-            sibling_elements=", ".join(sibling_elements) if sibling_elements else "Not available",
-            truncated_html=truncated_html,
-        )
-        try:
-            description = self.llm.predict(formatted)
-            return description.strip()
-        except Exception as e:
-            print(f"[ERROR] LangChain description failed: {e}")
-            return None
+    def _complete(self, prompt: str) -> str:
+        return self.llm.predict(prompt)
 
-    def analyze_context_from_text(
-        self,
-        db_text_data: str,
-        failed_selector: str,
-        action_name: str,
-    ) -> str | None:
-        template = (
-            "The following is a dataset containing CSS selectors, their context, and metrics from a database:\n"
-            "```\n{db_text_data}\n```\n\n"
-            "Given this dataset, analyze the context to suggest the most suitable replacement selector "
-            "for the failed selector '{failed_selector}' in the context of the action '{action_name}'.\n\n"
-            "Return only the suggested CSS selector."
-        )
-        prompt = PromptTemplate(
-            input_variables=["db_text_data", "failed_selector", "action_name"],
-            template=template,
-        )
-        formatted = prompt.format(
-            db_text_data=db_text_data,
-            failed_selector=failed_selector,
-            action_name=action_name,
-        )
+    def _stream(self, prompt: str):
+        stream = self.llm.stream(prompt)
         try:
-            selector = self.llm.predict(formatted)
-            selector = re.sub(r'[`\'"\n]', '', selector).strip()
-            return None if selector.lower() == "none" else selector
-        except Exception as e:
-            print(f"[ERROR] LangChain context analysis failed: {e}")
-            return None
+            for chunk in stream:
+                yield chunk.content
+        finally:
+            close = getattr(stream, "close", None)
+            if close is not None:
+                close()
@@ -0,0 +1,221 @@
+"""
+Enrutado de peticiones al LLM por coste y latencia.
+
+Las tareas baratas (descripciones y análisis del histórico) van siempre al
+nivel rápido. La reparación de selectores empieza también en el nivel rápido y
+sólo se escala al nivel fuerte cuando la respuesta no coincide con un único
+elemento del DOM. Cada ejecución tiene un presupuesto de tokens y de segundos
+de LLM; agotado el presupuesto, las peticiones devuelven None. Un mismo router
+se comparte entre los hilos de `FlowRunner`, así que el presupuesto y las
+métricas se actualizan bajo un bloqueo.
+"""
+import threading
+import time
+from collections import deque
+
+from self_healing.candidates import is_unique_match, parse_html
+
+from .rate_limiter import estimate_tokens
+
+CHEAP = 'cheap'
+STRONG = 'strong'
+TIERS = (CHEAP, STRONG)
+
+
+class LLMBudget:
+    """
+    Presupuesto por ejecución. Un límite de 0 o None significa sin límite. Los
+    tokens se reservan antes de la llamada (`reserve`), de modo que varios hilos
+    no pueden pasar a la vez la comprobación y gastar más de la cuenta.
+    """
+
+    def __init__(self, max_tokens=None, max_seconds=None):
+        self.max_tokens = max_tokens or None
+        self.max_seconds = max_seconds or None
+        self.tokens = 0
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+
+    def _allows(self, tokens):
+        if self.max_tokens is not None and self.tokens + tokens > self.max_tokens:
+            return False
+        if self.max_seconds is not None and self.seconds >= self.max_seconds:
+            return False
+        return True
+
+    def allows(self, tokens):
+        with self._lock:
+            return self._allows(tokens)
+
+    def reserve(self, tokens):
+        """Descuenta `tokens` si caben en el presupuesto. Devuelve False si no."""
+        with self._lock:
+            if not self._allows(tokens):
+                return False
+            self.tokens += tokens
+            return True
+
+    def charge(self, tokens, seconds):
+        with self._lock:
+            self.tokens += tokens
+            self.seconds += seconds
+
+    def snapshot(self):
+        with self._lock:
+            return {'tokens': self.tokens, 'seconds': round(self.seconds, 3)}
+
+
+class ModelRouter:
+    """
+    Misma interfaz que `LangChainManager`, repartida entre dos gestores: `cheap`
+    (rápido y barato) y `strong` (más capaz). Cualquier gestor con los mismos
+    métodos sirve como nivel.
+    """
+
+    def __init__(self, cheap, strong, budget=None, history_size=1000):
+        self.tiers = {CHEAP: cheap, STRONG: strong}
+        self.budget = budget or LLMBudget()
+        self.heals = deque(maxlen=history_size)
+        self.calls = dict.fromkeys(TIERS, 0)
+        self.tokens = dict.fromkeys(TIERS, 0)
+        self.seconds = dict.fromkeys(TIERS, 0.0)
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        from .backend import create_llm_manager
+
+        return cls(
+            create_llm_manager(config.LLM_BACKEND, model_name=config.LLM_CHEAP_MODEL),
+            create_llm_manager(config.LLM_BACKEND, model_name=config.LLM_STRONG_MODEL),
+            budget=LLMBudget(config.LLM_TOKEN_BUDGET, config.LLM_LATENCY_BUDGET_SECONDS),
+        )
+
+    def _call(self, tier, method, prompt_texts, *args, **kwargs):
+        """Llama a `method` del nivel si el presupuesto lo permite. Devuelve (respuesta, segundos)."""
+        tokens = estimate_tokens(*prompt_texts)
+        if not self.budget.reserve(tokens):
+            with self._lock:
+                self.rejected += 1
+            print(f"[WARN] Presupuesto de LLM agotado; se omite {method} en el nivel '{tier}'")
+            return None, 0.0
+        started = time.perf_counter()
+        try:
+            result = getattr(self.tiers[tier], method)(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started
+            # Los tokens ya se reservaron; sólo falta la latencia
+            self.budget.charge(0, elapsed)
+            with self._lock:
+                self.calls[tier] += 1
+                self.tokens[tier] += tokens
+                self.seconds[tier] += elapsed
+        return result, elapsed
+
+    # -- tareas baratas ------------------------------------------------------
+
+    def generate_description(self, action_name, selector, url, html_content, **context):
+        # El gestor sólo envía un extracto del HTML; se estima con el contexto del elemento
+        prompt_texts = (action_name, selector, url, *context.values())
+        return self._call(
+            CHEAP, 'generate_description', prompt_texts,
+            action_name, selector, url, html_content, **context
+        )[0]
+
+    def analyze_context_from_text(self, db_text_data, failed_selector, action_name):
+        return self._call(
+            CHEAP, 'analyze_context_from_text', (db_text_data, failed_selector),
+            db_text_data, failed_selector, action_name
+        )[0]
+
+    # -- reparación con escalado ---------------------------------------------
+
+    def _record_heal(self, selector, tiers, resolved_by, seconds):
+        with self._lock:
+            self.heals.append({
+                'selector': selector,
+                'tiers': tiers,
+                'resolved_by': resolved_by,
+                'seconds': round(seconds, 3),
+            })
+        if resolved_by:
+            print(f"[INFO] Selector '{selector}' reparado por el nivel '{resolved_by}'")
+
+    def suggest_alternative_selector(self, html_content, failed_selector, action_name, **context):
+        """
+        Pide el selector al nivel barato y, si no coincide con un único
+        elemento del DOM, al nivel fuerte. Sin DOM no se puede validar y se
+        acepta la primera respuesta.
+        """
+        tree = parse_html(html_content)
+        prompt_texts = (html_content, failed_selector, *context.values())
+        tried = []
+        total = 0.0
+        for tier in TIERS:
+            suggestion, seconds = self._call(
+                tier, 'suggest_alternative_selector', prompt_texts,
+                html_content, failed_selector, action_name, **context
+            )
+            tried.append(tier)
+            total += seconds
+            if suggestion and (tree is None or is_unique_match(tree, suggestion)):
+                self._record_heal(failed_selector, list(tried), tier, total)
+                return suggestion
+            if suggestion:
+                print(f"[WARN] El nivel '{tier}' sugirió '{suggestion}', que no coincide con el DOM")
+        self._record_heal(failed_selector, tried, None, total)
+        return None
+
+    def suggest_alternative_selectors(self, html_content, failures):
+        """Versión en lote: sólo se escalan los selectores cuya respuesta no se pudo validar."""
+        tree = parse_html(html_content)
+        results = {failure['selector']: None for failure in failures}
+        pending = list(failures)
+        tried = []
+        total = 0.0
+        for tier in TIERS:
+            if not pending:
+                break
+            prompt_texts = (html_content, *(failure['selector'] for failure in pending))
+            suggestions, seconds = self._call(
+                tier, 'suggest_alternative_selectors', prompt_texts, html_content, pending
+            )
+            tried.append(tier)
+            total += seconds
+            still_pending = []
+            for failure in pending:
+                suggestion = (suggestions or {}).get(failure['selector'])
+                if suggestion and (tree is None or is_unique_match(tree, suggestion)):
+                    results[failure['selector']] = suggestion
+                    self._record_heal(failure['selector'], list(tried), tier, total)
+                else:
+                    still_pending.append(failure)
+            pending = still_pending
+        for failure in pending:
+            self._record_heal(failure['selector'], list(tried), None, total)
+        return results
+
+    # -- métricas ------------------------------------------------------------
+
+    def stats(self):
+        """Llamadas, tokens estimados y segundos por nivel, y latencia de reparación."""
+        with self._lock:
+            heals = list(self.heals)
+            calls, tokens, seconds = dict(self.calls), dict(self.tokens), dict(self.seconds)
+            rejected = self.rejected
+        latencies = sorted(heal['seconds'] for heal in heals if heal['resolved_by'])
+        resolved = dict.fromkeys(TIERS, 0)
+        for heal in heals:
+            if heal['resolved_by']:
+                resolved[heal['resolved_by']] += 1
+        return {
+            'calls': calls,
+            'tokens': tokens,
+            'seconds': {tier: round(value, 3) for tier, value in seconds.items()},
+            'heals_resolved_by': resolved,
+            'heals_unresolved': sum(1 for heal in heals if not heal['resolved_by']),
+            'heal_p50_seconds': latencies[len(latencies) // 2] if latencies else None,
+            'budget_rejections': rejected,
+            'budget': self.budget.snapshot(),
+        }
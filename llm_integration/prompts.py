@@ -0,0 +1,80 @@
+"""
+Prompts compartidos por todos los backends LLM.
+
+Las plantillas usan la sintaxis de `str.format`; las llaves literales van
+dobladas (`{{`, `}}`).
+"""
+from bs4 import BeautifulSoup
+
+NOT_AVAILABLE = "Not available"
+
+# Elementos que dan contexto a la descripción de una acción
+IMPORTANT_TAGS = [
+    "input", "button", "a", "select", "textarea", "form",
+    "div", "span", "section", "article", "header", "footer",
+    "h1", "h2", "h3", "h4", "h5", "h6", "p", "li", "ul", "ol",
+    "table", "tr", "td", "th", "thead", "tbody", "tfoot",
+    "img", "svg", "video", "audio", "canvas",
+]
+MAX_DESCRIPTION_ELEMENTS = 50
+
+SUGGEST_SELECTOR = (
+    "Generate a robust and valid XPath selector based on the following context and HTML."
+    " Ensure all attribute values are enclosed in single quotes (`'`).\n\n"
+    "- Action to perform: {action_name}\n"
+    "- Failed selector: {failed_selector}\n"
+    "- Full element HTML: {full_element_html}\n"
+    "- Parent element HTML: {parent_element}\n"
+    "- Child elements HTML: {child_elements}\n"
+    "- Sibling elements HTML: {sibling_elements}\n"
+    "- Current HTML:\n```html\n{html_content}\n```\n\n"
+    "Return only the XPath selector."
+)
+
+SUGGEST_SELECTORS = (
+    "The following selectors stopped matching elements on the page below."
+    " For each one, generate a robust and valid XPath selector that targets the same element"
+    " in the current HTML. Ensure all attribute values are enclosed in single quotes (`'`).\n\n"
+    "Broken selectors:\n{failures}\n\n"
+    "- Current HTML:\n```html\n{html_content}\n```\n\n"
+    "Return only a JSON object mapping each number to its XPath selector, or null if the"
+    " element no longer exists. Example: {{\"1\": \"//input[@id='q']\", \"2\": null}}"
+)
+
+GENERATE_DESCRIPTION = (
+    "Given the following details of a web automation action:\n"
+    "- Action: {action_name}\n"
+    "- Selector: {selector}\n"
+    "- URL: {url}\n"
+    "- Full element HTML: {full_element_html}\n"
+    "- Parent element HTML: {parent_element}\n"
+    "- Child elements HTML: {child_elements}\n"
+    "- Sibling elements HTML: {sibling_elements}\n"
+    "- HTML Content (truncated):\n```\n{truncated_html}\n```\n\n"
+    "Please generate a concise description of this action in the context of the web page's structure."
+)
+
+ANALYZE_CONTEXT = (
+    "The following is a dataset containing CSS selectors, their context, and metrics from a database:\n"
+    "```\n{db_text_data}\n```\n\n"
+    "Given this dataset, analyze the context to suggest the most suitable replacement selector "
+    "for the failed selector '{failed_selector}' in the context of the action '{action_name}'.\n\n"
+    "Return only the suggested CSS selector."
+)
+
+
+def context_fields(full_element_html=None, parent_element=None, child_elements=None,
+                   sibling_elements=None):
+    """Campos de contexto del elemento tal como aparecen en los prompts."""
+    return {
+        "full_element_html": full_element_html or NOT_AVAILABLE,
+        "parent_element": parent_element or NOT_AVAILABLE,
+        "child_elements": ", ".join(child_elements) if child_elements else NOT_AVAILABLE,
+        "sibling_elements": ", ".join(sibling_elements) if sibling_elements else NOT_AVAILABLE,
+    }
+
+
+def truncate_html(html_content, limit=MAX_DESCRIPTION_ELEMENTS):
+    """Los primeros `limit` elementos relevantes de la página, uno por línea."""
+    soup = BeautifulSoup(html_content or "", "html.parser")
+    return "\n".join(str(element) for element in soup.find_all(IMPORTANT_TAGS)[:limit])
@@ -0,0 +1,211 @@
+"""
+Limitador de peticiones al LLM compartido entre hilos y procesos.
+
+Dos cubos de tokens (peticiones/minuto y tokens/minuto) guardados en un fichero
+SQLite: todos los workers de la máquina que apunten al mismo fichero reparten
+la misma cuota. Los errores recuperables (429, 5xx, timeouts) se reintentan con
+espera exponencial con jitter en lugar de devolver None al primer rechazo.
+"""
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+
+RETRYABLE_ERRORS = (
+    'RateLimitError', 'APITimeoutError', 'APIConnectionError', 'InternalServerError',
+    'ServiceUnavailableError', 'Timeout', 'TimeoutError', 'RetryableLLMError',
+)
+RETRYABLE_STATUS = (408, 409, 429, 500, 502, 503, 504)
+RETRYABLE_MESSAGES = ('rate limit', 'rate_limit', 'too many requests', 'timed out', 'overloaded', '429')
+DEFAULT_PATH = os.path.join(tempfile.gettempdir(), 'chopperfix-ratelimit.db')
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(*texts):
+    """Estimación aproximada de tokens (≈4 caracteres por token)."""
+    return sum(len(str(text)) for text in texts if text) // CHARS_PER_TOKEN + 1
+
+
+class RetryableLLMError(Exception):
+    """Error recuperable devuelto por un cliente que no lanza excepciones (p. ej. AdalFlow)."""
+
+
+def is_retryable(error):
+    if type(error).__name__ in RETRYABLE_ERRORS:
+        return True
+    status = getattr(error, 'status_code', None) or getattr(error, 'http_status', None)
+    if status in RETRYABLE_STATUS:
+        return True
+    return is_retryable_message(str(error))
+
+
+def is_retryable_message(message):
+    message = (message or '').lower()
+    return any(fragment in message for fragment in RETRYABLE_MESSAGES)
+
+
+class RateLimiter:
+    """
+    Cubos de tokens persistidos en SQLite. `requests_per_minute` o
+    `tokens_per_minute` a 0 desactivan ese límite; sin ninguno de los dos no
+    se abre el fichero y `call` sólo reintenta con espera exponencial. Las
+    métricas de espera son del proceso actual.
+    """
+
+    def __init__(self, path=DEFAULT_PATH, requests_per_minute=0, tokens_per_minute=0,
+                 name='default', max_retries=5, backoff_base=0.5, backoff_cap=30.0):
+        self.path = path
+        self.name = name
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.acquired = 0
+        self.retries = 0
+        self.failures = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        if not self.limited:
+            return
+        with self._connection() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS buckets ("
+                "name TEXT PRIMARY KEY, requests REAL, tokens REAL, updated REAL)"
+            )
+
+    @property
+    def limited(self):
+        return bool(self.requests_per_minute or self.tokens_per_minute)
+
+    def _connection(self):
+        # sqlite3 no comparte conexiones entre hilos: una por hilo
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            self._local.connection = connection
+        return _Transaction(connection)
+
+    def _try_take(self, tokens):
+        """Descuenta del cubo si hay cupo. Devuelve 0 o los segundos que faltan."""
+        now = time.time()
+        with self._connection() as connection:
+            row = connection.execute(
+                "SELECT requests, tokens, updated FROM buckets WHERE name = ?", (self.name,)
+            ).fetchone()
+            if row is None:
+                requests_left, tokens_left, updated = self.requests_per_minute, self.tokens_per_minute, now
+            else:
+                requests_left, tokens_left, updated = row
+            elapsed = max(now - updated, 0.0)
+            requests_left = min(self.requests_per_minute, requests_left + elapsed * self.requests_per_minute / 60)
+            tokens_left = min(self.tokens_per_minute, tokens_left + elapsed * self.tokens_per_minute / 60)
+            # Una petición mayor que el cubo entero se deja pasar con el cubo lleno
+            tokens = min(tokens, self.tokens_per_minute)
+
+            wait = 0.0
+            if self.requests_per_minute and requests_left < 1:
+                wait = max(wait, (1 - requests_left) * 60 / self.requests_per_minute)
+            if self.tokens_per_minute and tokens_left < tokens:
+                wait = max(wait, (tokens - tokens_left) * 60 / self.tokens_per_minute)
+            if not wait:
+                requests_left -= 1
+                tokens_left -= tokens
+            connection.execute(
+                "INSERT OR REPLACE INTO buckets (name, requests, tokens, updated) VALUES (?, ?, ?, ?)",
+                (self.name, requests_left, tokens_left, now),
+            )
+            return wait
+
+    def acquire(self, tokens=1):
+        """Espera hasta que haya cupo para una petición de `tokens` tokens. Devuelve la espera."""
+        started = time.perf_counter()
+        if self.limited:
+            while True:
+                wait = self._try_take(tokens)
+                if not wait:
+                    break
+                time.sleep(min(wait, 1.0))
+        waited = time.perf_counter() - started
+        with self._lock:
+            self.acquired += 1
+            self.wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+        return waited
+
+    def backoff(self, attempt):
+        """Espera exponencial con jitter completo para el reintento `attempt` (desde 0)."""
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+
+    def call(self, function, tokens=1):
+        """
+        Ejecuta `function()` respetando la cuota y reintentando los errores
+        recuperables. Si se agotan los reintentos se relanza el último error.
+        """
+        attempt = 0
+        while True:
+            self.acquire(tokens)
+            try:
+                return function()
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    with self._lock:
+                        self.failures += 1
+                    raise
+                delay = self.backoff(attempt)
+                with self._lock:
+                    self.retries += 1
+                print(f"[WARN] Error recuperable del LLM ({e}); reintento {attempt + 1} en {delay:.2f} s")
+                time.sleep(delay)
+                attempt += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'acquired': self.acquired,
+                'retries': self.retries,
+                'failures': self.failures,
+                'queue_wait_seconds': round(self.wait_seconds, 3),
+                'queue_wait_avg_seconds': round(self.wait_seconds / self.acquired, 4) if self.acquired else 0.0,
+                'queue_wait_max_seconds': round(self.max_wait_seconds, 3),
+            }
+
+
+class _Transaction:
+    """`BEGIN IMMEDIATE` ... `COMMIT`: bloquea el fichero durante la lectura y escritura del cubo."""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        self.connection.execute('BEGIN IMMEDIATE')
+        return self.connection
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.connection.execute('ROLLBACK' if exc_type else 'COMMIT')
+
+
+_shared = {}
+_shared_lock = threading.Lock()
+
+
+def shared_rate_limiter(config):
+    """
+    Limitador del proceso configurado con `Config`. Sin RPM ni TPM no hay
+    cubo, pero los errores recuperables se siguen reintentando con espera
+    exponencial. Todos los gestores del proceso comparten la misma instancia.
+    """
+    key = (config.RATE_LIMIT_DB, config.RATE_LIMIT_RPM, config.RATE_LIMIT_TPM)
+    with _shared_lock:
+        if key not in _shared:
+            _shared[key] = RateLimiter(
+                config.RATE_LIMIT_DB,
+                requests_per_minute=config.RATE_LIMIT_RPM,
+                tokens_per_minute=config.RATE_LIMIT_TPM,
+                max_retries=config.LLM_MAX_RETRIES,
+            )
+        return _shared[key]
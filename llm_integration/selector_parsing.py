@@ -0,0 +1,154 @@
+import json
+import re
+
+from chopperfix.selector_registry import compile_selector
+
+
+def fix_xpath(xpath: str) -> str:
+    """Asegura que los valores de atributos del XPath van entre comillas dobles."""
+    if not xpath:
+        return xpath
+    return compile_selector(xpath).double_quoted
+
+
+def clean_xpath(raw_response: str) -> str:
+    """Elimina las vallas de código de la respuesta del modelo."""
+    cleaned_xpath = raw_response.strip().replace("```xpath", "").replace("```", "").strip()
+    return cleaned_xpath
+
+
+def parse_selector_map(raw_response: str, keys: list[str]) -> dict[str, str | None]:
+    """
+    Extrae el objeto JSON {clave: selector} de una respuesta en lote del LLM.
+    Tolera envolturas ```json y texto alrededor; las claves que falten o sean
+    nulas se devuelven como None.
+    """
+    result = {key: None for key in keys}
+    if not raw_response:
+        return result
+    text = raw_response.strip().replace("```json", "").replace("```", "")
+    match = re.search(r"\{.*\}", text, re.DOTALL)
+    if not match:
+        return result
+    try:
+        data = json.loads(match.group(0))
+    except ValueError:
+        return result
+    for key in keys:
+        value = data.get(key)
+        if isinstance(value, str) and value.strip() and value.strip().lower() != "none":
+            result[key] = value.strip()
+    return result
+
+
+def format_batch_failures(failures: list[dict]) -> str:
+    """Describe cada selector roto (con su clave) para el prompt en lote."""
+    blocks = []
+    for key, failure in enumerate(failures, start=1):
+        blocks.append(
+            f"[{key}] action: {failure.get('action')}\n"
+            f"    failed selector: {failure.get('selector')}\n"
+            f"    last known element HTML: {failure.get('full_element_html') or 'Not available'}"
+        )
+    return "\n".join(blocks)
+
+
+_FENCE_RE = re.compile(r"^`{3}\s*\w*\s*$")
+_INLINE_CODE_RE = re.compile(r"`([^`\n]+)`")
+# Id, clase, atributo, pseudoclase o combinador explícito: una palabra suelta no basta
+_STRUCTURED_CSS_RE = re.compile(r"[#.\[:>+~]")
+
+
+def is_valid_selector_syntax(selector: str, cache: bool = True) -> bool:
+    """Comprueba que el selector compila como XPath o se puede traducir desde CSS."""
+    if not selector:
+        return False
+    return compile_selector(selector, cache=cache).valid
+
+
+def _looks_like_selector(compiled) -> bool:
+    """
+    XPath o CSS con estructura. Una línea de prosa de una sola palabra
+    ('Selector', 'Button') también es un selector de tipo CSS válido.
+    """
+    if compiled.kind == "xpath" or compiled.expression != compiled.selector:
+        # XPath o motor indicado explícitamente ('css=...')
+        return True
+    return bool(_STRUCTURED_CSS_RE.search(compiled.expression))
+
+
+class StreamingSelectorParser:
+    """
+    Extrae un selector de una respuesta del LLM que llega por fragmentos.
+
+    Cada línea completa (o código entre comillas invertidas) se limpia con
+    `normalize`, se comprueba su sintaxis y, si se indica `validate`, que
+    coincida con el DOM. `feed` devuelve el primer selector que lo cumple, de
+    modo que el llamador puede cortar el stream sin esperar al resto.
+    """
+
+    def __init__(self, normalize=None, validate=None):
+        self.normalize = normalize or (lambda selector: selector)
+        self.validate = validate
+        self.buffer = ""
+        self.chunks = 0
+        self.fallback = None
+        self.selector = None
+
+    def _candidates(self, line):
+        inline = _INLINE_CODE_RE.findall(line)
+        for candidate in inline or [line]:
+            candidate = candidate.strip().strip("`'\"").strip()
+            if candidate and not _FENCE_RE.match(candidate) and candidate.lower() not in ("xpath", "css"):
+                yield candidate
+
+    def _check_line(self, line):
+        if _FENCE_RE.match(line.strip()):
+            return None
+        for candidate in self._candidates(line):
+            selector = self.normalize(candidate)
+            if not selector:
+                continue
+            # Cada línea del stream se evalúa una vez: no se guarda en el registro compartido
+            compiled = compile_selector(selector, cache=False)
+            if not compiled.valid:
+                continue
+            if self.validate is None or self.validate(selector):
+                return selector
+            if self.fallback is None and _looks_like_selector(compiled):
+                # Sintaxis válida pero sin coincidencia: se usa si no aparece nada mejor
+                self.fallback = selector
+        return None
+
+    def feed(self, chunk: str) -> str | None:
+        self.chunks += 1
+        self.buffer += chunk or ""
+        while "\n" in self.buffer and self.selector is None:
+            line, self.buffer = self.buffer.split("\n", 1)
+            self.selector = self._check_line(line)
+        return self.selector
+
+    def finish(self) -> str | None:
+        """Procesa el resto del buffer al terminar el stream."""
+        if self.selector is None and self.buffer.strip():
+            self.selector = self._check_line(self.buffer)
+            self.buffer = ""
+        return self.selector or self.fallback
+
+
+def consume_selector_stream(chunks, parser, text_of=None):
+    """
+    Recorre un stream de fragmentos hasta que `parser` encuentra un selector
+    válido y lo cierra en ese momento (se cancela el resto de la respuesta).
+    `text_of` extrae el texto de cada fragmento. Devuelve (selector,
+    cortado_antes_de_tiempo).
+    """
+    try:
+        for chunk in chunks:
+            if parser.feed(text_of(chunk) if text_of else chunk):
+                return parser.selector, True
+        return parser.finish(), False
+    finally:
+        close = getattr(chunks, "close", None)
+        if close is not None:
+            close()
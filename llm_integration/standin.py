@@ -0,0 +1,347 @@
+"""
+Simulador local de un endpoint compatible con OpenAI para pruebas de carga.
+
+Implementa `POST /v1/chat/completions` (respuesta JSON o streaming SSE),
+`GET /v1/models` y `GET /stats`, con latencia y tasa de errores 429
+configurables. Las respuestas son fijas (`canned`: {fragmento del prompt:
+respuesta}) o heurísticas: para los prompts de reparación busca el selector
+en el HTML del propio prompt con `self_healing.candidates`, así que los flujos
+se pueden ejecutar de extremo a extremo sin gastar cuota del proveedor.
+
+    chopperfix llm-standin --port 8765 --latency-ms 300 --error-rate 0.05
+    CHOPPERFIX_LLM_BASE_URL=http://127.0.0.1:8765/v1 python mi_flujo.py
+"""
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from functools import cached_property
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from self_healing.candidates import find_local_replacement, generate_candidates, parse_html, select_elements
+
+from .rate_limiter import estimate_tokens
+
+STREAM_CHUNK_CHARS = 8
+NO_ANSWER = "None"
+# Candidatos por afinidad que se comprueban contra el árbol antes de rendirse
+MAX_VERIFIED_CANDIDATES = 20
+
+_HTML_RE = re.compile(r"```html\n(.*?)\n```", re.S)
+_FAILED_RE = re.compile(r"- Failed selector: (.*)")
+_ELEMENT_RE = re.compile(r"- Full element HTML: (.*?)\n- Parent element HTML:", re.S)
+_BATCH_RE = re.compile(
+    r"\[(\d+)\] action: .*?\n\s+failed selector: (.*?)\n\s+last known element HTML: (.*?)(?=\n\[\d+\] action:|\n\n|$)",
+    re.S,
+)
+_ACTION_RE = re.compile(r"- Action: (.*)")
+_SELECTOR_RE = re.compile(r"- Selector: (.*)")
+# Valores entre comillas de un XPath, o ids y clases de un selector CSS
+_VALUE_RE = re.compile(r"'([^']+)'|\"([^\"]+)\"|[#.]([\w-]+)")
+
+
+class StandinLLM:
+    """Genera las respuestas del simulador y lleva sus métricas."""
+
+    def __init__(self, latency_ms=0, jitter_ms=0, chunk_delay_ms=0, error_rate=0.0, canned=None, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.chunk_delay_ms = chunk_delay_ms
+        self.error_rate = error_rate
+        self.canned = canned or {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.streams = 0
+        self.streams_cut = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    def delay(self):
+        """Espera la latencia configurada (más un jitter uniforme) antes de responder."""
+        with self._lock:
+            jitter = self._random.uniform(0, self.jitter_ms) if self.jitter_ms else 0.0
+        seconds = (self.latency_ms + jitter) / 1000
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def should_fail(self):
+        with self._lock:
+            self.requests += 1
+            failed = self.error_rate > 0 and self._random.random() < self.error_rate
+            if failed:
+                self.errors += 1
+            return failed
+
+    def answer(self, prompt):
+        for fragment, response in self.canned.items():
+            if fragment != '*' and fragment in prompt:
+                return response
+        if '*' in self.canned:
+            return self.canned['*']
+        return heuristic_answer(prompt)
+
+    def record(self, prompt, completion, stream=False, cut=False):
+        with self._lock:
+            self.prompt_tokens += estimate_tokens(prompt)
+            self.completion_tokens += estimate_tokens(completion)
+            self.streams += int(stream)
+            self.streams_cut += int(cut)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'errors': self.errors,
+                'streams': self.streams,
+                'streams_cut': self.streams_cut,
+                'prompt_tokens': self.prompt_tokens,
+                'completion_tokens': self.completion_tokens,
+            }
+
+
+def heuristic_answer(prompt):
+    """Respuesta plausible a los prompts de `llm_integration.prompts` sin llamar a ningún modelo."""
+    html_match = _HTML_RE.search(prompt)
+    tree = parse_html(html_match.group(1)) if html_match else None
+    # Un único índice de candidatos por prompt, compartido por todos los selectores del lote
+    index = _CandidateIndex(tree) if tree is not None else None
+    if "Broken selectors:" in prompt:
+        suggestions = {
+            key: _guess_selector(index, failed.strip(), element.strip())
+            for key, failed, element in _BATCH_RE.findall(prompt)
+        }
+        return json.dumps(suggestions)
+    if "Failed selector:" in prompt:
+        failed = _FAILED_RE.search(prompt)
+        element = _ELEMENT_RE.search(prompt)
+        selector = _guess_selector(
+            index, failed.group(1).strip() if failed else '', element.group(1).strip() if element else ''
+        )
+        return f"```xpath\n{selector}\n```" if selector else NO_ANSWER
+    if "Given the following details of a web automation action" in prompt:
+        action = _ACTION_RE.search(prompt)
+        selector = _SELECTOR_RE.search(prompt)
+        return (
+            f"Performs '{action.group(1).strip() if action else 'action'}' on the element "
+            f"matched by {selector.group(1).strip() if selector else 'the selector'}."
+        )
+    return NO_ANSWER
+
+
+class _CandidateIndex:
+    """
+    Candidatos de todos los elementos del árbol, generados una sola vez (la
+    primera vez que se piden). Un candidato que generan dos elementos no puede
+    ser único, así que sólo se evalúan contra el árbol los demás.
+    """
+
+    def __init__(self, tree):
+        self.tree = tree
+
+    @cached_property
+    def candidates(self):
+        """[(selector, selector en minúsculas)] en orden del documento, sin los repetidos."""
+        generated = [
+            selector
+            for element in self.tree.iter() if isinstance(element.tag, str)
+            for selector, _strategy in generate_candidates(element)
+        ]
+        counts = Counter(generated)
+        return [(selector, selector.lower()) for selector in generated if counts[selector] == 1]
+
+    def best_match(self, tokens):
+        """Candidato único con más tokens en común (el primero del documento si empatan)."""
+        ranked = sorted(
+            (-hits, position, selector)
+            for position, (selector, lowered) in enumerate(self.candidates)
+            for hits in [sum(token in lowered for token in tokens)] if hits
+        )
+        for _, _, selector in ranked[:MAX_VERIFIED_CANDIDATES]:
+            matches = select_elements(self.tree, selector)
+            if matches and len(matches) == 1:
+                return selector
+        return None
+
+
+def _guess_selector(index, failed_selector, element_html):
+    """Selector único en el árbol para el elemento guardado o, sin él, por afinidad con el selector roto."""
+    if index is None:
+        return None
+    if element_html and element_html != "Not available":
+        found = find_local_replacement(index.tree, element_html)
+        if found:
+            return found[0]
+    tokens = {
+        token.lower()
+        for groups in _VALUE_RE.findall(failed_selector)
+        for value in groups if value
+        for token in re.split(r"[\W_]+", value) if len(token) > 1
+    }
+    if not tokens:
+        return None
+    return index.best_match(tokens)
+
+
+def _prompt_of(body):
+    """Texto del último mensaje del usuario (o el `prompt` de la API de completions)."""
+    messages = body.get('messages') or []
+    for message in reversed(messages):
+        if message.get('role') == 'user':
+            content = message.get('content')
+            if isinstance(content, list):
+                return "".join(part.get('text', '') for part in content if isinstance(part, dict))
+            return content or ''
+    return body.get('prompt') or ''
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'ChopperFixStandin/1.0'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload, headers=None):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        llm = self.server.llm
+        if self.path.rstrip('/') in ('/v1/models', '/models'):
+            self._send_json(200, {'object': 'list', 'data': [{'id': 'standin', 'object': 'model', 'owned_by': 'chopperfix'}]})
+        elif self.path.rstrip('/') == '/stats':
+            self._send_json(200, llm.stats())
+        else:
+            self._send_json(404, {'error': {'message': f'Unknown path {self.path}', 'type': 'invalid_request_error'}})
+
+    def do_POST(self):
+        llm = self.server.llm
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self._send_json(404, {'error': {'message': f'Unknown path {self.path}', 'type': 'invalid_request_error'}})
+            return
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            body = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            self._send_json(400, {'error': {'message': 'Invalid JSON body', 'type': 'invalid_request_error'}})
+            return
+
+        llm.delay()
+        if llm.should_fail():
+            self._send_json(
+                429,
+                {'error': {'message': 'Rate limit reached (stand-in)', 'type': 'rate_limit_error',
+                           'code': 'rate_limit_exceeded'}},
+                headers={'Retry-After': '1'},
+            )
+            return
+
+        prompt = _prompt_of(body)
+        completion = llm.answer(prompt)
+        model = body.get('model') or 'standin'
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        if body.get('stream'):
+            self._stream(llm, prompt, completion, model, completion_id)
+            return
+        llm.record(prompt, completion)
+        self._send_json(200, {
+            'id': completion_id,
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': model,
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': completion},
+                'finish_reason': 'stop',
+            }],
+            'usage': {
+                'prompt_tokens': estimate_tokens(prompt),
+                'completion_tokens': estimate_tokens(completion),
+                'total_tokens': estimate_tokens(prompt) + estimate_tokens(completion),
+            },
+        })
+
+    def _stream(self, llm, prompt, completion, model, completion_id):
+        """Envía la respuesta como eventos SSE; si el cliente corta el stream se cuenta como cortado."""
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+
+        def event(delta, finish_reason=None):
+            chunk = {
+                'id': completion_id,
+                'object': 'chat.completion.chunk',
+                'created': int(time.time()),
+                'model': model,
+                'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}],
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+            self.wfile.flush()
+
+        cut = False
+        try:
+            event({'role': 'assistant', 'content': ''})
+            for start in range(0, len(completion), STREAM_CHUNK_CHARS):
+                if llm.chunk_delay_ms:
+                    time.sleep(llm.chunk_delay_ms / 1000)
+                event({'content': completion[start:start + STREAM_CHUNK_CHARS]})
+            event({}, finish_reason='stop')
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            cut = True
+        llm.record(prompt, completion, stream=True, cut=cut)
+
+
+class StandinServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, llm):
+        super().__init__(address, _Handler)
+        self.llm = llm
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        """Atiende peticiones en un hilo en segundo plano."""
+        self._thread = threading.Thread(target=self.serve_forever, name='chopperfix-llm-standin', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+
+def start_standin_server(host='127.0.0.1', port=0, **options):
+    """Arranca el simulador en segundo plano (`port=0` elige un puerto libre). Ver `StandinLLM`."""
+    return StandinServer((host, port), StandinLLM(**options)).start()
+
+
+def load_canned(path):
+    """Lee un JSON {fragmento del prompt: respuesta}; la clave '*' es la respuesta por defecto."""
+    with open(path, encoding='utf-8') as f:
+        canned = json.load(f)
+    if not isinstance(canned, dict):
+        raise ValueError("El fichero de respuestas debe ser un objeto JSON {fragmento: respuesta}")
+    return {str(key): str(value) for key, value in canned.items()}
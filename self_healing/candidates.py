@@ -0,0 +1,141 @@
+"""
+Generación y verificación local de selectores alternativos.
+
+A partir del HTML que tenía el elemento la última vez que funcionó se construyen
+selectores candidatos (id, name, data-*, texto, clases...) y se comprueban
+contra el DOM actual. No hace falta navegador ni LLM.
+"""
+from lxml import etree, html as lxml_html
+
+from chopperfix.selector_registry import compile_selector
+
+# Atributos estables en orden de preferencia
+STABLE_ATTRIBUTES = (
+    'id', 'name', 'data-testid', 'data-test', 'data-qa', 'data-cy', 'data-id',
+    'aria-label', 'placeholder', 'title', 'alt', 'for', 'href', 'value', 'role', 'type',
+)
+MAX_TEXT_LENGTH = 80
+MIN_SIMILARITY = 0.3
+
+
+def xpath_literal(value):
+    """Devuelve `value` como literal XPath válido aunque contenga comillas."""
+    if "'" not in value:
+        return f"'{value}'"
+    if '"' not in value:
+        return f'"{value}"'
+    parts = value.split("'")
+    return "concat(" + ", \"'\", ".join(f"'{part}'" for part in parts) + ")"
+
+
+def parse_html(html_content):
+    return etree.HTML(html_content) if html_content else None
+
+
+def parse_fragment(fragment):
+    """Parsea el HTML de un único elemento guardado en un patrón."""
+    if not fragment:
+        return None
+    try:
+        return lxml_html.fragment_fromstring(fragment.strip(), create_parent=False)
+    except Exception:
+        try:
+            return lxml_html.fragment_fromstring(fragment.strip(), create_parent='div')[0]
+        except Exception:
+            return None
+
+
+def select_elements(tree, selector):
+    """
+    Evalúa un selector XPath o CSS sobre un árbol lxml. Devuelve la lista de
+    elementos o None si el selector no se puede evaluar.
+    """
+    if tree is None or not selector:
+        return None
+    # El selector se compila una sola vez (CSS traducido a XPath) en el registro compartido
+    return compile_selector(selector).select(tree)
+
+
+def is_unique_match(tree, selector):
+    matches = select_elements(tree, selector)
+    return matches is not None and len(matches) == 1
+
+
+def _element_text(element):
+    text = ' '.join(''.join(element.itertext()).split())
+    return text if len(text) <= MAX_TEXT_LENGTH else ''
+
+
+def element_similarity(old, new):
+    """Similitud (0-1) entre dos elementos: etiqueta, atributos y texto."""
+    if old is None or new is None:
+        return 0.0
+    old_features = {('tag', old.tag)} | {(k, v) for k, v in old.attrib.items() if k != 'style'}
+    new_features = {('tag', new.tag)} | {(k, v) for k, v in new.attrib.items() if k != 'style'}
+    old_text, new_text = _element_text(old), _element_text(new)
+    if old_text:
+        old_features.add(('text', old_text))
+    if new_text:
+        new_features.add(('text', new_text))
+    union = old_features | new_features
+    return len(old_features & new_features) / len(union) if union else 0.0
+
+
+def generate_candidates(element):
+    """
+    Genera selectores XPath candidatos para `element`, ordenados de más a
+    menos estable. Devuelve una lista de (selector, estrategia).
+    """
+    if element is None or not isinstance(element.tag, str):
+        return []
+    tag = element.tag
+    candidates = []
+    for attribute in STABLE_ATTRIBUTES:
+        value = element.get(attribute)
+        if value:
+            strategy = 'data' if attribute.startswith('data-') else attribute
+            candidates.append((f"//{tag}[@{attribute}={xpath_literal(value)}]", strategy))
+    for attribute, value in element.attrib.items():
+        if attribute.startswith('data-') and attribute not in STABLE_ATTRIBUTES and value:
+            candidates.append((f"//{tag}[@{attribute}={xpath_literal(value)}]", 'data'))
+
+    text = _element_text(element)
+    if text:
+        candidates.append((f"//{tag}[normalize-space()={xpath_literal(text)}]", 'text'))
+
+    if element.get('name') and element.get('type'):
+        candidates.append((
+            f"//{tag}[@type={xpath_literal(element.get('type'))} and @name={xpath_literal(element.get('name'))}]",
+            'attributes',
+        ))
+    classes = (element.get('class') or '').split()
+    if classes:
+        predicate = ' and '.join(
+            f"contains(concat(' ', normalize-space(@class), ' '), {xpath_literal(' ' + cls + ' ')})"
+            for cls in classes[:3]
+        )
+        candidates.append((f"//{tag}[{predicate}]", 'class'))
+    return candidates
+
+
+def find_local_replacement(tree, full_element_html, exclude=()):
+    """
+    Busca en `tree` el elemento que mejor corresponde al HTML guardado y
+    devuelve (selector, estrategia, similitud) o None.
+    """
+    old_element = parse_fragment(full_element_html)
+    if tree is None or old_element is None:
+        return None
+    best = None
+    for selector, strategy in generate_candidates(old_element):
+        if selector in exclude:
+            continue
+        matches = select_elements(tree, selector)
+        if not matches or len(matches) != 1:
+            continue
+        similarity = element_similarity(old_element, matches[0])
+        if similarity < MIN_SIMILARITY:
+            continue
+        if best is None or similarity > best[2] + 1e-9:
+            best = (selector, strategy, similarity)
+    return best
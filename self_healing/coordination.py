@@ -0,0 +1,107 @@
+"""
+Coordinación de la reparación entre hilos y procesos.
+
+Cuando muchos workers rompen el mismo selector a la vez, sólo uno debe pagar
+la reparación (candidatos locales, LLM). Los demás esperan a que el primero
+guarde el reemplazo y lo reutilizan. Las reservas se guardan en un fichero
+SQLite compartido, como el limitador de peticiones al LLM, y caducan solas por
+si el proceso que las tenía muere a mitad de la reparación.
+"""
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+
+class HealCoordinator:
+    def __init__(self, path, lease_seconds=60.0, wait_seconds=30.0, poll_interval=0.2):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.wait_seconds = wait_seconds
+        self.poll_interval = poll_interval
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.leases = 0
+        self.waits = 0
+        self.reused = 0
+        self.timeouts = 0
+        with self._connection() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS heal_leases (key TEXT PRIMARY KEY, owner TEXT, expires REAL)"
+            )
+
+    @contextmanager
+    def _connection(self):
+        """Transacción `BEGIN IMMEDIATE` sobre la conexión de este hilo."""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            self._local.connection = connection
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield connection
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+
+    def _owner(self):
+        return f"{os.getpid()}:{threading.get_ident()}"
+
+    def acquire(self, key):
+        """Reserva la reparación de `key`. Devuelve True si este hilo debe repararla."""
+        now = time.time()
+        with self._connection() as connection:
+            row = connection.execute("SELECT owner, expires FROM heal_leases WHERE key = ?", (key,)).fetchone()
+            if row is not None and row[1] > now and row[0] != self._owner():
+                return False
+            connection.execute(
+                "INSERT OR REPLACE INTO heal_leases (key, owner, expires) VALUES (?, ?, ?)",
+                (key, self._owner(), now + self.lease_seconds),
+            )
+        with self._lock:
+            self.leases += 1
+        return True
+
+    def release(self, key):
+        """Libera la reserva si es de este hilo."""
+        with self._connection() as connection:
+            connection.execute("DELETE FROM heal_leases WHERE key = ? AND owner = ?", (key, self._owner()))
+
+    def is_leased(self, key):
+        with self._connection() as connection:
+            row = connection.execute("SELECT expires FROM heal_leases WHERE key = ?", (key,)).fetchone()
+        return row is not None and row[0] > time.time()
+
+    def wait_for(self, key, lookup):
+        """
+        Espera a que otro worker termine de reparar `key`, consultando
+        `lookup()` hasta que devuelva un reemplazo. Devuelve el reemplazo o None
+        si la reserva se libera o caduca sin resultado (entonces hay que reparar).
+        """
+        with self._lock:
+            self.waits += 1
+        deadline = time.monotonic() + self.wait_seconds
+        while True:
+            replacement = lookup()
+            if replacement:
+                with self._lock:
+                    self.reused += 1
+                return replacement
+            if not self.is_leased(key):
+                return None
+            if time.monotonic() >= deadline:
+                with self._lock:
+                    self.timeouts += 1
+                return None
+            time.sleep(self.poll_interval)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'leases': self.leases,
+                'waits': self.waits,
+                'reused': self.reused,
+                'timeouts': self.timeouts,
+            }
@@ -0,0 +1,75 @@
+"""
+Detección de deriva estructural de los elementos que todavía funcionan.
+
+La huella de un elemento resume lo que lo identifica (etiqueta, atributos
+estables, clases, texto) y su ruta de ancestros. Comparando la huella guardada
+con la del último éxito se detecta que el sitio está cambiando antes de que el
+selector se rompa; `FallbackPrecomputer` recalcula entonces la cadena de
+respaldo contra el DOM actual.
+"""
+from self_healing.candidates import STABLE_ATTRIBUTES, _element_text
+
+DEFAULT_THRESHOLD = 0.35
+MAX_PATH_DEPTH = 6
+PATH_ATTRIBUTES = ('id', 'data-testid', 'data-test', 'data-qa', 'role')
+
+# Peso de cada parte de la huella en la deriva total
+WEIGHTS = {'attributes': 0.5, 'path': 0.3, 'classes': 0.1, 'text': 0.1}
+
+
+def _path_step(element):
+    for attribute in PATH_ATTRIBUTES:
+        value = element.get(attribute)
+        if value:
+            return f"{element.tag}[@{attribute}={value}]"
+    return element.tag
+
+
+def element_fingerprint(element):
+    """Huella estructural de un elemento lxml (serializable a JSON)."""
+    attributes = {
+        name: value for name, value in element.attrib.items()
+        if name in STABLE_ATTRIBUTES or name.startswith('data-')
+    }
+    path = []
+    for ancestor in element.iterancestors():
+        if len(path) >= MAX_PATH_DEPTH or ancestor.tag in ('html', 'body'):
+            break
+        if isinstance(ancestor.tag, str):
+            path.append(_path_step(ancestor))
+    return {
+        'tag': element.tag,
+        'attributes': attributes,
+        'classes': sorted(set((element.get('class') or '').split())),
+        'text': _element_text(element),
+        'path': path,
+    }
+
+
+def _distance(old, new):
+    """Distancia de Jaccard entre dos colecciones (0 si ambas están vacías)."""
+    old, new = set(old), set(new)
+    union = old | new
+    return 1 - len(old & new) / len(union) if union else 0.0
+
+
+def fingerprint_drift(old, new):
+    """
+    Deriva (0-1) entre dos huellas. Un cambio de etiqueta es deriva total; el
+    resto pondera atributos identificativos, ruta de ancestros, clases y texto.
+    """
+    if not old or not new:
+        return 0.0
+    if old.get('tag') != new.get('tag'):
+        return 1.0
+    drift = (
+        WEIGHTS['attributes'] * _distance(
+            (old.get('attributes') or {}).items(), (new.get('attributes') or {}).items()
+        )
+        + WEIGHTS['path'] * _distance(
+            enumerate(old.get('path') or []), enumerate(new.get('path') or [])
+        )
+        + WEIGHTS['classes'] * _distance(old.get('classes') or [], new.get('classes') or [])
+        + WEIGHTS['text'] * (0.0 if old.get('text') == new.get('text') else 1.0)
+    )
+    return round(drift, 4)
@@ -0,0 +1,287 @@
+"""
+Cadenas de selectores de respaldo precalculadas al grabar una acción.
+
+Cuando un paso funciona, el DOM capturado ya contiene el elemento: se generan
+localmente localizadores alternativos (id, name, data-*, texto, relativos a un
+ancestro estable...), se comprueba que cada uno encuentra exactamente ese
+elemento y se ordenan por estabilidad. Se calculan en un hilo de fondo y se
+guardan con el patrón; cuando el selector se rompe, la reparación consiste en
+probar el siguiente candidato que coincida con el DOM actual, sin LLM.
+
+Con detección de deriva (`self_healing.drift`), el mismo hilo compara la huella
+del elemento con la guardada y, si ha cambiado demasiado, recalcula la cadena
+aunque el selector todavía funcione.
+"""
+import hashlib
+import queue
+import re
+import threading
+from collections import OrderedDict
+
+from chopperfix.selector_registry import compile_selector
+from self_healing import drift as drift_detection
+from self_healing.candidates import (
+    STABLE_ATTRIBUTES,
+    _element_text,
+    generate_candidates,
+    is_unique_match,
+    parse_html,
+    select_elements,
+    xpath_literal,
+)
+
+MAX_CHAIN_LENGTH = 6
+
+# Estabilidad esperada de cada estrategia ante rediseños (1 = muy estable)
+STRATEGY_STABILITY = {
+    'id': 1.0,
+    'data': 0.95,
+    'name': 0.9,
+    'aria-label': 0.85,
+    'for': 0.8,
+    'placeholder': 0.8,
+    'attributes': 0.75,
+    'title': 0.75,
+    'alt': 0.75,
+    'text': 0.65,
+    'ancestor': 0.6,
+    'href': 0.55,
+    'role': 0.5,
+    'value': 0.45,
+    'type': 0.4,
+    'class': 0.35,
+}
+DEFAULT_STABILITY = 0.3
+# Valores que parecen generados (ids numéricos, hashes): se penalizan
+DYNAMIC_VALUE_RE = re.compile(r"\d{4,}|[0-9a-f]{8,}|[_-][0-9a-z]{5,}\d", re.I)
+DYNAMIC_PENALTY = 0.5
+ANCHOR_ATTRIBUTES = ('id', 'data-testid', 'data-test', 'data-qa', 'data-cy', 'name', 'aria-label')
+
+
+def _stability(selector, strategy):
+    score = STRATEGY_STABILITY.get(strategy, DEFAULT_STABILITY)
+    if any(DYNAMIC_VALUE_RE.search(literal) for literal in compile_selector(selector).literals):
+        score *= DYNAMIC_PENALTY
+    return score
+
+
+def _anchor(element):
+    """Ancestro más cercano con un atributo estable y no dinámico: (elemento, predicado)."""
+    for ancestor in element.iterancestors():
+        if not isinstance(ancestor.tag, str) or ancestor.tag in ('html', 'body'):
+            continue
+        for attribute in ANCHOR_ATTRIBUTES:
+            value = ancestor.get(attribute)
+            if value and not DYNAMIC_VALUE_RE.search(value):
+                return ancestor, f"@{attribute}={xpath_literal(value)}"
+    return None, None
+
+
+def ancestor_candidates(tree, element):
+    """
+    Selectores relativos al ancestro estable más cercano, del más simple
+    (`//form[@id='f']//button`) al posicional (`(//form[@id='f']//button)[2]`).
+    """
+    ancestor, predicate = _anchor(element)
+    if ancestor is None:
+        return []
+    base = f"//{ancestor.tag}[{predicate}]//{element.tag}"
+    candidates = [base]
+    text = _element_text(element)
+    if text:
+        candidates.append(f"{base}[normalize-space()={xpath_literal(text)}]")
+    for attribute in STABLE_ATTRIBUTES:
+        value = element.get(attribute)
+        if value and attribute != 'id':
+            candidates.append(f"{base}[@{attribute}={xpath_literal(value)}]")
+            break
+    matches = select_elements(tree, base) or []
+    if element in matches:
+        candidates.append(f"({base})[{matches.index(element) + 1}]")
+    return [(selector, 'ancestor') for selector in candidates]
+
+
+def build_fallback_chain(tree, selector, limit=MAX_CHAIN_LENGTH):
+    """
+    Cadena ordenada de selectores alternativos para el elemento que `selector`
+    encuentra en `tree`. Sólo se incluyen los que localizan exactamente ese
+    elemento. Devuelve [{'selector', 'strategy', 'score'}] o [] si el selector
+    no identifica un único elemento.
+    """
+    matches = select_elements(tree, selector)
+    if not matches or len(matches) != 1:
+        return []
+    return element_fallback_chain(tree, matches[0], exclude=(selector,), limit=limit)
+
+
+def element_fallback_chain(tree, element, exclude=(), limit=MAX_CHAIN_LENGTH):
+    """Como `build_fallback_chain`, partiendo del elemento ya localizado."""
+    seen = set(exclude)
+    chain = []
+    for candidate, strategy in generate_candidates(element) + ancestor_candidates(tree, element):
+        if candidate in seen:
+            continue
+        seen.add(candidate)
+        found = select_elements(tree, candidate)
+        if not found or len(found) != 1 or found[0] is not element:
+            continue
+        chain.append({
+            'selector': candidate,
+            'strategy': strategy,
+            'score': round(_stability(candidate, strategy), 3),
+        })
+    # Orden estable: a igual puntuación se mantiene el orden de generación
+    chain.sort(key=lambda item: -item['score'])
+    return chain[:limit]
+
+
+def first_matching_fallback(html_content, fallbacks, tree=None):
+    """Primer selector precalculado que coincide con un único elemento del DOM actual."""
+    if not fallbacks:
+        return None
+    tree = tree if tree is not None else parse_html(html_content)
+    for candidate in fallbacks:
+        if is_unique_match(tree, candidate):
+            return candidate
+    return None
+
+
+class FallbackPrecomputer:
+    """
+    Calcula las cadenas en un hilo de fondo para no añadir latencia al paso.
+    La cola está acotada: si se llena, los pasos nuevos se descartan (se
+    recalcularán en su próximo éxito). Los pasos ya calculados no se repiten:
+    se comparan por el HTML del elemento o, con detección de deriva, por el de
+    toda la página, porque la deriva también puede estar en los ancestros.
+
+    Con `chains=False` y `drift_threshold` sólo se calcula la cadena cuando la
+    deriva desde la última huella de referencia supera el umbral.
+    """
+
+    def __init__(self, storage, max_pending=1000, max_known=10000, chain_length=MAX_CHAIN_LENGTH,
+                 chains=True, drift_threshold=None):
+        self.storage = storage
+        self.chain_length = chain_length
+        self.chains = chains
+        self.drift_threshold = drift_threshold
+        self.max_known = max_known
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._known = OrderedDict()
+        self._lock = threading.Lock()
+        self._worker = None
+        self.computed = 0
+        self.stored = 0
+        self.skipped = 0
+        self.dropped = 0
+        self.drifted = 0
+
+    def _key(self, action, selector, url, html_content, element_html):
+        content = html_content if self.drift_threshold is not None else element_html
+        digest = hashlib.sha1((content or '').encode('utf-8', errors='replace')).hexdigest()
+        return action, selector, url, digest
+
+    def submit(self, action, selector, url, html_content, element_html=None):
+        """Encola el cálculo de la cadena. Devuelve False si se omite o se descarta."""
+        if not selector or selector == 'URL' or not html_content:
+            return False
+        key = self._key(action, selector, url, html_content, element_html)
+        with self._lock:
+            if key in self._known:
+                self._known.move_to_end(key)
+                self.skipped += 1
+                return False
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait((key, action, selector, url, html_content))
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return False
+        return True
+
+    def _ensure_worker(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is not None and self._worker.is_alive():
+                return
+            self._worker = threading.Thread(target=self._run, name='chopperfix-fallbacks', daemon=True)
+            self._worker.start()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                key, action, selector, url, html_content = item
+                if self._process(action, selector, url, html_content):
+                    with self._lock:
+                        self._known[key] = True
+                        if len(self._known) > self.max_known:
+                            self._known.popitem(last=False)
+            except Exception as e:
+                print(f"[ERROR] No se pudo calcular la cadena de respaldo: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _process(self, action, selector, url, html_content):
+        """Huella, deriva y cadena de un paso. Devuelve True si el resultado quedó guardado."""
+        tree = parse_html(html_content)
+        matches = select_elements(tree, selector)
+        if not matches or len(matches) != 1:
+            return False
+        element = matches[0]
+
+        fingerprint = drift = None
+        drifted = False
+        if self.drift_threshold is not None:
+            fingerprint = drift_detection.element_fingerprint(element)
+            previous = self.storage.get_element_fingerprint(action, selector, url)
+            if previous:
+                drift = drift_detection.fingerprint_drift(previous, fingerprint)
+                drifted = drift >= self.drift_threshold
+                if drifted:
+                    print(f"[INFO] Deriva detectada en '{selector}' ({drift:.2f}); "
+                          f"se recalculan sus selectores de respaldo")
+                else:
+                    # La huella de referencia sólo cambia al revalidar la cadena
+                    fingerprint = None
+
+        chain = None
+        if self.chains or drifted:
+            chain = element_fallback_chain(tree, element, exclude=(selector,), limit=self.chain_length)
+            with self._lock:
+                self.computed += 1
+                self.drifted += int(drifted)
+        if not chain and fingerprint is None and drift is None:
+            return False
+        stored = self.storage.save_fallback_chain(
+            action, selector, url, chain or None, fingerprint=fingerprint, drift=drift,
+        )
+        if stored and chain:
+            with self._lock:
+                self.stored += 1
+        return stored
+
+    def flush(self):
+        """Espera a que se procesen todos los pasos encolados."""
+        if self._worker is not None:
+            self._queue.join()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'pending': self._queue.qsize(),
+                'computed': self.computed,
+                'stored': self.stored,
+                'skipped': self.skipped,
+                'dropped': self.dropped,
+                'drifted': self.drifted,
+            }
+
+    def close(self):
+        if self._worker is not None and self._worker.is_alive():
+            self._queue.put(None)
+            self._worker.join()
+        self._worker = None
@@ -0,0 +1,185 @@
+"""
+Self-healing masivo fuera de línea sobre instantáneas HTML guardadas.
+
+Cada instantánea se procesa en un proceso del pool: se parsea una sola vez, se
+comprueban todos los selectores guardados para su URL y se generan candidatos
+locales para los que ya no coinciden. Lo que no se resuelve localmente se envía
+al LLM con concurrencia limitada y la respuesta se verifica contra el DOM.
+"""
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from urllib.parse import unquote
+
+from learning.pattern_storage import effective_selector
+from self_healing.candidates import (
+    find_local_replacement,
+    is_unique_match,
+    parse_html,
+    select_elements,
+)
+
+MANIFEST_FILE = 'manifest.json'
+_archives = {}
+
+
+def load_snapshot_index(directory):
+    """
+    Devuelve [(ruta, url)] de las instantáneas de `directory`. La URL se toma de
+    `manifest.json` ({"fichero.html": "url"}) o, si no existe, del nombre del
+    fichero con la URL codificada (p. ej. `example.com%2Fwiki%2FX.html`).
+    """
+    manifest_path = os.path.join(directory, MANIFEST_FILE)
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, encoding='utf-8') as f:
+            manifest = json.load(f)
+
+    snapshots = []
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith(('.html', '.htm')):
+            continue
+        url = manifest.get(name) or unquote(os.path.splitext(name)[0])
+        snapshots.append((os.path.join(directory, name), url))
+    return snapshots
+
+
+def load_archive_index(archive_dir):
+    """Devuelve [(('archive', dir, hash), url)] con la última instantánea de cada URL."""
+    from learning.snapshot_store import SnapshotStore
+
+    store = SnapshotStore(archive_dir, read_only=True)
+    return [(('archive', archive_dir, key), url) for url, key in sorted(store.urls().items())]
+
+
+def read_snapshot(source):
+    """Lee una instantánea desde un fichero o desde el archivo de instantáneas."""
+    if isinstance(source, tuple):
+        from learning.snapshot_store import SnapshotStore
+
+        _, archive_dir, key = source
+        store = _archives.get(archive_dir)
+        if store is None:
+            store = _archives[archive_dir] = SnapshotStore(archive_dir, read_only=True)
+        return store.get(key) or ''
+    with open(source, encoding='utf-8', errors='replace') as f:
+        return f.read()
+
+
+def _pattern_payload(pattern):
+    # La clave `selector` está normalizada (sin comillas ni espacios): se evalúa el selector grabado
+    return {
+        'id': pattern.id,
+        'action': pattern.action,
+        'selector': pattern.selector,
+        'effective_selector': effective_selector(pattern),
+        'full_element_html': pattern.full_element_html,
+        'parent_element': pattern.parent_element,
+        'child_elements': pattern.child_elements,
+        'sibling_elements': pattern.sibling_elements,
+    }
+
+
+def heal_snapshot(task):
+    """
+    Trabajo de un proceso del pool. `task` es (origen, url, [patrones]) y
+    devuelve un resultado por patrón.
+    """
+    path, url, patterns = task
+    tree = parse_html(read_snapshot(path))
+
+    results = []
+    for pattern in patterns:
+        result = {
+            'id': pattern['id'],
+            'action': pattern['action'],
+            'url': url,
+            'snapshot': path,
+            'selector': pattern['selector'],
+            'replacement_selector': None,
+            'strategy': None,
+            'score': None,
+        }
+        matches = select_elements(tree, pattern['effective_selector'])
+        if matches:
+            result['status'] = 'ok'
+        else:
+            found = find_local_replacement(tree, pattern['full_element_html'], exclude=(pattern['effective_selector'],))
+            if found:
+                result.update(status='healed', replacement_selector=found[0], strategy=found[1], score=round(found[2], 3))
+            else:
+                result['status'] = 'unresolved'
+        results.append(result)
+    return results
+
+
+def _llm_heal(manager, result, pattern):
+    html_content = read_snapshot(result['snapshot'])
+    # El selector evaluable, no la clave normalizada (sin comillas ni espacios)
+    suggestion = manager.suggest_alternative_selector(
+        html_content, pattern['effective_selector'], pattern['action'],
+        full_element_html=pattern['full_element_html'],
+        parent_element=pattern['parent_element'],
+        child_elements=pattern['child_elements'],
+        sibling_elements=pattern['sibling_elements'],
+    )
+    if suggestion and is_unique_match(parse_html(html_content), suggestion):
+        result.update(status='healed', replacement_selector=suggestion, strategy='llm')
+    elif suggestion:
+        result.update(status='rejected', replacement_selector=suggestion, strategy='llm')
+    return result
+
+
+def heal_inventory(storage, snapshot_dir=None, workers=None, llm_manager=None,
+                   llm_concurrency=4, dry_run=False, archive_dir=None):
+    """
+    Cura todos los selectores guardados en `storage` que tengan una instantánea
+    en `snapshot_dir` o en el archivo `archive_dir`. Devuelve un informe con los
+    resultados y los totales.
+    """
+    started = time.perf_counter()
+    patterns_by_url = {}
+    skipped = 0
+    for pattern in storage.iter_active_patterns():
+        payload = _pattern_payload(pattern)
+        if payload['effective_selector'] is None:
+            # Patrón antiguo sin selector grabado: no se puede comprobar sin falsos positivos
+            skipped += 1
+            continue
+        patterns_by_url.setdefault(pattern.url, []).append(payload)
+
+    tasks = []
+    snapshots = load_archive_index(archive_dir) if archive_dir else load_snapshot_index(snapshot_dir)
+    for path, url in snapshots:
+        patterns = patterns_by_url.get(storage.normalize_url(url))
+        if patterns:
+            tasks.append((path, url, patterns))
+
+    results = []
+    if tasks:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for snapshot_results in pool.map(heal_snapshot, tasks):
+                results.extend(snapshot_results)
+
+    unresolved = [r for r in results if r['status'] == 'unresolved']
+    if unresolved and llm_manager is not None:
+        # Los ids sólo son únicos por partición (`ShardedPatternStorage`); la URL los distingue
+        payloads = {(url, p['id']): p for _, url, patterns in tasks for p in patterns}
+        with ThreadPoolExecutor(max_workers=max(1, llm_concurrency)) as pool:
+            list(pool.map(lambda r: _llm_heal(llm_manager, r, payloads[(r['url'], r['id'])]), unresolved))
+
+    healed = [r for r in results if r['status'] == 'healed']
+    if not dry_run:
+        storage.bulk_update_replacements([
+            {'id': r['id'], 'url': r['url'], 'replacement_selector': r['replacement_selector']}
+            for r in healed
+        ])
+
+    summary = {'snapshots': len(tasks), 'patterns': len(results), 'skipped': skipped}
+    for status in ('ok', 'healed', 'unresolved', 'rejected'):
+        summary[status] = sum(1 for r in results if r['status'] == status)
+    summary['llm_healed'] = sum(1 for r in healed if r['strategy'] == 'llm')
+    summary['elapsed_seconds'] = round(time.perf_counter() - started, 3)
+    summary['dry_run'] = dry_run
+    return {'summary': summary, 'results': results}
@@ -13,6 +13,8 @@ setup(
     install_requires=[
         'sqlalchemy',
         'beautifulsoup4',
+        'lxml',
+        'cssselect',
         'openai',
         'langchain',
         'langchain-openai',
@@ -29,6 +31,11 @@ setup(
         'License :: OSI Approved :: MIT License',
         'Operating System :: OS Independent',
     ],
+    entry_points={
+        'console_scripts': [
+            'chopperfix=chopperfix.cli:main',
+        ],
+    },
     python_requires='>=3.6',
     include_package_data=True,
     package_data={
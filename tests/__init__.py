@@ -0,0 +1,5 @@
+import os
+
+# La base de datos por defecto de `chopperdoc` se crea al importar el módulo:
+# en las pruebas se usa una en memoria para no escribir 'patterns.db' en el repositorio
+os.environ.setdefault("CHOPPERFIX_DB_URL", "sqlite:///:memory:")
@@ -1,11 +1,19 @@
+import asyncio
 import os
+import tempfile
 import unittest
 from unittest.mock import MagicMock, patch
 
 # Ensure LangChain does not require a real API key during import
 os.environ.setdefault("OPENAI_API_KEY", "test")
 
+from chopperfix import chopper_decorators
 from chopperfix.chopper_decorators import chopperdoc
+from chopperfix.drivers import SelectorNotFoundError
+from learning.pattern_storage import PatternStorage
+from learning.snapshot_store import SnapshotStore
+from self_healing.coordination import HealCoordinator
+from utils.config import Config
 
 class FakePage:
     def __init__(self):
@@ -27,6 +35,41 @@ def action(driver, action, **kwargs):
         raise Exception('fail')
     return 'ok'
 
+@chopperdoc
+async def async_action(driver, action, **kwargs):
+    calls.append(kwargs.get('xpath'))
+    if kwargs.get('xpath') == '//bad':
+        raise Exception('fail')
+    return 'ok'
+
+class FakeAsyncPage(FakePage):
+    async def content(self):
+        return self._html
+
+class ProbingPage(FakePage):
+    def __init__(self):
+        super().__init__()
+        self.waits = []
+    def wait_for_selector(self, selector, state=None, timeout=None):
+        self.waits.append((selector, timeout))
+        raise TimeoutError(selector)
+
+class ScriptPage(FakePage):
+    """Página con `evaluate`: el contexto del elemento se resuelve en el navegador."""
+    def __init__(self):
+        super().__init__()
+        self.content_calls = 0
+        self.scripts = 0
+    def content(self):
+        self.content_calls += 1
+        return super().content()
+    def evaluate(self, script, arg):
+        self.scripts += 1
+        if arg['selector'] == '//bad':
+            return None
+        return {'element': "<div id='a'></div>", 'parent': "<html><div id='a'></div></html>",
+                'children': [], 'siblings': []}
+
 class ChopperDecoratorTest(unittest.TestCase):
     def setUp(self):
         calls.clear()
@@ -53,5 +96,103 @@ class ChopperDecoratorTest(unittest.TestCase):
         self.assertTrue(second_call.kwargs['success'])
         self.assertEqual(second_call.args[1], '//fixed')
 
+    @patch('chopperfix.chopper_decorators.pattern_storage')
+    @patch('chopperfix.chopper_decorators.adalFlow_Manger')
+    def test_async_action_heals(self, mock_manager, mock_storage):
+        mock_storage.get_replacement_selector.return_value = '//fixed'
+        mock_manager.generate_description.return_value = 'desc'
+        self.driver.page = FakeAsyncPage()
+
+        result = asyncio.run(async_action(self.driver, 'click', xpath='//bad'))
+
+        self.assertEqual(result, 'ok')
+        self.assertEqual(calls, ['//bad', '//fixed'])
+        self.assertEqual(mock_storage.save_pattern.call_count, 2)
+
+    @patch.object(Config, 'PROBE_GRACE_MS', 50)
+    @patch.object(Config, 'PROBE_ENABLED', True)
+    @patch('chopperfix.chopper_decorators.pattern_storage')
+    @patch('chopperfix.chopper_decorators.adalFlow_Manger')
+    def test_probe_skips_driver_timeout_for_missing_selector(self, mock_manager, mock_storage):
+        mock_storage.get_replacement_selector.return_value = None
+        mock_manager.suggest_alternative_selector.return_value = None
+        self.driver.page = ProbingPage()
+
+        with self.assertRaises(SelectorNotFoundError):
+            action(self.driver, 'click', xpath='//bad')
+
+        self.assertEqual(calls, [])
+        self.assertEqual(self.driver.page.waits, [('xpath=//bad', 50)])
+        mock_storage.get_replacement_selector.assert_called_once()
+
+        # Un selector presente en la instantánea no se sondea
+        action(self.driver, 'click', xpath="//div[@id='a']")
+        self.assertEqual(len(self.driver.page.waits), 1)
+
+    @patch.object(Config, 'FALLBACK_CHAINS', True)
+    @patch('chopperfix.chopper_decorators.pattern_storage')
+    @patch('chopperfix.chopper_decorators.adalFlow_Manger')
+    def test_precomputed_fallback_heals_before_llm(self, mock_manager, mock_storage):
+        mock_storage.get_fallback_selectors.return_value = ["//div[@id='gone']", "//div[@id='a']"]
+        mock_manager.generate_description.return_value = 'desc'
+
+        result = action(self.driver, 'click', xpath='//bad')
+
+        self.assertEqual(result, 'ok')
+        # Se salta el candidato que ya no existe y no se consulta ni la base de datos ni el LLM
+        self.assertEqual(calls, ['//bad', "//div[@id='a']"])
+        mock_storage.get_replacement_selector.assert_not_called()
+        mock_manager.suggest_alternative_selector.assert_not_called()
+
+    @patch('chopperfix.chopper_decorators.pattern_storage')
+    @patch('chopperfix.chopper_decorators.adalFlow_Manger')
+    def test_successful_step_uses_element_context_without_page_content(self, mock_manager, mock_storage):
+        mock_storage.get_replacement_selector.return_value = '//fixed'
+        mock_manager.generate_description.return_value = 'desc'
+        page = self.driver.page = ScriptPage()
+
+        self.assertEqual(action(self.driver, 'click', xpath="//div[@id='a']"), 'ok')
+
+        self.assertEqual((page.scripts, page.content_calls), (1, 0))
+        # La descripción usa la ventana del padre en lugar de la página completa
+        self.assertEqual(mock_manager.generate_description.call_args.args[3], "<html><div id='a'></div></html>")
+        self.assertEqual(mock_storage.save_pattern.call_args.kwargs['full_element_html'], "<div id='a'></div>")
+
+        # La reparación sí necesita la página, una sola vez por paso
+        self.assertEqual(action(self.driver, 'click', xpath='//bad'), 'ok')
+        self.assertEqual(page.content_calls, 1)
+
+    @patch('chopperfix.chopper_decorators.pattern_storage')
+    @patch('chopperfix.chopper_decorators.adalFlow_Manger')
+    def test_heal_lease_is_released_when_healing_raises(self, mock_manager, mock_storage):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        coordinator = HealCoordinator(os.path.join(tmp.name, 'heals.db'))
+        mock_storage.get_replacement_selector.return_value = None
+        mock_storage.normalize_selector.side_effect = lambda selector: selector
+        mock_storage.url_template.side_effect = lambda url: url
+        mock_manager.suggest_alternative_selector.side_effect = RuntimeError('LLM caído')
+
+        with patch('chopperfix.chopper_decorators.heal_coordinator', coordinator):
+            with self.assertRaises(RuntimeError):
+                action(self.driver, 'click', xpath='//bad')
+
+        self.assertEqual(coordinator.stats()['leases'], 1)
+        self.assertFalse(coordinator.is_leased('click|//bad|http://example.com'))
+
+    def test_configure_recreates_the_snapshot_store_per_worker(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        inherited = SnapshotStore(os.path.join(tmp.name, 'archive'))
+        with patch.object(Config, 'SNAPSHOT_DIR', os.path.join(tmp.name, 'archive')), \
+                patch.object(chopper_decorators, 'pattern_storage', PatternStorage('sqlite:///:memory:')), \
+                patch.object(chopper_decorators, 'fallback_precomputer', None), \
+                patch.object(chopper_decorators, 'snapshot_store', inherited):
+            storage = chopper_decorators.configure(f"sqlite:///{os.path.join(tmp.name, 'patterns.db')}")
+            self.addCleanup(storage.close)
+            self.assertIsInstance(chopper_decorators.snapshot_store, SnapshotStore)
+            self.assertIsNot(chopper_decorators.snapshot_store, inherited)
+            chopper_decorators.snapshot_store.close()
+
 if __name__ == '__main__':
     unittest.main()
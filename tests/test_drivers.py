@@ -0,0 +1,195 @@
+import asyncio
+import os
+import unittest
+from unittest.mock import patch
+
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+from chopperfix import chopper_decorators
+from chopperfix.chopper_decorators import chopperdoc
+
+from chopperfix.drivers import (
+    PlaywrightAsyncAdapter,
+    PlaywrightSyncAdapter,
+    SeleniumAdapter,
+    get_driver_adapter,
+)
+from chopperfix.dom_tracking import serialize_tree, tracker_for
+from chopperfix.element_context import extract_element_context
+
+
+class FakePage:
+    def __init__(self):
+        self.url = 'http://example.com'
+        self._html = "<html><body><div id='a'><span>x</span></div><p>y</p></body></html>"
+
+    def content(self):
+        return self._html
+
+
+class FakeAsyncPage:
+    url = 'http://example.com/async'
+
+    async def content(self):
+        return '<html></html>'
+
+    async def evaluate(self, script, arg):
+        return {'element': '<div></div>', 'parent': '<body></body>', 'children': [], 'siblings': []}
+
+
+class FakeWebDriver:
+    current_url = 'http://example.com/selenium'
+    page_source = '<html></html>'
+
+    def __init__(self, result):
+        self.result = result
+        self.scripts = []
+
+    def execute_script(self, script, *args):
+        self.scripts.append((script, args))
+        return self.result
+
+
+class TrackedPage(FakePage):
+    """Simula el MutationObserver: `evaluate` devuelve los cambios encolados."""
+
+    def __init__(self):
+        super().__init__()
+        self.changes = []
+        self.content_calls = 0
+
+    def content(self):
+        self.content_calls += 1
+        return super().content()
+
+    def evaluate(self, script, arg):
+        return self.changes.pop(0)
+
+
+@chopperdoc
+def tracked_step(driver, action, **kwargs):
+    return 'ok'
+
+
+class Holder:
+    def __init__(self, **attrs):
+        self.__dict__.update(attrs)
+
+
+class DriverAdapterTest(unittest.TestCase):
+    def test_resolves_adapter_by_driver_shape(self):
+        self.assertIsInstance(get_driver_adapter(Holder(page=FakePage())), PlaywrightSyncAdapter)
+        self.assertIsInstance(get_driver_adapter(Holder(page=FakeAsyncPage())), PlaywrightAsyncAdapter)
+        self.assertIsInstance(get_driver_adapter(Holder(driver=FakeWebDriver(None))), SeleniumAdapter)
+        with self.assertRaises(TypeError):
+            get_driver_adapter(object())
+
+    def test_playwright_falls_back_to_snapshot_without_evaluate(self):
+        adapter = get_driver_adapter(Holder(page=FakePage()))
+        element, parent, children, siblings = adapter.element_context("//div[@id='a']")
+        self.assertIn('id="a"', element)
+        self.assertEqual(len(children), 1)
+        self.assertEqual(len(siblings), 1)
+        # CSS también se evalúa con lxml (selector traducido a XPath)
+        self.assertEqual(adapter.element_context('#a')[2], ['<span>x</span>\n'])
+
+    def test_selenium_uses_execute_script_for_context(self):
+        webdriver = FakeWebDriver({'element': '<a></a>', 'parent': '<p></p>', 'children': None, 'siblings': ['<b></b>']})
+        adapter = SeleniumAdapter(webdriver)
+        self.assertEqual(adapter.element_context("//a"), ('<a></a>', '<p></p>', [], ['<b></b>']))
+        script, args = webdriver.scripts[0]
+        self.assertTrue(script.startswith('return ('))
+        self.assertEqual(args[0]['selector'], '//a')
+        self.assertTrue(args[0]['isXpath'])
+
+    def test_selenium_exists_honours_timeout(self):
+        adapter = SeleniumAdapter(FakeWebDriver(False))
+        adapter.poll_interval = 0.01
+        self.assertFalse(adapter.exists('#missing', timeout=30))
+        self.assertTrue(SeleniumAdapter(FakeWebDriver(True)).exists('#here'))
+
+    def test_async_adapter(self):
+        adapter = PlaywrightAsyncAdapter(FakeAsyncPage())
+        url = asyncio.run(adapter.url())
+        context = asyncio.run(adapter.element_context('//div'))
+        self.assertEqual(url, 'http://example.com/async')
+        self.assertEqual(context[0], '<div></div>')
+
+
+class DomTrackingTest(unittest.TestCase):
+    def test_patches_only_changed_subtrees(self):
+        page = TrackedPage()
+        adapter = PlaywrightSyncAdapter(page)
+        page.changes = [
+            {'full': True},
+            {'full': False, 'changes': [
+                {'path': [0, 0], 'tags': ['body', 'div'], 'html': "<div id='a'><span>z</span><i>n</i></div>"},
+            ]},
+            {'full': False, 'changes': []},
+        ]
+
+        html, tree = adapter.tracked_snapshot()
+        self.assertEqual(html, page._html)
+        self.assertEqual(page.content_calls, 1)
+
+        html, tree = adapter.tracked_snapshot()
+        self.assertEqual(page.content_calls, 1)
+        # El árbol parcheado no se serializa hasta que alguien pide el HTML
+        self.assertIsNone(html)
+        self.assertEqual(tree.xpath("//div[@id='a']/span/text()"), ['z'])
+        self.assertIn('<i>n</i>', serialize_tree(tree))
+        self.assertEqual(tree.xpath('//p/text()'), ['y'])
+
+        same_html, same_tree = adapter.tracked_snapshot()
+        self.assertIsNone(same_html)
+        self.assertIs(same_tree, tree)
+        self.assertEqual(
+            {key: value for key, value in tracker_for(page).stats().items() if value},
+            {'full_snapshots': 1, 'incremental': 1, 'unchanged': 1, 'patched_subtrees': 1},
+        )
+
+    def test_resyncs_when_the_path_does_not_match(self):
+        page = TrackedPage()
+        adapter = PlaywrightSyncAdapter(page)
+        page.changes = [
+            {'full': True},
+            {'full': False, 'changes': [{'path': [0, 1], 'tags': ['body', 'div'], 'html': '<div></div>'}]},
+        ]
+        adapter.tracked_snapshot()
+        html, tree = adapter.tracked_snapshot()
+        self.assertEqual(page.content_calls, 2)
+        self.assertEqual(html, page._html)
+        self.assertEqual(tracker_for(page).stats()['resyncs'], 1)
+
+    @patch('chopperfix.chopper_decorators.Config.DOM_TRACKING', True)
+    @patch('chopperfix.chopper_decorators.pattern_storage')
+    @patch('chopperfix.chopper_decorators.adalFlow_Manger')
+    def test_successful_steps_do_not_serialize_the_patched_tree(self, mock_manager, mock_storage):
+        mock_manager.generate_description.return_value = 'desc'
+        page = TrackedPage()
+        page.changes = [
+            {'full': True},
+            {'full': False, 'changes': [
+                {'path': [0, 0], 'tags': ['body', 'div'], 'html': "<div id='a'><span>z</span></div>"},
+            ]},
+        ]
+        with patch.object(chopper_decorators, 'snapshot_store', None), \
+                patch.object(chopper_decorators, 'fallback_precomputer', None), \
+                patch.object(chopper_decorators, 'serialize_tree', wraps=serialize_tree) as serialize:
+            for _ in range(2):
+                self.assertEqual(tracked_step(Holder(page=page), 'click', xpath="//div[@id='a']"), 'ok')
+        self.assertEqual(page.content_calls, 1)
+        serialize.assert_not_called()
+        self.assertIn('<span>z</span>', mock_storage.save_pattern.call_args.kwargs['full_element_html'])
+
+    def test_context_extraction_reuses_the_tracked_tree(self):
+        page = TrackedPage()
+        page.changes = [{'full': True}]
+        html, tree = PlaywrightSyncAdapter(page).tracked_snapshot()
+        element, parent, children, siblings = extract_element_context(None, "//div[@id='a']", tree=tree)
+        self.assertIn('id="a"', element)
+        self.assertEqual(len(siblings), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,176 @@
+import unittest
+from unittest.mock import patch
+
+from lxml import etree
+
+from chopperfix.element_context import (
+    ElementContext,
+    css_to_xpath,
+    extract_contexts,
+    extract_element_context,
+)
+from chopperfix.selector_registry import CompiledSelector, SelectorRegistry
+from learning.pattern_storage import PatternStorage, agregar_comillas_xpath
+from llm_integration.selector_parsing import fix_xpath
+
+HTML = (
+    "<html><body><form id='login'>"
+    "<input name='user'><input name='pass' type='password'>"
+    "<button class='btn primary' type='submit'><span>Entrar</span></button>"
+    "</form></body></html>"
+)
+
+
+class ElementContextTest(unittest.TestCase):
+    def test_bulk_extraction_parses_once_and_mixes_xpath_and_css(self):
+        selectors = [
+            "//input[@name='user']",
+            'css=button.primary',
+            'input[type=password]',
+            "//div[@id='missing']",
+            'button[',
+        ]
+        with patch('chopperfix.element_context.etree.HTML', wraps=__import__('lxml.etree').etree.HTML) as parse:
+            contexts = extract_contexts(HTML, selectors)
+        parse.assert_called_once()
+
+        self.assertEqual(list(contexts), selectors)
+        self.assertIsNone(contexts["//div[@id='missing']"])
+        self.assertIsNone(contexts['button['])
+        button = contexts['css=button.primary']
+        self.assertIsInstance(button, ElementContext)
+        self.assertIn('Entrar', button.children[0])
+        self.assertEqual(contexts['input[type=password]'].element.get('name'), 'pass')
+        self.assertEqual(len(contexts["//input[@name='user']"].siblings), 2)
+
+    def test_serialization_is_lazy(self):
+        context = extract_contexts(HTML, ["//form"])["//form"]
+        self.assertNotIn('siblings', context.__dict__)
+        self.assertTrue(context.element_html.startswith('<form'))
+        self.assertNotIn('children', context.__dict__)
+
+    def test_single_selector_api_matches_bulk(self):
+        element, parent, children, siblings = extract_element_context(HTML, 'button.primary', is_xpath=False)
+        self.assertTrue(element.startswith('<button'))
+        self.assertTrue(parent.startswith('<form'))
+        self.assertEqual(len(children), 1)
+        self.assertEqual(siblings, [])
+        self.assertEqual(
+            extract_element_context(HTML, "//button", is_xpath=True),
+            extract_contexts(HTML, ["//button"])["//button"].as_tuple(),
+        )
+
+    def test_css_context_uses_the_same_bounds(self):
+        rows = ''.join(f"<li class='row'>{i}</li>" for i in range(300))
+        page = f"<html><body><ul><li class='first'>x</li>{rows}</ul></body></html>"
+        with patch('chopperfix.element_context.Config.CONTEXT_MAX_SIBLINGS', 10):
+            css = extract_element_context(page, 'li.first', is_xpath=False)
+            xpath = extract_element_context(page, "//li[@class='first']")
+        self.assertEqual(css, xpath)
+        self.assertEqual(len(css[3]), 11)
+        self.assertLess(css[1].count('<li'), 300)
+
+    def test_context_size_does_not_depend_on_list_length(self):
+        def table(rows):
+            body = ''.join(f"<tr class='row'><td>{i}</td><td><a href='/i/{i}'>Item {i}</a></td></tr>" for i in range(rows))
+            return f"<html><body><table><tbody id='rows'>{body}</tbody></table></body></html>"
+
+        sizes = []
+        for rows in (100, 5000):
+            context = extract_contexts(table(rows), ['//tr[50]', "//tbody[@id='rows']"])
+            row = context['//tr[50]']
+            element, parent, children, siblings = row.as_tuple()
+            self.assertEqual(len(siblings), 11)
+            self.assertIn(f'{rows - 60} more sibling elements omitted: tr x{rows - 60}; common classes: row',
+                          siblings[-1])
+            self.assertEqual(row.sibling_summary['count'], rows - 60)
+            self.assertIn('<td>49</td>', parent)
+            self.assertIn('47 more elements omitted', parent)
+            tbody = context["//tbody[@id='rows']"]
+            self.assertEqual(len(tbody.children), 21)
+            sizes.append((len(parent), sum(map(len, siblings)) - len(siblings[-1]), len(tbody.element_html) < 5000))
+        # Sólo cambian las cifras de los resúmenes
+        self.assertLess(abs(sizes[0][0] - sizes[1][0]), 10)
+        self.assertEqual(sizes[0][1], sizes[1][1])
+        self.assertTrue(sizes[1][2])
+
+    def test_caps_can_be_disabled(self):
+        rows = ''.join(f'<li>{i}</li>' for i in range(30))
+        context = ElementContext(etree.HTML(f'<ul>{rows}</ul>').find('.//li'), max_siblings=0, max_children=0, max_nodes=0)
+        self.assertEqual(len(context.siblings), 29)
+        self.assertEqual(context.parent_html.count('<li>'), 30)
+
+    def test_uncapped_children_skip_comments_and_instructions(self):
+        root = etree.HTML('<ul><!-- a --><li>0</li><?pi x?><li>1</li></ul>').find('.//ul')
+        for max_children in (0, 5):
+            context = ElementContext(root, max_children=max_children)
+            self.assertEqual([html.strip() for html in context.children], ['<li>0</li>', '<li>1</li>'])
+
+    def test_unbounded_siblings_keep_the_parent_window_bounded(self):
+        rows = ''.join(f"<li class='row'>{i}</li>" for i in range(300))
+        item = etree.HTML(f'<ul>{rows}</ul>').find('.//li[5]')
+        context = ElementContext(item, max_siblings=0, max_children=20, max_nodes=50)
+        # La ventana del padre no incluye todos los hermanos siguientes
+        self.assertEqual(context.parent_html.count('<li'), 1)
+        self.assertIn('4 more elements omitted', context.parent_html)
+        self.assertIn('295 more elements omitted', context.parent_html)
+        self.assertIsNone(context.sibling_summary)
+        self.assertEqual(len(context.siblings), 295)
+
+    def test_summaries_do_not_need_the_serialized_lists(self):
+        rows = ''.join(f"<li class='row'>{i}</li>" for i in range(30))
+        context = ElementContext(etree.HTML(f'<ul>{rows}</ul>').find('.//ul'), max_children=5)
+        self.assertEqual(context.child_summary['count'], 25)
+        self.assertNotIn('children', context.__dict__)
+        item = ElementContext(etree.HTML(f'<ul>{rows}</ul>').find('.//li'), max_siblings=10)
+        self.assertEqual(item.sibling_summary['count'], 19)
+        self.assertNotIn('siblings', item.__dict__)
+
+
+class SelectorRegistryTest(unittest.TestCase):
+    def test_compiles_once_and_reports_hits(self):
+        registry = SelectorRegistry(max_entries=2)
+        tree = etree.HTML("<html><body><a id='x' class='btn'>Ir</a></body></html>")
+
+        first = registry.get("//a[@id='x']")
+        self.assertIs(registry.get("//a[@id='x']"), first)
+        self.assertEqual(len(first.select(tree)), 1)
+        self.assertEqual(len(registry.get('css=a.btn').select(tree)), 1)
+        registry.get('#x')
+
+        stats = registry.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['evictions']), (1, 3, 1))
+        self.assertEqual(stats['entries'], 2)
+
+    def test_structured_form(self):
+        compiled = CompiledSelector("(//form[@id='login']//button[normalize-space()='Entrar' and @type='submit'])[2]")
+        self.assertEqual([step['tag'] for step in compiled.steps], ['form', 'button'])
+        self.assertEqual(compiled.steps[0]['attributes'], {'id': 'login'})
+        self.assertEqual(compiled.attributes, {'type': 'submit'})
+        self.assertEqual(compiled.steps[-1]['text'], 'Entrar')
+        self.assertEqual(compiled.steps[-1]['position'], 2)
+        self.assertEqual(compiled.literals, ['login', 'Entrar', 'submit'])
+        self.assertEqual(compiled.normalized, "(//form[@id=login]//button[normalize-space()=Entrarand@type=submit])[2]")
+
+        css = CompiledSelector("input[name='q']")
+        self.assertEqual(css.kind, 'css')
+        self.assertEqual(css.attributes, {'name': 'q'})
+        self.assertFalse(CompiledSelector('//a[').valid)
+
+    def test_normalization_quoting_and_css_share_the_registry(self):
+        registry = SelectorRegistry()
+        storage = PatternStorage('sqlite:///:memory:')
+        self.addCleanup(storage.close)
+        with patch('chopperfix.selector_registry.registry', registry):
+            self.assertEqual(storage.normalize_selector("//a[@id='x']"), '//a[@id=x]')
+            self.assertEqual(agregar_comillas_xpath("//a[@id=x]"), '//a[@id="x"]')
+            self.assertEqual(fix_xpath("//a[@id='x']"), '//a[@id="x"]')
+            self.assertIn('@id', css_to_xpath('a#x'))
+            self.assertIn('@id', css_to_xpath('a#x'))
+        stats = registry.stats()
+        # normalize_selector y fix_xpath comparten la entrada de "//a[@id='x']"
+        self.assertEqual((stats['entries'], stats['hits']), (3, 2))
+
+
+if __name__ == '__main__':
+    unittest.main()
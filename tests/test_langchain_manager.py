@@ -1,7 +1,10 @@
 import unittest
+from types import SimpleNamespace
 from unittest.mock import patch
 
+from chopperfix.selector_registry import SelectorRegistry
 from llm_integration.langchain_manager import LangChainManager
+from llm_integration.selector_parsing import StreamingSelectorParser
 
 
 class LangChainManagerTest(unittest.TestCase):
@@ -29,6 +32,55 @@ class LangChainManagerTest(unittest.TestCase):
         self.assertEqual(result, "//div[@id=best]")
         self.assertTrue(result)
 
+    @patch("llm_integration.langchain_manager.ChatOpenAI")
+    def test_suggest_alternative_selectors_in_batch(self, mock_chat):
+        mock_chat.return_value.predict.return_value = '```json\n{"1": "//a[@id=\'x\']", "2": null}\n```'
+        manager = LangChainManager()
+        result = manager.suggest_alternative_selectors(
+            "<a id='x'></a>",
+            [{"selector": "//a[@id='y']", "action": "click"}, {"selector": "//p", "action": "click"}],
+        )
+        self.assertEqual(result, {"//a[@id='y']": '//a[@id="x"]', "//p": None})
+        self.assertEqual(mock_chat.return_value.predict.call_count, 1)
+
+    @patch("llm_integration.langchain_manager.ChatOpenAI")
+    def test_streaming_stops_at_first_selector_matching_dom(self, mock_chat):
+        received = []
+
+        def stream(prompt):
+            try:
+                for token in ["```xpath\n", "//input[@id=", "'missing']\n", "//input[@id='q']", "\n```\n", "Explanation..."]:
+                    received.append(token)
+                    yield SimpleNamespace(content=token)
+            finally:
+                received.append("closed")
+
+        mock_chat.return_value.stream.side_effect = stream
+        manager = LangChainManager(streaming=True)
+        result = manager.suggest_alternative_selector("<input id='q'>", "//input[@id='x']", "type")
+
+        self.assertEqual(result, '//input[@id="q"]')
+        # El resto de la respuesta no se llega a leer
+        self.assertEqual(received[-2:], ["\n```\n", "closed"])
+        mock_chat.return_value.predict.assert_not_called()
+
+    def test_streamed_lines_do_not_fill_the_selector_registry(self):
+        registry = SelectorRegistry()
+        parser = StreamingSelectorParser(validate=lambda selector: selector.endswith("'q']"))
+        with patch("chopperfix.selector_registry.registry", registry):
+            parser.feed("//input[@id='a']\n//input[@id='b']\n//input[@id='q']\n")
+        self.assertEqual(parser.selector, "//input[@id='q']")
+        self.assertEqual(registry.stats()["entries"], 0)
+
+    def test_single_word_prose_is_not_a_fallback(self):
+        parser = StreamingSelectorParser(validate=lambda selector: False)
+        parser.feed("Selector\nButton\n")
+        self.assertIsNone(parser.finish())
+
+        parser = StreamingSelectorParser(validate=lambda selector: False)
+        parser.feed("Selector\nbutton.submit\n//button[@id='go']\n")
+        self.assertEqual(parser.finish(), "button.submit")
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,109 @@
+import json
+import os
+import unittest
+import urllib.error
+import urllib.request
+from unittest.mock import patch
+
+from llm_integration.backend import LLMBackend, create_llm_manager
+from llm_integration.langchain_manager import LangChainManager
+from llm_integration import standin
+from llm_integration.standin import heuristic_answer, start_standin_server
+
+HTML = "<html><body><input id='search-box' name='q'><button id='go'>Buscar</button></body></html>"
+
+
+class FakeBackend(LLMBackend):
+    def __init__(self, answer):
+        super().__init__(rate_limiter=None, streaming=False)
+        self.answer = answer
+        self.prompts = []
+
+    def _complete(self, prompt):
+        self.prompts.append(prompt)
+        return self.answer
+
+
+class LLMStandinTest(unittest.TestCase):
+    def setUp(self):
+        self.server = start_standin_server(seed=1)
+        self.addCleanup(self.server.stop)
+        env = patch.dict(os.environ, {'OPENAI_API_KEY': 'sk-standin'})
+        env.start()
+        self.addCleanup(env.stop)
+
+    def _post(self, body):
+        request = urllib.request.Request(
+            self.server.base_url + '/chat/completions',
+            data=json.dumps(body).encode('utf-8'),
+            headers={'Content-Type': 'application/json'},
+        )
+        with urllib.request.urlopen(request) as response:
+            return json.loads(response.read())
+
+    def test_langchain_manager_heals_through_standin(self):
+        manager = LangChainManager(base_url=self.server.base_url)
+        selector = manager.suggest_alternative_selector(
+            HTML, "//input[@id='search']", 'type', full_element_html="<input id='search-box' name='q'>"
+        )
+        self.assertEqual(selector, '//input[@id="search-box"]')
+
+        batch = manager.suggest_alternative_selectors(
+            HTML, [{'selector': "//button[@id='go-old']", 'action': 'click'}]
+        )
+        self.assertEqual(batch, {"//button[@id='go-old']": '//button[@id="go"]'})
+        self.assertEqual(self.server.llm.stats()['requests'], 2)
+
+    def test_streaming_response_is_cut_by_client(self):
+        manager = LangChainManager(base_url=self.server.base_url, streaming=True)
+        selector = manager.suggest_alternative_selector(
+            HTML, "//input[@id='search']", 'type', full_element_html="<input id='search-box' name='q'>"
+        )
+        self.assertEqual(selector, '//input[@id="search-box"]')
+        self.assertEqual(self.server.llm.stats()['streams'], 1)
+
+    def test_error_rate_returns_openai_style_429(self):
+        self.server.llm.error_rate = 1.0
+        with self.assertRaises(urllib.error.HTTPError) as raised:
+            self._post({'model': 'x', 'messages': [{'role': 'user', 'content': 'hola'}]})
+        self.assertEqual(raised.exception.code, 429)
+        self.assertEqual(json.loads(raised.exception.read())['error']['type'], 'rate_limit_error')
+
+    def test_batch_guesses_index_the_page_once(self):
+        rows = ''.join(f"<li class='row'><a id='item-{n}'>Item {n}</a></li>" for n in range(300))
+        page = f"<html><body><ul>{rows}</ul><button id='checkout-now'>Pay</button></body></html>"
+        prompt = f"```html\n{page}\n```\nBroken selectors:\n" + ''.join(
+            f"[{n}] action: click\n    failed selector: {selector}\n    last known element HTML: Not available\n"
+            for n, selector in enumerate(["//button[@id='checkout']", "//a[@id='item-42-old']"])
+        )
+        with patch.object(standin, 'generate_candidates', wraps=standin.generate_candidates) as generate:
+            answer = json.loads(heuristic_answer(prompt))
+        self.assertEqual(answer['0'], "//button[@id='checkout-now']")
+        self.assertEqual(len(standin.select_elements(standin.parse_html(page), answer['1'])), 1)
+        self.assertIn('42', answer['1'])
+        # Un elemento del árbol, una generación de candidatos, aunque el lote tenga dos selectores
+        self.assertEqual(generate.call_count, len(list(standin.parse_html(page).iter())))
+
+    def test_canned_answers(self):
+        self.server.llm.canned = {'Failed selector': '//a', '*': 'ok'}
+        response = self._post({'messages': [{'role': 'user', 'content': '- Failed selector: //b'}]})
+        self.assertEqual(response['choices'][0]['message']['content'], '//a')
+        response = self._post({'messages': [{'role': 'user', 'content': 'otra cosa'}]})
+        self.assertEqual(response['choices'][0]['message']['content'], 'ok')
+
+
+class LLMBackendTest(unittest.TestCase):
+    def test_shared_prompts_and_post_processing(self):
+        backend = FakeBackend("```xpath\n//input[@id='q']\n```")
+        self.assertEqual(backend.suggest_alternative_selector(HTML, '//old', 'type'), '//input[@id="q"]')
+        self.assertIn('- Failed selector: //old', backend.prompts[0])
+
+    def test_factory_selects_configured_backend(self):
+        with patch('llm_integration.langchain_manager.ChatOpenAI'):
+            self.assertIsInstance(create_llm_manager('langchain'), LangChainManager)
+        with self.assertRaises(ValueError):
+            create_llm_manager('desconocido')
+
+
+if __name__ == '__main__':
+    unittest.main()
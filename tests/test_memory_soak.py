@@ -0,0 +1,110 @@
+import contextlib
+import gc
+import os
+import tempfile
+import tracemalloc
+import unittest
+from unittest.mock import patch
+
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+from chopperfix.chopper_decorators import chopperdoc
+from chopperfix.selector_registry import SelectorRegistry
+from learning.pattern_storage import Pattern, PatternStorage
+
+FILLER = ''.join(f"<p class='row'>Fila {i} con texto de relleno</p>" for i in range(200))
+
+
+class FakePage:
+    def __init__(self):
+        self.item = 0
+
+    @property
+    def url(self):
+        # Cada producto en su propia página: todas forman la plantilla catalog/{slug}
+        return f'http://example.com/catalog/product-{self.item}'
+
+    def content(self):
+        return (
+            f"<html><body><section id='list'><div id='item-{self.item}'>Item</div>"
+            f"<div id='next'>Siguiente</div>{FILLER}</section></body></html>"
+        )
+
+
+class FakeDriver:
+    def __init__(self):
+        self.page = FakePage()
+
+
+class StubManager:
+    def generate_description(self, *args, **kwargs):
+        return 'desc'
+
+    def suggest_alternative_selector(self, *args, **kwargs):
+        return None
+
+    def analyze_context_from_text(self, *args, **kwargs):
+        return None
+
+
+@chopperdoc
+def click(driver, action, **kwargs):
+    if kwargs['xpath'].endswith("'broken']"):
+        raise Exception('fail')
+    return 'ok'
+
+
+class MemorySoakTest(unittest.TestCase):
+    """Miles de acciones decoradas no deben hacer crecer la memoria del proceso."""
+
+    WARMUP = 200
+    ACTIONS = 1500
+    MAX_GROWTH_BYTES = 256 * 1024
+
+    def setUp(self):
+        self.db_path = os.path.join(tempfile.mkdtemp(), 'soak.db')
+        self.storage = PatternStorage(f'sqlite:///{self.db_path}')
+        self.driver = FakeDriver()
+        # Registro de selectores pequeño para que se llene durante el calentamiento
+        self.registry = SelectorRegistry(max_entries=64)
+
+    def tearDown(self):
+        self.storage.close()
+
+    def _run(self, start, count):
+        for i in range(start, start + count):
+            self.driver.page.item = i
+            if i % 10 == 0:
+                with self.assertRaises(Exception):
+                    click(self.driver, 'click', xpath="//div[@id='broken']")
+            else:
+                # Un selector distinto en cada paso, como un crawler que recorre páginas nuevas
+                click(self.driver, 'click', xpath=f"//div[@id='item-{i}']")
+
+    def test_memory_stays_flat_over_thousands_of_actions(self):
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull), \
+                patch('chopperfix.chopper_decorators.pattern_storage', self.storage), \
+                patch('chopperfix.chopper_decorators.adalFlow_Manger', StubManager()), \
+                patch('learning.pattern_storage.create_llm_manager', StubManager), \
+                patch('chopperfix.selector_registry.registry', self.registry):
+            self._run(0, self.WARMUP)
+            gc.collect()
+            tracemalloc.start()
+            try:
+                baseline = tracemalloc.take_snapshot()
+                self._run(self.WARMUP, self.ACTIONS)
+                gc.collect()
+                current = tracemalloc.take_snapshot()
+            finally:
+                tracemalloc.stop()
+
+        growth = sum(stat.size_diff for stat in current.compare_to(baseline, 'filename'))
+        top = current.compare_to(baseline, 'lineno')[:5]
+        self.assertLess(growth, self.MAX_GROWTH_BYTES, '\n'.join(str(stat) for stat in top))
+        self.assertGreater(self.registry.stats()['evictions'], 0)
+        # Todos los patrones siguen en la base de datos, no en memoria
+        self.assertGreater(self.storage.session.query(Pattern).count(), self.ACTIONS)
+
+
+if __name__ == '__main__':
+    unittest.main()
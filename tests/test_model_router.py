@@ -0,0 +1,79 @@
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock
+
+from llm_integration.model_router import CHEAP, STRONG, LLMBudget, ModelRouter
+from llm_integration.rate_limiter import estimate_tokens
+
+HTML = "<html><body><button id='buy'>Comprar</button><button>Otro</button></body></html>"
+
+
+class ModelRouterTest(unittest.TestCase):
+    def setUp(self):
+        self.cheap = MagicMock()
+        self.strong = MagicMock()
+        self.router = ModelRouter(self.cheap, self.strong)
+
+    def test_cheap_tasks_never_reach_strong_tier(self):
+        self.cheap.generate_description.return_value = 'desc'
+        self.cheap.analyze_context_from_text.return_value = None
+        self.assertEqual(self.router.generate_description('click', '//a', 'http://x', HTML), 'desc')
+        self.router.analyze_context_from_text('[]', '//a', 'click')
+        self.strong.generate_description.assert_not_called()
+        self.strong.analyze_context_from_text.assert_not_called()
+
+    def test_escalates_only_when_cheap_answer_fails_dom_validation(self):
+        self.cheap.suggest_alternative_selector.return_value = "//button[@id='buy']"
+        self.assertEqual(self.router.suggest_alternative_selector(HTML, '//old', 'click'), "//button[@id='buy']")
+        self.strong.suggest_alternative_selector.assert_not_called()
+
+        # Coincide con dos botones: se escala
+        self.cheap.suggest_alternative_selector.return_value = '//button'
+        self.strong.suggest_alternative_selector.return_value = "//button[text()='Otro']"
+        self.assertEqual(self.router.suggest_alternative_selector(HTML, '//old2', 'click'), "//button[text()='Otro']")
+
+        self.assertEqual([heal['resolved_by'] for heal in self.router.heals], [CHEAP, STRONG])
+        stats = self.router.stats()
+        self.assertEqual(stats['heals_resolved_by'], {CHEAP: 1, STRONG: 1})
+        self.assertEqual(stats['calls'], {CHEAP: 2, STRONG: 1})
+
+    def test_batch_escalates_only_unvalidated_selectors(self):
+        failures = [{'selector': '//a', 'action': 'click'}, {'selector': '//b', 'action': 'click'}]
+        self.cheap.suggest_alternative_selectors.return_value = {'//a': "//button[@id='buy']", '//b': '//nope'}
+        self.strong.suggest_alternative_selectors.return_value = {'//b': "//button[text()='Otro']"}
+        result = self.router.suggest_alternative_selectors(HTML, failures)
+        self.assertEqual(result, {'//a': "//button[@id='buy']", '//b': "//button[text()='Otro']"})
+        self.assertEqual(self.strong.suggest_alternative_selectors.call_args.args[1], [failures[1]])
+
+    def test_token_budget_stops_further_calls(self):
+        router = ModelRouter(self.cheap, self.strong, budget=LLMBudget(max_tokens=10))
+        self.assertIsNone(router.suggest_alternative_selector(HTML * 10, '//old', 'click'))
+        self.cheap.suggest_alternative_selector.assert_not_called()
+        self.assertEqual(router.stats()['budget_rejections'], 2)
+
+    def test_budget_is_not_overspent_by_concurrent_threads(self):
+        def slow_description(*args, **kwargs):
+            time.sleep(0.05)
+            return 'desc'
+
+        self.cheap.generate_description.side_effect = slow_description
+        per_call = estimate_tokens('click', '//a', 'http://x')
+        router = ModelRouter(self.cheap, self.strong, budget=LLMBudget(max_tokens=per_call * 3))
+        threads = [
+            threading.Thread(target=router.generate_description, args=('click', '//a', 'http://x', HTML))
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        stats = router.stats()
+        self.assertEqual(stats['calls'][CHEAP], 3)
+        self.assertEqual(stats['budget_rejections'], 5)
+        self.assertLessEqual(stats['budget']['tokens'], per_call * 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import os
+import tempfile
+import unittest
+
+from learning.pattern_cache import CachedPattern, PatternCache
+from learning.pattern_storage import Pattern, PatternStorage
+
+URL = 'https://example.com/form'
+
+
+class PatternCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_url = f"sqlite:///{os.path.join(self.tmp.name, 'patterns.db')}"
+        self.storage = PatternStorage(self.db_url)
+        self.storage.save_pattern('click', "//a[@id='x']", URL, 'd')
+        self.storage.save_pattern('click', "//a[@id='old']", URL, 'd', success=False,
+                                  replacement_selector="//a[@id='new']")
+
+    def tearDown(self):
+        self.storage.close()
+        self.tmp.cleanup()
+
+    def test_preloads_url_and_serves_from_memory(self):
+        cache = PatternCache(self.storage)
+        self.assertEqual(cache.get('click', "//a[@id='x']", URL).usage_count, 1)
+        self.assertIsNone(cache.get('click', '//missing', URL))
+        self.assertEqual(cache.get_stored_replacement('click', "//a[@id='old']", URL), "//a[@id='new']")
+        self.assertEqual(cache.stats()['hits'], 2)
+        self.assertEqual(len(cache._loaded_urls), 1)
+        self.assertFalse(hasattr(CachedPattern('a', 's', 'u'), '__dict__'))
+
+    def test_write_through_keeps_cache_valid(self):
+        cache = PatternCache(self.storage)
+        cache.save_pattern('click', "//a[@id='x']", URL, 'd', success=False)
+        entry = cache.get('click', "//a[@id='x']", URL)
+        self.assertEqual((entry.usage_count, entry.success_rate), (2, 0.5))
+        self.assertEqual(cache.invalidations, 0)
+        stored = self.storage.session.query(Pattern).filter_by(selector='//a[@id=x]').one()
+        self.assertEqual(stored.usage_count, 2)
+
+    def test_write_behind_batches_and_lru_eviction(self):
+        cache = PatternCache(self.storage, write_behind=True, batch_size=3, max_entries=3)
+        for i in range(2):
+            cache.save_pattern('click', f"//b[@id='{i}']", URL, 'd')
+        self.assertEqual(self.storage.session.query(Pattern).count(), 2)
+        cache.save_pattern('click', "//b[@id='2']", URL, 'd')
+        self.assertEqual(self.storage.session.query(Pattern).count(), 5)
+        self.assertEqual(cache.stats()['entries'], 3)
+        self.assertNotIn(self.storage.normalize_url(URL), cache._loaded_urls)
+
+    def test_invalidated_by_other_process_writes(self):
+        cache = PatternCache(self.storage, check_interval=0)
+        cache.get('click', "//a[@id='x']", URL)
+        other = PatternStorage(self.db_url)
+        # Un éxito más sólo cambia contadores: no invalida la caché
+        other.save_pattern('click', "//a[@id='x']", URL, 'd')
+        self.assertEqual(cache.get('click', "//a[@id='x']", URL).usage_count, 1)
+        self.assertEqual(cache.invalidations, 0)
+        other.save_pattern('click', "//a[@id='x']", URL, 'd', success=False, replacement_selector="//a[@id='y']")
+        other.close()
+        self.assertEqual(cache.get_stored_replacement('click', "//a[@id='x']", URL), "//a[@id='y']")
+        self.assertEqual(cache.get('click', "//a[@id='x']", URL).usage_count, 3)
+        self.assertEqual(cache.invalidations, 1)
+
+    def test_counter_only_writes_do_not_bump_the_store_version(self):
+        version = self.storage.get_version()
+        self.storage.save_pattern('click', "//a[@id='x']", URL, 'd')
+        self.assertEqual(self.storage.get_version(), version)
+        self.storage.save_pattern('click', "//a[@id='x']", URL, 'd', success=False)
+        self.storage.save_pattern('click', "//a[@id='new']", URL, 'd')
+        self.assertEqual(self.storage.get_version(), version + 2)
+
+    def test_write_through_does_not_preload_on_writes(self):
+        cache = PatternCache(self.storage)
+        cache.save_pattern('click', "//a[@id='x']", URL, 'd')
+        self.assertEqual(cache.stats()['urls'], 0)
+        self.assertEqual(cache.get('click', "//a[@id='x']", URL).usage_count, 2)
+
+    def test_preload_after_eviction_keeps_pending_writes(self):
+        cache = PatternCache(self.storage, write_behind=True, batch_size=100, max_entries=3)
+        for _ in range(3):
+            cache.save_pattern('click', "//a[@id='x']", URL, 'd')
+        for i in range(3):
+            cache.save_pattern('click', f"//b[@id='{i}']", URL, 'd')
+        # '//a[@id=x]' se desalojó antes de escribirse: la base de datos aún dice 1
+        self.assertNotIn(('click', '//a[@id=x]', 'example.com/form'), cache._entries)
+        self.assertEqual(cache.stats()['pending_writes'], 6)
+        self.assertEqual(cache.get('click', "//a[@id='x']", URL).usage_count, 4)
+        self.assertEqual(cache.get('click', "//b[@id='1']", URL).usage_count, 1)
+
+    def test_write_behind_flushes_replacements_immediately(self):
+        cache = PatternCache(self.storage, write_behind=True, batch_size=100)
+        cache.save_pattern('click', "//a[@id='x']", URL, 'd')
+        self.assertEqual(cache.stats()['pending_writes'], 1)
+        cache.save_pattern('click', "//a[@id='gone']", URL, 'd', success=False, replacement_selector="//a[@id='x']")
+        self.assertEqual(cache.stats()['pending_writes'], 0)
+        # Otro worker ve el reemplazo sin esperar al lote
+        other = PatternStorage(self.db_url)
+        self.addCleanup(other.close)
+        self.assertEqual(other.get_stored_replacement('click', "//a[@id='gone']", URL), "//a[@id='x']")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,9 @@
+import os
+import tempfile
 import unittest
+from datetime import datetime, timedelta
+from unittest.mock import MagicMock
+from learning import scoring
 from learning.pattern_storage import PatternStorage, Pattern
 
 class PatternStorageTest(unittest.TestCase):
@@ -46,5 +51,139 @@ class PatternStorageTest(unittest.TestCase):
         self.assertTrue(updated.failed)
         self.assertEqual(updated.replacement_selector, "//div[@id='b']")
 
+    def test_heal_url_resolves_all_broken_selectors_in_one_request(self):
+        url = 'http://example.com/form'
+        self.storage.save_pattern('type', "//input[@id='old-name']", url, 'd',
+                                  full_element_html='<input id="old-name" name="name">')
+        self.storage.save_pattern('click', "//button[@id='go']", url, 'd')
+        self.storage.save_pattern('click', "//div[@id='ok']", url, 'd')
+        html = ("<html><body><input id='name-v2' name='name'>"
+                "<button id='submit'>Go</button><div id='ok'></div></body></html>")
+        manager = MagicMock()
+        manager.suggest_alternative_selectors.return_value = {'//button[@id=go]': "//button[@id='submit']"}
+
+        healed = self.storage.heal_url(url, html, manager)
+
+        self.assertEqual(healed, {
+            '//input[@id=old-name]': "//input[@name='name']",
+            '//button[@id=go]': "//button[@id='submit']",
+        })
+        manager.suggest_alternative_selectors.assert_called_once()
+        self.assertEqual(len(manager.suggest_alternative_selectors.call_args.args[1]), 1)
+        self.assertEqual(self.storage.get_stored_replacement('click', "//button[@id='go']", url),
+                         "//button[@id='submit']")
+
+    def test_heal_url_keeps_working_selectors_with_quotes_and_spaces(self):
+        url = 'http://example.com/login'
+        self.storage.save_pattern('click', "//a[text()='Sign in']", url, 'd')
+        self.storage.save_pattern('click', "//a[@class='nav link']", url, 'd')
+        html = "<html><body><a class='nav link'>Sign in</a></body></html>"
+        manager = MagicMock()
+
+        self.assertEqual(self.storage.heal_url(url, html, manager, dry_run=True), {})
+        self.assertEqual(self.storage.heal_url(url, html, manager), {})
+        manager.suggest_alternative_selectors.assert_not_called()
+        self.assertEqual(
+            [p.failed for p in self.storage.session.query(Pattern).filter(Pattern.url == 'example.com/login')],
+            [False, False],
+        )
+
+    def test_fuzzy_search_uses_trigram_index(self):
+        self.assertEqual(self.storage.selector_index.backend, 'fts5')
+        url = 'http://example.com'
+        self.storage.save_pattern('click', "//button[@id='submit-order']", url, 'd')
+        self.storage.save_pattern('click', "//button[@id='cancel-order']", url, 'd')
+        self.storage.save_pattern('click', "//a[@id='home']", url, 'd')
+        self.storage.save_pattern('click', "//div[@id='gone']", url, 'd', success=False)
+        self.storage.bulk_update_replacements([{'id': 3, 'replacement_selector': "//a[@id='submit-link']"}])
+
+        # Casi coincidencia: el selector roto tiene una errata
+        results = self.storage.search_patterns("//button[@id='submit-ordr']", url)
+        self.assertEqual(results[0][0].selector, '//button[@id=submit-order]')
+        self.assertGreater(results[0][1], results[1][1])
+
+        # Subcadena sobre el reemplazo actualizado; los patrones fallidos se excluyen
+        self.assertEqual([p.id for p, _ in self.storage.search_patterns('submit-link', url)], [])
+        self.assertEqual([p.id for p, _ in self.storage.search_patterns('submit-link', url, include_failed=True)], [3])
+        self.assertEqual(self.storage.search_patterns("//div[@id='gone']", url), [])
+
+        self.assertEqual(self.storage.get_patterns("//button[@id='submit-ordr']", url), '//button[@id=submit-order]')
+
+    def test_search_preselects_candidates_within_the_url(self):
+        # Muchos patrones casi idénticos en otras URLs no deben ocupar la preselección
+        self.storage.save_patterns([
+            dict(action='click', selector="//button[@id='submit']", url=f'http://site.com/other-{i}/page-{i}',
+                 description='d')
+            for i in range(400)
+        ])
+        self.storage.save_pattern('click', "//button[@id='submit']", 'http://site.com/target', 'd')
+
+        results = self.storage.search_patterns("//button[@id='submit']", 'site.com/target')
+        self.assertEqual([pattern.url for pattern, _ in results], ['site.com/target'])
+
+    def test_decayed_score_prefers_recent_evidence(self):
+        url = 'http://example.com'
+        for _ in range(20):
+            self.storage.save_pattern('click', "//button[@id='old']", url, 'd')
+        self.storage.save_pattern('click', "//button[@id='new']", url, 'd')
+        old = self.storage.session.query(Pattern).filter_by(selector='//button[@id=old]').one()
+        self.assertAlmostEqual(old.decayed_score, 20.5 / 21)
+
+        # La evidencia antigua pierde peso: tras un año el selector nuevo queda delante
+        old.score_updated_at = datetime.utcnow() - timedelta(days=365)
+        self.storage.session.commit()
+        self.assertEqual(self.storage.recompute_scores(url), 2)
+        self.storage.session.expire_all()
+        self.assertAlmostEqual(old.decayed_score, scoring.PRIOR, places=3)
+        results = self.storage.search_patterns('//button', url)
+        self.assertEqual(results[0][0].selector, '//button[@id=new]')
+
+        # Una escritura incremental coincide con el recálculo vectorizado
+        self.storage.save_pattern('click', "//button[@id='old']", url, 'd', success=False)
+        old = self.storage.session.query(Pattern).filter_by(selector='//button[@id=old]').one()
+        self.assertAlmostEqual(old.decayed_attempts, 1.0, places=3)
+        self.assertAlmostEqual(
+            float(scoring.bulk_scores([old.decayed_successes], [old.decayed_attempts], [0])[0]),
+            old.decayed_score,
+        )
+
+    def test_ranking_decays_scores_without_a_recompute(self):
+        url = 'http://example.com'
+        for _ in range(20):
+            self.storage.save_pattern('click', "//button[@id='old']", url, 'd')
+        self.storage.save_pattern('click', "//button[@id='new']", url, 'd')
+        old = self.storage.session.query(Pattern).filter_by(selector='//button[@id=old]').one()
+        old.score_updated_at = datetime.utcnow() - timedelta(days=365)
+        self.storage.session.commit()
+
+        # Sin recálculo programado, la puntuación guardada sigue siendo la de hace un año
+        self.assertAlmostEqual(old.decayed_score, 20.5 / 21)
+        self.assertEqual(self.storage.search_patterns('//button', url)[0][0].selector, '//button[@id=new]')
+        self.assertEqual(self.storage.get_active_patterns(url)[0].selector, '//button[@id=new]')
+
+    def test_export_import_merges_counts_and_replacements(self):
+        url = 'http://example.com'
+        remote = PatternStorage('sqlite:///:memory:')
+        self.addCleanup(remote.close)
+        for success in (True, True, False):
+            remote.save_pattern('click', "//button[@id='buy']", url, 'd', success=success,
+                                replacement_selector="//button[@data-test='buy']" if not success else None)
+        remote.save_pattern('click', "//a[@id='remote-only']", url, 'd')
+        self.storage.save_pattern('click', "//button[@id='buy']", url, 'd', success=False,
+                                  replacement_selector="//button[@class='weak']")
+
+        path = os.path.join(tempfile.mkdtemp(), 'patterns.jsonl.gz')
+        self.assertEqual(remote.export_patterns(path, chunk_size=1), 2)
+        self.assertEqual(self.storage.import_patterns(path, chunk_size=1), {'inserted': 1, 'merged': 1})
+
+        merged = self.storage.session.query(Pattern).filter_by(selector='//button[@id=buy]').one()
+        self.assertEqual(merged.usage_count, 4)
+        self.assertAlmostEqual(merged.success_rate, 0.5)
+        self.assertAlmostEqual(merged.peso, 1.0)
+        self.assertAlmostEqual(merged.decayed_attempts, 4.0, places=3)
+        # El reemplazo del nodo con mejor puntuación sustituye al local
+        self.assertEqual(merged.replacement_selector, "//button[@data-test='buy']")
+        self.assertEqual(self.storage.get_active_patterns(url)[0].selector, '//a[@id=remote-only]')
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,78 @@
+import os
+import tempfile
+import threading
+import unittest
+from types import SimpleNamespace
+
+from llm_integration.rate_limiter import RateLimiter, shared_rate_limiter
+
+
+class RateLimitError(Exception):
+    pass
+
+
+class RateLimiterTest(unittest.TestCase):
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), 'bucket.db')
+
+    def test_quota_is_shared_between_instances_and_threads(self):
+        # Dos instancias sobre el mismo fichero equivalen a dos procesos
+        first = RateLimiter(self.path, requests_per_minute=120)
+        second = RateLimiter(self.path, requests_per_minute=120)
+        threads = [threading.Thread(target=lambda: [first.acquire() for _ in range(30)]) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for _ in range(60):
+            second.acquire()
+        self.assertLess(first.stats()['queue_wait_max_seconds'], 0.2)
+
+        # El cubo compartido está vacío: la siguiente petición espera ~0.5 s
+        second.acquire()
+        self.assertGreater(second.stats()['queue_wait_max_seconds'], 0.3)
+        self.assertEqual(first.stats()['acquired'] + second.stats()['acquired'], 121)
+
+    def test_token_bucket_limits_large_requests(self):
+        limiter = RateLimiter(self.path, tokens_per_minute=600)
+        limiter.acquire(tokens=590)
+        self.assertGreater(limiter.acquire(tokens=20), 0.5)
+
+    def test_retries_retryable_errors_with_backoff(self):
+        limiter = RateLimiter(self.path, requests_per_minute=1000, backoff_base=0.001)
+        attempts = []
+
+        def flaky():
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise RateLimitError('429 Too Many Requests')
+            return 'ok'
+
+        self.assertEqual(limiter.call(flaky), 'ok')
+        self.assertEqual(limiter.stats()['retries'], 2)
+
+        with self.assertRaises(ValueError):
+            limiter.call(lambda: (_ for _ in ()).throw(ValueError('bad prompt')))
+        self.assertEqual(limiter.stats()['failures'], 1)
+
+    def test_retries_without_quotas(self):
+        config = SimpleNamespace(RATE_LIMIT_DB=self.path, RATE_LIMIT_RPM=0, RATE_LIMIT_TPM=0, LLM_MAX_RETRIES=3)
+        limiter = shared_rate_limiter(config)
+        self.assertIs(shared_rate_limiter(config), limiter)
+        limiter.backoff_base = 0.001
+        attempts = []
+
+        def flaky():
+            attempts.append(1)
+            if len(attempts) < 2:
+                raise RateLimitError('429 Too Many Requests')
+            return 'ok'
+
+        self.assertEqual(limiter.call(flaky), 'ok')
+        self.assertEqual(limiter.stats()['retries'], 1)
+        # Sin cuotas no hay cubo que compartir
+        self.assertFalse(os.path.exists(self.path))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+from chopperfix.chopper_decorators import chopperdoc
+from chopperfix.cli import main
+from chopperfix.replay import Recorder, ReplayPlan, compile_plan
+from learning.pattern_storage import PatternStorage
+
+
+class FakePage:
+    def __init__(self, broken=()):
+        self.url = 'http://shop.com/cart'
+        self.broken = set(broken)
+        self.snapshots = 0
+        self.clicks = []
+        self.attempts = []
+
+    def content(self):
+        self.snapshots += 1
+        return "<html><body><button id='pay'>Pay</button><button id='pay-now'>Pay</button></body></html>"
+
+
+class FakeDriver:
+    def __init__(self, page):
+        self.page = page
+
+
+@chopperdoc
+def step(driver, action, **kwargs):
+    driver.page.attempts.append(kwargs.get('xpath'))
+    if kwargs.get('xpath') in driver.page.broken:
+        raise Exception('no such element')
+    driver.page.clicks.append(kwargs.get('xpath'))
+    return 'ok'
+
+
+def checkout_flow(driver):
+    step(driver, 'click', xpath="//button[@id='pay']")
+    step(driver, 'click', xpath="//button[@id='pay-now']")
+
+
+class ReplayTest(unittest.TestCase):
+    def setUp(self):
+        self.storage = PatternStorage('sqlite:///:memory:')
+        self.addCleanup(self.storage.close)
+
+    def _record(self, mock_storage, mock_manager):
+        mock_storage.get_fallback_selectors.return_value = []
+        mock_storage.get_stored_replacement.return_value = None
+        mock_manager.generate_description.return_value = 'desc'
+        page = FakePage()
+        with Recorder() as recording:
+            checkout_flow(FakeDriver(page))
+        self.assertEqual(page.snapshots, 2)
+        return recording
+
+    @patch('chopperfix.chopper_decorators.pattern_storage')
+    @patch('chopperfix.chopper_decorators.adalFlow_Manger')
+    def test_compiled_plan_uses_stored_replacements_without_snapshots(self, mock_manager, mock_storage):
+        recording = self._record(mock_storage, mock_manager)
+        self.assertEqual([s.selector for s in recording.steps], ["//button[@id='pay']", "//button[@id='pay-now']"])
+        self.storage.save_pattern('click', "//button[@id='pay']", 'http://shop.com/cart', 'desc',
+                                  success=False, replacement_selector="//button[text()='Pay']")
+
+        plan = compile_plan(recording, self.storage)
+
+        self.assertEqual([s.source for s in plan.steps], ['replacement', 'recorded'])
+        page = FakePage()
+        stats = plan.run(FakeDriver(page))
+        self.assertEqual((stats['fast'], stats['fallbacks']), (2, 0))
+        self.assertEqual(page.snapshots, 0)
+        self.assertEqual(page.clicks, ["//button[text()='Pay']", "//button[@id='pay-now']"])
+        self.assertFalse(mock_manager.suggest_alternative_selector.called)
+
+    @patch('chopperfix.chopper_decorators.pattern_storage')
+    @patch('chopperfix.chopper_decorators.adalFlow_Manger')
+    def test_failed_step_falls_back_to_chopperdoc_and_updates_the_plan(self, mock_manager, mock_storage):
+        plan = compile_plan(self._record(mock_storage, mock_manager), self.storage)
+        mock_storage.get_replacement_selector.return_value = "//button[text()='Pay']"
+        page = FakePage(broken={"//button[@id='pay']"})
+        # Tras la reparación de chopperdoc, el reemplazo queda guardado
+        mock_storage.get_stored_replacement.side_effect = (
+            lambda action, selector, url: "//button[text()='Pay']" if selector == "//button[@id='pay']" else None
+        )
+
+        stats = plan.run(FakeDriver(page))
+
+        self.assertEqual((stats['fast'], stats['fallbacks'], stats['healed']), (1, 1, 1))
+        self.assertEqual(page.snapshots, 1)
+        self.assertTrue(plan.dirty)
+        self.assertEqual(plan.steps[0].resolved, "//button[text()='Pay']")
+        self.assertEqual(page.clicks, ["//button[text()='Pay']", "//button[@id='pay-now']"])
+
+    @patch('chopperfix.chopper_decorators.pattern_storage')
+    @patch('chopperfix.chopper_decorators.adalFlow_Manger')
+    def test_fallback_does_not_rerun_the_failed_selector(self, mock_manager, mock_storage):
+        plan = compile_plan(self._record(mock_storage, mock_manager), self.storage)
+        mock_storage.get_replacement_selector.return_value = "//button[text()='Pay']"
+        page = FakePage(broken={"//button[@id='pay']"})
+
+        stats = plan.run(FakeDriver(page))
+
+        self.assertEqual(stats['fallbacks'], 1)
+        # Un único intento con el selector roto: el de la vía rápida
+        self.assertEqual(page.attempts.count("//button[@id='pay']"), 1)
+        self.assertEqual(page.clicks, ["//button[text()='Pay']", "//button[@id='pay-now']"])
+
+    @patch('chopperfix.chopper_decorators.pattern_storage')
+    @patch('chopperfix.chopper_decorators.adalFlow_Manger')
+    def test_saved_plan_is_recompiled_from_the_cli(self, mock_manager, mock_storage):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        db_url = f"sqlite:///{os.path.join(tmp.name, 'patterns.db')}"
+        path = os.path.join(tmp.name, 'checkout.plan.json')
+        storage = PatternStorage(db_url)
+        plan = compile_plan(self._record(mock_storage, mock_manager), storage)
+        plan.save(path)
+        self.assertFalse(plan.is_stale(storage))
+        storage.save_pattern('click', "//button[@id='pay-now']", 'http://shop.com/cart', 'desc',
+                             success=False, replacement_selector="//button[2]")
+        self.assertTrue(plan.is_stale(storage))
+        storage.close()
+
+        self.assertEqual(main(['compile', path, '--db', db_url]), 0)
+
+        loaded = ReplayPlan.load(path)
+        self.assertEqual(loaded.steps[0].function, 'tests.test_replay:step')
+        self.assertEqual([s.resolved for s in loaded.steps], ["//button[@id='pay']", '//button[2]'])
+        page = FakePage()
+        self.assertEqual(loaded.run(FakeDriver(page))['fast'], 2)
+        self.assertEqual(page.clicks, ["//button[@id='pay']", '//button[2]'])
+
+
+if __name__ == '__main__':
+    unittest.main()
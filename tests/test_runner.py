@@ -0,0 +1,170 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+from chopperfix.chopper_decorators import chopperdoc
+from chopperfix.runner import Flow, FlowDriver, FlowRunner, locality_key, schedule
+from self_healing.coordination import HealCoordinator
+
+
+class FakePage:
+    def __init__(self):
+        self.url = 'about:blank'
+        self._html = "<html><body><button id='go'>Go</button></body></html>"
+
+    def content(self):
+        return self._html
+
+
+class FakePool:
+    """Pool sin navegador: cada flujo recibe una página nueva."""
+
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+
+    def acquire(self):
+        return FlowDriver(FakePage())
+
+    def release(self, driver):
+        pass
+
+    def close(self):
+        pass
+
+
+@chopperdoc
+def step(driver, action, **kwargs):
+    if kwargs.get('xpath') == '//broken':
+        raise Exception('fail')
+    return 'ok'
+
+
+def login_flow(driver, url, broken=False):
+    driver.page.url = url
+    step(driver, 'click', xpath='//broken' if broken else "//button[@id='go']")
+    step(driver, 'click', xpath="//button[@id='go']")
+
+
+def failing_flow(driver, url):
+    raise RuntimeError('boom')
+
+
+class ScheduleTest(unittest.TestCase):
+    def test_locality_key(self):
+        self.assertEqual(locality_key('https://www.example.com/shop/item/1'), 'example.com/shop')
+        self.assertEqual(locality_key('http://example.com'), 'example.com')
+
+    def test_flows_of_the_same_section_share_a_worker(self):
+        urls = [
+            'http://a.com/shop/2', 'http://b.com/blog/1', 'http://a.com/shop/1',
+            'http://a.com/cart/1', 'http://b.com/blog/2', 'http://a.com/shop/3',
+        ]
+        flows = [Flow(str(i), url, login_flow) for i, url in enumerate(urls)]
+
+        buckets = schedule(flows, 2)
+
+        self.assertEqual(sorted(len(bucket) for bucket in buckets), [3, 3])
+        for bucket in buckets:
+            keys = [locality_key(flows[index].url) for index in bucket]
+            # Cada sección va entera a un worker y sus flujos quedan seguidos
+            for key in set(keys):
+                self.assertEqual(sum(k == key for k in keys), sum(
+                    locality_key(flow.url) == key for flow in flows))
+        self.assertIn([2, 0, 5], buckets)
+
+
+class HealCoordinatorTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, 'heals.db')
+
+    def test_followers_reuse_the_leader_replacement(self):
+        leader = HealCoordinator(self.path)
+        follower = HealCoordinator(self.path, poll_interval=0.01)
+        self.assertTrue(leader.acquire('click|//a|x'))
+
+        stored = {}
+        result = {}
+
+        def follow():
+            # Otro hilo: la reserva es del líder, así que espera su reemplazo
+            result['acquired'] = follower.acquire('click|//a|x')
+            result['value'] = follower.wait_for('click|//a|x', lambda: stored.get('value'))
+
+        waiter = threading.Thread(target=follow)
+        waiter.start()
+        time.sleep(0.05)
+        stored['value'] = '//b'
+        leader.release('click|//a|x')
+        waiter.join(5)
+
+        self.assertFalse(result['acquired'])
+        self.assertEqual(result['value'], '//b')
+        self.assertEqual(follower.stats()['reused'], 1)
+        self.assertFalse(leader.is_leased('click|//a|x'))
+
+    def test_expired_lease_is_taken_over(self):
+        leader = HealCoordinator(self.path, lease_seconds=0.01)
+        follower = HealCoordinator(self.path)
+        leader.acquire('k')
+        time.sleep(0.02)
+        self.assertTrue(follower.acquire('k'))
+
+
+class FlowRunnerTest(unittest.TestCase):
+    @patch('chopperfix.chopper_decorators.pattern_storage')
+    @patch('chopperfix.chopper_decorators.adalFlow_Manger')
+    def test_in_process_run_reports_throughput_and_heals(self, mock_manager, mock_storage):
+        mock_storage.get_fallback_selectors.return_value = []
+        mock_storage.get_replacement_selector.return_value = "//button[@id='go']"
+        mock_storage.get_stored_replacement.return_value = None
+        mock_storage.normalize_selector.side_effect = lambda selector: selector
+        mock_storage.url_template.side_effect = lambda url: url
+        mock_manager.generate_description.return_value = 'desc'
+        flows = [
+            Flow('ok', 'http://a.com/shop/1', login_flow, kwargs={'url': 'http://a.com/shop/1'}),
+            Flow('heal', 'http://a.com/shop/2', login_flow, kwargs={'url': 'http://a.com/shop/2', 'broken': True}),
+            Flow('fail', 'http://b.com/blog/1', failing_flow, kwargs={'url': 'http://b.com/blog/1'}),
+        ]
+
+        report = FlowRunner(processes=0, contexts=2, pool_factory=FakePool).run(flows)
+
+        self.assertEqual([flow['name'] for flow in report['flows']], ['ok', 'heal', 'fail'])
+        summary = report['summary']
+        self.assertEqual((summary['ok'], summary['failed']), (2, 1))
+        self.assertEqual(summary['steps'], 4)
+        self.assertEqual(summary['heals'], 1)
+        self.assertEqual(report['flows'][1]['heals'], 1)
+        self.assertIn('RuntimeError', report['flows'][2]['error'])
+        self.assertEqual(summary['coordination']['leases'], 1)
+        self.assertEqual(summary['locality_groups'], 2)
+
+    @patch('chopperfix.chopper_decorators.adalFlow_Manger')
+    def test_processes_share_the_pattern_database(self, mock_manager):
+        mock_manager.generate_description.return_value = 'desc'
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        flows = [
+            Flow(str(i), url, login_flow, kwargs={'url': url})
+            for i, url in enumerate(['http://a.com/shop/1', 'http://b.com/blog/1', 'http://a.com/shop/2'])
+        ]
+
+        runner = FlowRunner(processes=2, contexts=2, pool_factory=FakePool,
+                            db_url=f"sqlite:///{os.path.join(tmp.name, 'patterns.db')}")
+        report = runner.run(flows)
+
+        summary = report['summary']
+        self.assertEqual(summary['ok'], 3)
+        self.assertEqual(summary['steps'], 6)
+        self.assertEqual(sorted(summary['worker_buckets']), [1, 2])
+        self.assertEqual(len(summary['workers']), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,183 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+from learning.pattern_storage import PatternStorage, Pattern
+from chopperfix.cli import build_parser, main
+from self_healing.candidates import find_local_replacement, generate_candidates, parse_fragment, parse_html, xpath_literal
+from self_healing.drift import element_fingerprint, fingerprint_drift
+from self_healing.fallbacks import FallbackPrecomputer, build_fallback_chain, first_matching_fallback
+from self_healing.offline import heal_inventory
+
+OLD_ELEMENT = '<input id="searchInput" name="search" type="search" placeholder="Search Wikipedia">'
+NEW_PAGE = (
+    "<html><body><form>"
+    "<input id='searchbox-v2' name='search' type='search' placeholder='Search Wikipedia'>"
+    "<input type='hidden' name='lang'>"
+    "</form><button>Read Wikipedia in your language</button></body></html>"
+)
+
+
+class CandidatesTest(unittest.TestCase):
+    def test_xpath_literal_handles_quotes(self):
+        self.assertEqual(xpath_literal("a"), "'a'")
+        self.assertEqual(xpath_literal("it's"), '"it\'s"')
+        self.assertEqual(xpath_literal("""a'b"c"""), """concat('a', "'", 'b"c')""")
+
+    def test_candidates_prefer_stable_attributes(self):
+        candidates = generate_candidates(parse_fragment(OLD_ELEMENT))
+        self.assertEqual(candidates[0], ("//input[@id='searchInput']", 'id'))
+        self.assertIn(("//input[@name='search']", 'name'), candidates)
+
+    def test_find_local_replacement_against_new_dom(self):
+        selector, strategy, score = find_local_replacement(parse_html(NEW_PAGE), OLD_ELEMENT)
+        self.assertEqual(selector, "//input[@name='search']")
+        self.assertEqual(strategy, 'name')
+        self.assertGreater(score, 0.5)
+
+
+RECORDED_PAGE = (
+    "<html><body><form id='search-form'>"
+    "<input id='searchInput' name='search' type='search' placeholder='Search Wikipedia'>"
+    "<button class='btn'>Go</button><button class='btn'>Cancel</button>"
+    "</form></body></html>"
+)
+
+
+class FallbackChainTest(unittest.TestCase):
+    def test_chain_is_verified_and_ranked_by_stability(self):
+        chain = build_fallback_chain(parse_html(RECORDED_PAGE), "//input[@id='searchInput']")
+        selectors = [item['selector'] for item in chain]
+        # El selector original no se repite y el id va antes que el texto o las clases
+        self.assertNotIn("//input[@id='searchInput']", selectors)
+        self.assertEqual(selectors[0], "//input[@name='search']")
+        self.assertEqual(chain, sorted(chain, key=lambda item: -item['score']))
+
+        button = build_fallback_chain(parse_html(RECORDED_PAGE), "//button[2]")
+        self.assertIn("//button[normalize-space()='Cancel']", [item['selector'] for item in button])
+        self.assertIn(('ancestor', "//form[@id='search-form']//button[normalize-space()='Cancel']"),
+                      [(item['strategy'], item['selector']) for item in button])
+        # Ningún candidato ambiguo: `//button[contains(@class, 'btn')]` coincide con dos
+        self.assertTrue(all(item['strategy'] != 'class' for item in button))
+
+    def test_precomputed_chain_heals_without_llm(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            storage = PatternStorage(f"sqlite:///{os.path.join(tmp, 'patterns.db')}")
+            storage.save_pattern('type', "//input[@id='searchInput']", 'https://www.wikipedia.org', 'd')
+            precomputer = FallbackPrecomputer(storage)
+            self.assertTrue(precomputer.submit('type', "//input[@id='searchInput']", 'https://www.wikipedia.org',
+                                               RECORDED_PAGE, element_html=OLD_ELEMENT))
+            precomputer.flush()
+            # El mismo elemento no se vuelve a calcular
+            self.assertFalse(precomputer.submit('type', "//input[@id='searchInput']", 'https://www.wikipedia.org',
+                                                RECORDED_PAGE, element_html=OLD_ELEMENT))
+            self.assertEqual(precomputer.stats()['stored'], 1)
+            precomputer.close()
+
+            fallbacks = storage.get_fallback_selectors('type', "//input[@id='searchInput']", 'https://www.wikipedia.org')
+            storage.close()
+        self.assertEqual(first_matching_fallback(NEW_PAGE, fallbacks), "//input[@name='search']")
+
+
+DRIFT_PAGES = [
+    "<html><body><form id='search'><input id='searchInput' name='search' data-testid='q'></form></body></html>",
+    # Cambia el texto de una página vecina: sin deriva en el elemento
+    "<html><body><p>Nuevo</p><form id='search'><input id='searchInput' name='search' data-testid='q'></form></body></html>",
+    # Rediseño en curso: el selector por name sigue funcionando, pero el id y el data-testid cambian
+    "<html><body><form id='search-v2'><input id='searchbox' name='search'></form></body></html>",
+]
+BROKEN_PAGE = "<html><body><form id='search-v2'><input id='searchbox' name='query'></form></body></html>"
+
+
+class DriftDetectionTest(unittest.TestCase):
+    def test_fingerprint_drift(self):
+        first, same, drifted = (
+            element_fingerprint(parse_html(page).xpath('//input')[0]) for page in DRIFT_PAGES
+        )
+        self.assertEqual(fingerprint_drift(first, same), 0.0)
+        self.assertGreater(fingerprint_drift(first, drifted), 0.35)
+        self.assertEqual(first['path'], ["form[@id=search]"])
+
+    def test_drift_precomputes_chain_before_the_selector_breaks(self):
+        url, selector = 'https://www.wikipedia.org', "//input[@name='search']"
+        with tempfile.TemporaryDirectory() as tmp:
+            storage = PatternStorage(f"sqlite:///{os.path.join(tmp, 'patterns.db')}")
+            storage.save_pattern('type', selector, url, 'd')
+            precomputer = FallbackPrecomputer(storage, chains=False, drift_threshold=0.35)
+            for page in DRIFT_PAGES[:2]:
+                precomputer.submit('type', selector, url, page)
+                precomputer.flush()
+            # Sin deriva no se calcula ninguna cadena
+            self.assertEqual(storage.get_fallback_selectors('type', selector, url), [])
+
+            precomputer.submit('type', selector, url, DRIFT_PAGES[2])
+            precomputer.flush()
+            precomputer.close()
+            self.assertEqual(precomputer.stats()['drifted'], 1)
+            fallbacks = storage.get_fallback_selectors('type', selector, url)
+            storage.close()
+        self.assertEqual(first_matching_fallback(BROKEN_PAGE, fallbacks), "//input[@id='searchbox']")
+
+
+class OfflineHealCommandTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_url = f"sqlite:///{os.path.join(self.tmp.name, 'patterns.db')}"
+        self.snapshots = os.path.join(self.tmp.name, 'snapshots')
+        os.mkdir(self.snapshots)
+        with open(os.path.join(self.snapshots, 'home.html'), 'w') as f:
+            f.write(NEW_PAGE)
+        with open(os.path.join(self.snapshots, 'manifest.json'), 'w') as f:
+            json.dump({'home.html': 'https://www.wikipedia.org/'}, f)
+
+        storage = PatternStorage(self.db_url)
+        storage.save_pattern('type', "//input[@id='searchInput']", 'https://www.wikipedia.org', 'd',
+                             full_element_html=OLD_ELEMENT)
+        storage.save_pattern('click', "//form", 'https://www.wikipedia.org', 'd')
+        storage.save_pattern('click', "//button[text()='Read Wikipedia in your language']",
+                             'https://www.wikipedia.org', 'd')
+        storage.close()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_heal_writes_replacements_and_report(self):
+        report_path = os.path.join(self.tmp.name, 'report.json')
+        exit_code = main(['heal', self.snapshots, '--db', self.db_url, '--no-llm',
+                          '--workers', '1', '--report', report_path])
+        self.assertEqual(exit_code, 0)
+
+        with open(report_path) as f:
+            summary = json.load(f)['summary']
+        # El predicado text() con comillas y espacios se evalúa tal como se grabó
+        self.assertEqual((summary['patterns'], summary['ok'], summary['healed']), (3, 2, 1))
+        self.assertEqual(summary['unresolved'], 0)
+
+        storage = PatternStorage(self.db_url)
+        healed = storage.session.query(Pattern).filter_by(action='type').one()
+        self.assertEqual(healed.replacement_selector, "//input[@name='search']")
+        self.assertTrue(healed.failed)
+        storage.close()
+
+    def test_llm_gets_the_recorded_selector(self):
+        storage = PatternStorage(self.db_url)
+        self.addCleanup(storage.close)
+        storage.save_pattern('click', "//a[text()='Sign in']", 'https://www.wikipedia.org', 'd')
+        manager = MagicMock()
+        manager.suggest_alternative_selector.return_value = '//button'
+
+        report = heal_inventory(storage, self.snapshots, workers=1, llm_manager=manager, dry_run=True)
+
+        manager.suggest_alternative_selector.assert_called_once()
+        self.assertEqual(manager.suggest_alternative_selector.call_args.args[1], "//a[text()='Sign in']")
+        self.assertEqual(report['summary']['llm_healed'], 1)
+
+    def test_db_defaults_to_the_configured_url(self):
+        with patch('chopperfix.cli.Config.PATTERN_DB_URL', self.db_url):
+            self.assertEqual(build_parser().parse_args(['export', 'out.jsonl']).db, self.db_url)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,161 @@
+import inspect
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+from chopperfix.chopper_decorators import chopperdoc
+from learning.pattern_cache import PatternCache
+from learning.pattern_storage import Pattern, PatternStorage
+from learning.sharded_storage import ShardedPatternStorage, open_pattern_storage, shard_locations
+
+
+class FakePage:
+    def __init__(self, url):
+        self.url = url
+
+    def content(self):
+        return "<html><body><button id='go-new'>Go</button></body></html>"
+
+
+class FakeDriver:
+    def __init__(self, url):
+        self.page = FakePage(url)
+
+
+@chopperdoc
+def step(driver, action, **kwargs):
+    if kwargs.get('xpath') == "//button[@id='go']":
+        raise Exception('no such element')
+    return 'ok'
+
+
+class ShardLocationsTest(unittest.TestCase):
+    def test_sqlite_files_postgres_schemas_and_templates(self):
+        self.assertEqual(
+            [url for url, _ in shard_locations('sqlite:///data/patterns.db', 2)],
+            ['sqlite:///data/patterns-0.db', 'sqlite:///data/patterns-1.db'],
+        )
+        self.assertEqual(
+            shard_locations('postgresql://u@h/db', 2),
+            [('postgresql://u@h/db', 'chopperfix_shard_0'), ('postgresql://u@h/db', 'chopperfix_shard_1')],
+        )
+        self.assertEqual(
+            [url for url, _ in shard_locations('sqlite:///p{shard}.db', 2)],
+            ['sqlite:///p0.db', 'sqlite:///p1.db'],
+        )
+
+
+class ShardedPatternStorageTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.tmp = tmp.name
+        self.storage = ShardedPatternStorage(f"sqlite:///{os.path.join(self.tmp, 'patterns.db')}", shards=4)
+        self.addCleanup(self.storage.close)
+        # Dominios que caen en particiones distintas
+        self.urls = {}
+        for number in range(50):
+            url = f"http://site{number}.com/item/1"
+            self.urls.setdefault(self.storage.shard_index(url), url)
+        self.assertEqual(len(self.urls), 4)
+
+    def test_each_domain_is_written_to_its_own_shard(self):
+        for index, url in self.urls.items():
+            self.storage.save_pattern('click', f"//a[@id='{index}']", url, 'desc')
+        self.storage.save_pattern('click', "//a[@id='www']", self.urls[0].replace('://', '://www.'), 'desc')
+
+        counts = [shard.session.query(Pattern).count() for shard in self.storage.shards]
+        self.assertEqual(counts[0], 2)
+        self.assertEqual(counts[1:], [1, 1, 1])
+        self.assertTrue(all(
+            os.path.exists(os.path.join(self.tmp, f'patterns-{index}.db')) for index in range(4)
+        ))
+        # Rutas distintas del mismo dominio siguen en la misma partición
+        self.assertIs(self.storage.storage_for(self.urls[2]),
+                      self.storage.storage_for(self.urls[2].replace('/item/1', '/cart')))
+
+    def test_routed_reads_and_cross_shard_queries(self):
+        records = [
+            dict(action='click', selector=f"//a[@id='{index}']", url=url, description='desc', success=False,
+                 replacement_selector=f"//a[@id='{index}-new']")
+            for index, url in self.urls.items()
+        ]
+        self.storage.save_patterns(records)
+
+        self.assertEqual(self.storage.get_stored_replacement('click', "//a[@id='3']", self.urls[3]),
+                         "//a[@id='3-new']")
+        active = list(self.storage.iter_active_patterns(chunk_size=1))
+        self.assertEqual([pattern.url for pattern in active], sorted(pattern.url for pattern in active))
+        self.assertEqual(len(self.storage.get_active_patterns()), 4)
+        self.assertEqual(len(self.storage.search_patterns("//a[@id='1']", include_failed=True)), 4)
+        self.assertEqual(self.storage.recompute_scores(), 4)
+        self.assertEqual(self.storage.get_version(), 4)
+        stats = self.storage.shard_stats()
+        self.assertEqual([row['patterns'] for row in stats], [1, 1, 1, 1])
+        self.assertEqual(sum(row['failed'] for row in stats), 4)
+
+        # Los ids se repiten entre particiones: la URL decide dónde se actualiza
+        self.assertEqual({pattern.id for pattern in active}, {1})
+        self.storage.bulk_update_replacements([{'id': 1, 'url': self.urls[2], 'replacement_selector': '//b'}])
+        self.assertEqual(self.storage.get_stored_replacement('click', "//a[@id='2']", self.urls[2]), '//b')
+        self.assertEqual(self.storage.get_stored_replacement('click', "//a[@id='1']", self.urls[1]),
+                         "//a[@id='1-new']")
+        with self.assertRaises(ValueError):
+            self.storage.bulk_update_replacements([{'id': 1, 'replacement_selector': '//b'}])
+
+    def test_export_import_round_trip_across_shards(self):
+        for index, url in self.urls.items():
+            self.storage.save_pattern('click', f"//a[@id='{index}']", url, 'desc')
+        path = os.path.join(self.tmp, 'patterns.jsonl')
+        self.assertEqual(self.storage.export_patterns(path), 4)
+
+        copy = ShardedPatternStorage(f"sqlite:///{os.path.join(self.tmp, 'copy.db')}", shards=4)
+        self.addCleanup(copy.close)
+        self.assertEqual(copy.import_patterns(path), {'inserted': 4, 'merged': 0})
+        self.assertEqual([row['patterns'] for row in copy.shard_stats()], [1, 1, 1, 1])
+
+    def test_pattern_cache_write_behind_spans_shards_without_invalidating(self):
+        cache = PatternCache(self.storage, write_behind=True, batch_size=100)
+        for index, url in self.urls.items():
+            cache.save_pattern('click', f"//a[@id='{index}']", url, 'desc')
+        cache.flush()
+
+        self.assertEqual(cache.stats()['invalidations'], 0)
+        self.assertIsNotNone(cache.get('click', "//a[@id='0']", self.urls[0]))
+        self.assertEqual(cache.stats()['hits'], 1)
+
+    def test_public_api_matches_pattern_storage(self):
+        for name, method in inspect.getmembers(PatternStorage, inspect.isfunction):
+            if name.startswith('_'):
+                continue
+            self.assertEqual(
+                inspect.signature(getattr(ShardedPatternStorage, name)), inspect.signature(method), name
+            )
+
+    @patch('chopperfix.chopper_decorators.Config.BATCH_HEALING', True)
+    @patch('chopperfix.chopper_decorators.adalFlow_Manger')
+    def test_chopperdoc_batch_healing_on_sharded_storage(self, mock_manager):
+        mock_manager.generate_description.return_value = 'desc'
+        mock_manager.suggest_alternative_selectors.return_value = {"//button[@id='go']": "//button[@id='go-new']"}
+        url = self.urls[1]
+
+        with patch('chopperfix.chopper_decorators.pattern_storage', self.storage):
+            self.assertEqual(step(FakeDriver(url), 'click', xpath="//button[@id='go']"), 'ok')
+
+        mock_manager.suggest_alternative_selectors.assert_called_once()
+        self.assertEqual(self.storage.get_stored_replacement('click', "//button[@id='go']", url),
+                         "//button[@id='go-new']")
+        self.assertEqual([row['patterns'] for row in self.storage.shard_stats()], [0, 2, 0, 0])
+
+    def test_single_shard_opens_plain_storage(self):
+        storage = open_pattern_storage('sqlite:///:memory:', shards=0)
+        self.addCleanup(storage.close)
+        self.assertNotIsInstance(storage, ShardedPatternStorage)
+        self.assertIs(storage.storage_for('http://example.com'), storage)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import multiprocessing
+import os
+import tempfile
+import unittest
+import zlib
+
+from learning.snapshot_store import SnapshotStore
+
+PAGE = "<html><body>" + "<div class='row'>item</div>" * 500 + "</body></html>"
+
+
+def write_pages(root, worker, count):
+    store = SnapshotStore(root, segment_bytes=2048)
+    for number in range(count):
+        store.put(f'example.com/{worker}/{number}', f"{PAGE}{worker}-{number}")
+        store.flush()
+    store.close()
+
+
+class SnapshotStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = os.path.join(self.tmp.name, 'archive')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_dedup_compression_and_reader(self):
+        store = SnapshotStore(self.root)
+        first = store.put('example.com/a', PAGE)
+        second = store.put('example.com/b', PAGE)
+        store.close()
+
+        self.assertEqual(first, second)
+        stats = store.stats()
+        self.assertEqual((stats['snapshots'], stats['urls']), (1, 2))
+        self.assertGreater(stats['compression_ratio'], 10)
+
+        reader = SnapshotStore(self.root, read_only=True)
+        self.assertEqual(reader.get(first), PAGE)
+        self.assertEqual(reader.get_latest('example.com/b'), PAGE)
+        self.assertIsNone(reader.get('missing'))
+        reader.close()
+
+    def test_size_and_age_bounds(self):
+        one_page = len(zlib.compress((PAGE + 'old').encode(), 6))
+        store = SnapshotStore(self.root, max_bytes=one_page + one_page // 2, segment_bytes=1)
+        old = store.put('example.com/old', PAGE + 'old')
+        store.flush()
+        new = store.put('example.com/new', PAGE + 'new')
+        store.close()
+        # Sólo cabe la instantánea más reciente y el segmento antiguo se borra
+        self.assertEqual(store.keys(), [new])
+        self.assertIsNone(store.get(old))
+        self.assertEqual(len([n for n in os.listdir(self.root) if n.endswith('.pack')]), 1)
+
+        aged = SnapshotStore(self.root, max_age_seconds=1e-9)
+        aged.put('example.com/other', PAGE + 'other')
+        aged.close()
+        self.assertEqual(aged.keys(), [])
+
+    def test_processes_share_the_archive(self):
+        workers = [multiprocessing.Process(target=write_pages, args=(self.root, worker, 15)) for worker in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual([worker.exitcode for worker in workers], [0] * 4)
+
+        reader = SnapshotStore(self.root, read_only=True)
+        self.addCleanup(reader.close)
+        self.assertEqual(len(reader.urls()), 60)
+        for worker in range(4):
+            for number in range(15):
+                self.assertEqual(reader.get_latest(f'example.com/{worker}/{number}'), f"{PAGE}{worker}-{number}")
+
+    def test_compaction_keeps_stale_readers_working(self):
+        store = SnapshotStore(self.root)
+        store.put('example.com/big', PAGE + os.urandom(4000).hex())
+        small = store.put('example.com/small', PAGE + 'small')
+        store.close()
+        reader = SnapshotStore(self.root, read_only=True)
+        self.addCleanup(reader.close)
+
+        store = SnapshotStore(self.root, max_bytes=1000)
+        store.put('example.com/tiny', PAGE + 'tiny')
+        store.close()
+
+        # Las entradas vivas se copiaron a un segmento nuevo; el lector relee el índice
+        self.assertEqual([n for n in os.listdir(self.root) if n.endswith('.pack')], ['segment-00001.pack'])
+        self.assertEqual(reader.get(small), PAGE + 'small')
+
+    def test_full_queue_drops_snapshots_instead_of_blocking(self):
+        store = SnapshotStore(self.root, max_pending=1)
+        with store._lock:
+            # Con el escritor bloqueado, la cola se llena enseguida
+            for number in range(5):
+                store.put(f'example.com/{number}', f"{PAGE}{number}")
+        store.close()
+        self.assertGreaterEqual(store.stats()['dropped'], 3)
+        self.assertEqual(store.stats()['snapshots'], 5 - store.stats()['dropped'])
+
+
+if __name__ == '__main__':
+    unittest.main()
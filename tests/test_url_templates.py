@@ -0,0 +1,101 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from learning.pattern_storage import PatternStorage
+from learning.url_templates import UrlTemplateInferrer
+
+
+class UrlTemplateInferrerTest(unittest.TestCase):
+    def test_ids_and_hashes_are_always_templated(self):
+        inferrer = UrlTemplateInferrer()
+        self.assertEqual(inferrer.template_for('shop.com/orders/12345'), 'shop.com/orders/{id}')
+        self.assertEqual(
+            inferrer.template_for('shop.com/c/0f8fad5b-d9cb-469f-a165-70867728950e/edit'),
+            'shop.com/c/{uuid}/edit',
+        )
+        self.assertEqual(inferrer.template_for('cdn.com/a/9f86d081884c7d65'), 'cdn.com/a/{hash}')
+        self.assertEqual(inferrer.template_for('example.com'), 'example.com')
+
+    def test_slugs_cluster_after_min_observations(self):
+        inferrer = UrlTemplateInferrer(min_cluster=2)
+        self.assertEqual(inferrer.observe('wikipedia.org/wiki/One_Piece'), [])
+        self.assertEqual(inferrer.template_for('wikipedia.org/wiki/One_Piece'), 'wikipedia.org/wiki/One_Piece')
+        promoted = inferrer.observe('wikipedia.org/wiki/Naruto')
+        self.assertEqual(sorted(promoted), ['wikipedia.org/wiki/Naruto', 'wikipedia.org/wiki/One_Piece'])
+        self.assertEqual(inferrer.template_for('wikipedia.org/wiki/Bleach'), 'wikipedia.org/wiki/{slug}')
+
+        # El primer segmento nunca se convierte en slug
+        inferrer.observe('example.com/about')
+        inferrer.observe('example.com/contact')
+        self.assertEqual(inferrer.template_for('example.com/about'), 'example.com/about')
+
+    def test_distinct_sections_are_not_merged(self):
+        inferrer = UrlTemplateInferrer()
+        for page in ('install', 'billing', 'faq'):
+            self.assertEqual(inferrer.observe(f'example.com/docs/{page}'), [])
+        self.assertEqual(inferrer.template_for('example.com/docs/billing'), 'example.com/docs/billing')
+
+        # Con muchas páginas del mismo tipo sí se infiere la plantilla
+        for page in ('pricing', 'security'):
+            inferrer.observe(f'example.com/docs/{page}')
+        self.assertEqual(inferrer.template_for('example.com/docs/billing'), 'example.com/docs/{slug}')
+
+    def test_registered_templates(self):
+        inferrer = UrlTemplateInferrer()
+        inferrer.register('example.com/{slug}/settings')
+        self.assertEqual(inferrer.template_for('example.com/team/settings'), 'example.com/{slug}/settings')
+
+
+class PatternStorageTemplateTest(unittest.TestCase):
+    def setUp(self):
+        self.storage = PatternStorage('sqlite:///:memory:')
+
+    def tearDown(self):
+        self.storage.close()
+
+    def test_heal_on_one_page_serves_the_template(self):
+        self.storage.save_pattern('click', "//a[@id='edit']", 'https://www.wikipedia.org/wiki/One_Piece', 'd',
+                                  success=False, replacement_selector="//a[@id='ca-edit']")
+        for page in ('Naruto', 'Bleach_(manga)', 'Dragon_Ball', 'Monster'):
+            self.storage.save_pattern('click', "//h1", f'https://wikipedia.org/wiki/{page}', 'd')
+
+        self.assertEqual(self.storage.url_template('https://wikipedia.org/wiki/Bleach'), 'wikipedia.org/wiki/{slug}')
+        self.assertEqual(
+            self.storage.get_stored_replacement('click', "//a[@id='edit']", 'https://wikipedia.org/wiki/Bleach'),
+            "//a[@id='ca-edit']",
+        )
+
+        # La URL exacta tiene prioridad sobre la plantilla
+        self.storage.save_pattern('click', "//a[@id='edit']", 'https://wikipedia.org/wiki/Bleach', 'd',
+                                  success=False, replacement_selector="//a[@id='bleach-edit']")
+        self.assertEqual(
+            self.storage.get_stored_replacement('click', "//a[@id='edit']", 'https://wikipedia.org/wiki/Bleach'),
+            "//a[@id='bleach-edit']",
+        )
+        self.assertEqual(len(self.storage.get_active_patterns('https://wikipedia.org/wiki/Bleach')), 2)
+
+
+class SchemaMigrationTest(unittest.TestCase):
+    def test_adds_missing_columns_to_existing_database(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'old.db')
+            connection = sqlite3.connect(path)
+            connection.execute(
+                "CREATE TABLE patterns (id INTEGER PRIMARY KEY, action VARCHAR NOT NULL, selector VARCHAR NOT NULL, "
+                "url VARCHAR NOT NULL, description TEXT, timestamp DATETIME, full_element_html TEXT, "
+                "parent_element TEXT, child_elements JSON, sibling_elements JSON, peso FLOAT, usage_count INTEGER, "
+                "success_rate FLOAT, active BOOLEAN, failed BOOLEAN, replacement_selector VARCHAR)"
+            )
+            connection.commit()
+            connection.close()
+
+            storage = PatternStorage(f'sqlite:///{path}')
+            storage.save_pattern('click', '//a', 'example.com/x/1', 'd')
+            self.assertEqual(storage.get_active_patterns()[0].url_template, 'example.com/x/{id}')
+            storage.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,9 +1,103 @@
 import os
+import tempfile
+
+
+def _env_flag(name, default=False):
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
 
 class Config:
     # Leer la API key de OpenAI desde las variables de entorno
     OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
 
+    # Seguimiento incremental del DOM: un MutationObserver anota los subárboles
+    # cambiados y sólo esos se vuelven a descargar y parsear en cada paso
+    DOM_TRACKING = _env_flag('CHOPPERFIX_DOM_TRACKING')
+
+    # Cotas del contexto estructural que se extrae, guarda y envía al LLM: hermanos
+    # más cercanos, hijos y elementos por fragmento (0 = sin cota). Lo omitido se resume
+    CONTEXT_MAX_SIBLINGS = int(os.getenv('CHOPPERFIX_CONTEXT_MAX_SIBLINGS', '10'))
+    CONTEXT_MAX_CHILDREN = int(os.getenv('CHOPPERFIX_CONTEXT_MAX_CHILDREN', '20'))
+    CONTEXT_MAX_NODES = int(os.getenv('CHOPPERFIX_CONTEXT_MAX_NODES', '200'))
+
+    # Selectores compilados que guarda en memoria `chopperfix.selector_registry`
+    SELECTOR_CACHE_SIZE = int(os.getenv('CHOPPERFIX_SELECTOR_CACHE_SIZE', '1024'))
+
+    # Páginas distintas con el mismo prefijo y resto de ruta que hacen falta para
+    # convertir un segmento de texto en `{slug}` (`learning.url_templates`)
+    URL_TEMPLATE_MIN_CLUSTER = int(os.getenv('CHOPPERFIX_URL_TEMPLATE_MIN_CLUSTER', '5'))
+
+    # Base de datos de patrones que usa `chopperdoc`
+    PATTERN_DB_URL = os.getenv('CHOPPERFIX_DB_URL', 'sqlite:///patterns.db')
+
+    # Particiones de la base de datos de patrones (0 = una sola) y clave de reparto:
+    # 'domain' o 'section' (dominio y primera sección de la ruta)
+    PATTERN_SHARDS = int(os.getenv('CHOPPERFIX_SHARDS', '0'))
+    PATTERN_SHARD_BY = os.getenv('CHOPPERFIX_SHARD_BY', 'domain').strip().lower()
+
+    # Fichero SQLite con las reservas de reparación compartidas entre workers
+    # (desactivado si no se indica; `chopperfix.runner` lo activa por su cuenta)
+    HEAL_COORDINATION_DB = os.getenv('CHOPPERFIX_HEAL_COORDINATION_DB')
+
+    # Sonda previa a la acción: si el selector no existe en la instantánea del DOM
+    # ni aparece durante el periodo de gracia, se pasa directamente al self-healing
+    # sin esperar el timeout del driver.
+    PROBE_ENABLED = _env_flag('CHOPPERFIX_PROBE')
+    PROBE_GRACE_MS = int(os.getenv('CHOPPERFIX_PROBE_GRACE_MS', '250'))
+
+    # Curación en lote: al fallar un selector se reparan todos los de la misma URL
+    BATCH_HEALING = _env_flag('CHOPPERFIX_BATCH_HEAL')
+
+    # Cadenas de selectores de respaldo calculadas en segundo plano al grabar cada
+    # acción; al fallar se prueba la siguiente que coincida con el DOM, sin LLM
+    FALLBACK_CHAINS = _env_flag('CHOPPERFIX_FALLBACK_CHAINS')
+    FALLBACK_CHAIN_LENGTH = int(os.getenv('CHOPPERFIX_FALLBACK_CHAIN_LENGTH', '6'))
+
+    # Detección de deriva: si la huella del elemento cambia más que el umbral (0-1)
+    # respecto a la de referencia, se recalcula su cadena de respaldo antes de que se rompa
+    DRIFT_DETECTION = _env_flag('CHOPPERFIX_DRIFT_DETECTION')
+    DRIFT_THRESHOLD = float(os.getenv('CHOPPERFIX_DRIFT_THRESHOLD', '0.35'))
+
+    # Caché de patrones en memoria: '' (desactivada), 'write-through' o 'write-behind'
+    PATTERN_CACHE = os.getenv('CHOPPERFIX_PATTERN_CACHE', '').strip().lower()
+    PATTERN_CACHE_SIZE = int(os.getenv('CHOPPERFIX_PATTERN_CACHE_SIZE', '2000'))
+
+    # Archivo de instantáneas HTML (desactivado si no se indica directorio)
+    SNAPSHOT_DIR = os.getenv('CHOPPERFIX_SNAPSHOT_DIR')
+    SNAPSHOT_MAX_MB = int(os.getenv('CHOPPERFIX_SNAPSHOT_MAX_MB', '512'))
+    SNAPSHOT_MAX_AGE_DAYS = float(os.getenv('CHOPPERFIX_SNAPSHOT_MAX_AGE_DAYS', '30'))
+    # Instantáneas pendientes de escribir; si la cola se llena se descartan
+    SNAPSHOT_QUEUE_SIZE = int(os.getenv('CHOPPERFIX_SNAPSHOT_QUEUE_SIZE', '256'))
+
+    # Puntuación con decaimiento: vida media de la evidencia y recálculo periódico (0 = desactivado)
+    SCORE_HALF_LIFE_DAYS = float(os.getenv('CHOPPERFIX_SCORE_HALF_LIFE_DAYS', '14'))
+    SCORE_RECOMPUTE_SECONDS = float(os.getenv('CHOPPERFIX_SCORE_RECOMPUTE_SECONDS', '0'))
+
+    # Enrutado de modelos: nivel barato para descripciones y análisis, escalado al
+    # nivel fuerte sólo si la reparación barata no coincide con el DOM
+    LLM_ROUTING = _env_flag('CHOPPERFIX_LLM_ROUTING')
+    LLM_CHEAP_MODEL = os.getenv('CHOPPERFIX_LLM_CHEAP_MODEL', 'gpt-4o-mini')
+    LLM_STRONG_MODEL = os.getenv('CHOPPERFIX_LLM_STRONG_MODEL', 'gpt-4o')
+    LLM_TOKEN_BUDGET = int(os.getenv('CHOPPERFIX_LLM_TOKEN_BUDGET', '0'))
+    LLM_LATENCY_BUDGET_SECONDS = float(os.getenv('CHOPPERFIX_LLM_LATENCY_BUDGET_SECONDS', '0'))
+
+    # Backend LLM ('langchain' o 'adalflow') y URL de un endpoint compatible con OpenAI
+    # (p. ej. el simulador local de `chopperfix llm-standin` para pruebas de carga)
+    LLM_BACKEND = os.getenv('CHOPPERFIX_LLM_BACKEND', 'langchain')
+    LLM_BASE_URL = os.getenv('CHOPPERFIX_LLM_BASE_URL')
+
+    # Respuestas del LLM en streaming, cortadas en cuanto llega un selector que coincide con el DOM
+    LLM_STREAMING = _env_flag('CHOPPERFIX_LLM_STREAM')
+
+    # Cuota compartida con el proveedor del LLM (0 = sin límite) y reintentos con backoff
+    RATE_LIMIT_RPM = int(os.getenv('CHOPPERFIX_RATE_LIMIT_RPM', '0'))
+    RATE_LIMIT_TPM = int(os.getenv('CHOPPERFIX_RATE_LIMIT_TPM', '0'))
+    RATE_LIMIT_DB = os.getenv('CHOPPERFIX_RATE_LIMIT_DB', os.path.join(tempfile.gettempdir(), 'chopperfix-ratelimit.db'))
+    LLM_MAX_RETRIES = int(os.getenv('CHOPPERFIX_LLM_MAX_RETRIES', '5'))
+
     @staticmethod
     def validate_config():
         if not Config.OPENAI_API_KEY: